@@ -4,7 +4,9 @@ from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from app.api.deps import db_session, get_current_user
+from app.models.protein import Protein
 from app.models.user import User
+from app.services import governor, ligand_cache, map_store, pose_store, receptor_cache
 from app.services.settings import get_setting, set_setting
 from app.services.settings_provider import settings_provider
 
@@ -37,3 +39,58 @@ def set_settings(item: SettingIn, db: Session = Depends(db_session), current_use
     # refresh provider cache for this key
     settings_provider.reload(keys=[item.key])
     return {"key": row.key, "value": row.value}
+
+
+@router.get("/cache/receptors")
+def receptor_cache_info(current_user: User = Depends(get_current_user)):
+    return receptor_cache.cache_info()
+
+
+@router.delete("/cache/receptors")
+def invalidate_receptor_cache(
+    protein_id: Optional[int] = None,
+    db: Session = Depends(db_session),
+    current_user: User = Depends(get_current_user),
+):
+    # Without protein_id, every cached receptor is dropped
+    if protein_id is None:
+        return {"removed": receptor_cache.invalidate()}
+    prot = db.query(Protein).filter(Protein.id == protein_id).first()
+    if not prot:
+        raise HTTPException(status_code=404, detail="Protein not found")
+    return {"removed": receptor_cache.invalidate(prot.path)}
+
+
+@router.get("/cache/ligands")
+def ligand_cache_info(current_user: User = Depends(get_current_user)):
+    return ligand_cache.cache_info()
+
+
+@router.delete("/cache/ligands")
+def invalidate_ligand_cache(smiles: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    return {"removed": ligand_cache.invalidate(smiles)}
+
+
+@router.get("/cache/maps")
+def affinity_map_cache_info(current_user: User = Depends(get_current_user)):
+    return map_store.cache_info()
+
+
+@router.delete("/cache/maps")
+def invalidate_affinity_map_cache(current_user: User = Depends(get_current_user)):
+    return {"removed": map_store.invalidate()}
+
+
+@router.get("/poses")
+def pose_store_info(current_user: User = Depends(get_current_user)):
+    return pose_store.store_info()
+
+
+@router.post("/poses/gc")
+def pose_store_gc(dry_run: bool = False, current_user: User = Depends(get_current_user)):
+    return pose_store.gc(dry_run=dry_run)
+
+
+@router.get("/governor")
+def docking_governor_status(current_user: User = Depends(get_current_user)):
+    return governor.status()
@@ -1,6 +1,11 @@
-from typing import Optional, Tuple
+import asyncio
+import functools
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
@@ -10,14 +15,21 @@ from app.models.dock_job import DockJob
 from app.models.molecule import Molecule as MoleculeModel
 from app.models.protein import Protein as ProteinModel
 from app.schemas.dock_job import DockJobCreate, DockJobOut
-from app.services.vina import dock_smiles_against_protein
+from app.services.receptor_cache import get_or_prepare_receptor
+from app.services.vina import RESCORING_FUNCTIONS, dock_smiles_against_protein, dock_smiles_batch_against_protein, rescore
 from app.services.queue import get_queue
 from app.services.tasks import task_run_docking
-from app.services.export import pdbqt_to_sdf_bytes
+from app.services.export import content_etag, pose_sdf_bytes
+from app.services.pose_contacts import DEFAULT_CUTOFF, pose_contacts
+from app.services.pose_index import list_poses, read_pose_model
+from app.services.pose_store import is_packed, pose_exists, read_pose
+from app.services.procrunner import ProcessCancelled, ProcessTimeout
 from fastapi.responses import FileResponse, Response
 import os
 from app.services.celery_app import get_celery
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 
@@ -29,36 +41,153 @@ class DockRequest(BaseModel):
 
 
 @router.post("/run", response_model=DockJobOut)
-def run_docking(
+async def run_docking(
     req: DockRequest,
+    request: Request,
     db: Session = Depends(db_session),
     current_user: User = Depends(get_current_user),
 ):
-    # Fetch inputs
-    mol = db.query(MoleculeModel).filter(MoleculeModel.id == req.molecule_id).first()
-    prot = db.query(ProteinModel).filter(ProteinModel.id == req.protein_id).first()
+    # Sync DB work stays off the event loop (SQLite writes can block on the file lock)
+    def _fetch() -> Tuple[Optional[MoleculeModel], Optional[ProteinModel]]:
+        return (
+            db.query(MoleculeModel).filter(MoleculeModel.id == req.molecule_id).first(),
+            db.query(ProteinModel).filter(ProteinModel.id == req.protein_id).first(),
+        )
+
+    mol, prot = await run_in_threadpool(_fetch)
     if mol is None or prot is None:
-        from fastapi import HTTPException
         raise HTTPException(status_code=404, detail="Molecule or Protein not found")
 
-    # Run Vina docking (CPU) and store pose
+    # Run Vina docking (CPU) in a worker thread; kill it if the client goes away
+    cancel = threading.Event()
+    loop = asyncio.get_running_loop()
+    fut = loop.run_in_executor(
+        None,
+        functools.partial(
+            dock_smiles_against_protein, mol.smiles, prot.path, center=req.center, size=req.size, cancel_event=cancel
+        ),
+    )
+    while not fut.done():
+        await asyncio.wait({fut}, timeout=1.0)
+        if not fut.done() and await request.is_disconnected():
+            cancel.set()
+            break
     try:
-        pose_path, score = dock_smiles_against_protein(mol.smiles, prot.path, center=req.center, size=req.size)
+        pose_path, score = await fut
+    except ProcessCancelled:
+        logger.info("Docking of molecule %s cancelled: client disconnected", req.molecule_id)
+        raise HTTPException(status_code=408, detail="Docking cancelled: client disconnected")
+    except ProcessTimeout as e:
+        raise HTTPException(status_code=504, detail=f"Docking timed out: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Docking failed: {e}")
 
-    job = DockJob(
-        protein_id=req.protein_id,
-        molecule_id=req.molecule_id,
-        user_id=current_user.id,
-        status="completed",
-        score=score,
-        pose_path=pose_path,
-    )
-    db.add(job)
+    def _store() -> DockJob:
+        job = DockJob(
+            protein_id=req.protein_id,
+            molecule_id=req.molecule_id,
+            user_id=current_user.id,
+            status="completed",
+            score=score,
+            pose_path=pose_path,
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    return await run_in_threadpool(_store)
+
+
+class BatchDockRequest(BaseModel):
+    protein_id: int
+    molecule_ids: List[int]
+    center: Optional[Tuple[float, float, float]] = None
+    size: Optional[Tuple[float, float, float]] = None
+
+
+@router.post("/batch", response_model=List[DockJobOut])
+def run_docking_batch(
+    req: BatchDockRequest,
+    db: Session = Depends(db_session),
+    current_user: User = Depends(get_current_user),
+):
+    prot = db.query(ProteinModel).filter(ProteinModel.id == req.protein_id).first()
+    if prot is None:
+        raise HTTPException(status_code=404, detail="Protein not found")
+    mols = db.query(MoleculeModel).filter(MoleculeModel.id.in_(req.molecule_ids)).all()
+    by_id = {m.id: m for m in mols}
+    missing = [mid for mid in req.molecule_ids if mid not in by_id]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Molecules not found: {missing}")
+    ordered = [by_id[mid] for mid in req.molecule_ids]
+
+    # One Vina process docks every ligand in a chunk against the shared receptor grid
+    try:
+        docked = dock_smiles_batch_against_protein([m.smiles for m in ordered], prot.path, center=req.center, size=req.size)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Docking failed: {e}")
+
+    jobs: List[DockJob] = []
+    for m, res in zip(ordered, docked):
+        job = DockJob(
+            protein_id=req.protein_id,
+            molecule_id=m.id,
+            user_id=current_user.id,
+            status="completed" if "score" in res else "failed",
+            score=res.get("score"),
+            pose_path=res.get("pose_path"),
+        )
+        db.add(job)
+        jobs.append(job)
     db.commit()
-    db.refresh(job)
-    return job
+    for job in jobs:
+        db.refresh(job)
+    return jobs
+
+
+class RescoreRequest(BaseModel):
+    job_ids: List[int]
+    scoring: List[str] = ["vina", "vinardo"]
+    mode: str = "score_only"  # or "local_only"
+    model: int = 1
+
+
+@router.post("/rescore")
+def rescore_poses(
+    req: RescoreRequest,
+    db: Session = Depends(db_session),
+    current_user: User = Depends(get_current_user),
+):
+    bad = [sf for sf in req.scoring if sf not in RESCORING_FUNCTIONS]
+    if bad or not req.scoring:
+        raise HTTPException(status_code=400, detail=f"scoring must be a subset of {list(RESCORING_FUNCTIONS)}")
+    if req.mode not in ("score_only", "local_only"):
+        raise HTTPException(status_code=400, detail="mode must be score_only or local_only")
+    jobs = db.query(DockJob).filter(DockJob.id.in_(req.job_ids), DockJob.user_id == current_user.id).all()
+    by_id = {j.id: j for j in jobs if j.pose_path}
+    missing = [jid for jid in req.job_ids if jid not in by_id]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Jobs without poses: {missing}")
+
+    # Rescore per receptor; each receptor is prepared (or fetched from cache) once
+    by_protein: Dict[int, Dict[int, str]] = {}
+    for j in by_id.values():
+        by_protein.setdefault(j.protein_id, {})[j.id] = j.pose_path
+    scored: Dict[int, Dict[str, Any]] = {}
+    for protein_id, poses in by_protein.items():
+        prot = db.query(ProteinModel).filter(ProteinModel.id == protein_id).first()
+        if prot is None:
+            raise HTTPException(status_code=404, detail="Protein not found")
+        try:
+            receptor = get_or_prepare_receptor(os.path.abspath(prot.path))
+            scored.update(rescore(receptor, poses, scorings=req.scoring, mode=req.mode, model=req.model))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Rescoring failed: {e}")
+    return [
+        {"job_id": jid, "molecule_id": by_id[jid].molecule_id, "dock_score": by_id[jid].score, **scored[jid]}
+        for jid in req.job_ids
+    ]
 
 
 @router.post("/enqueue_celery", response_model=DockJobOut)
@@ -112,30 +241,101 @@ def enqueue_docking(
     return job
 
 
+@router.get("/poses/{job_id}")
+def list_job_poses(
+    job_id: int,
+    db: Session = Depends(db_session),
+    current_user: User = Depends(get_current_user),
+):
+    job = db.query(DockJob).filter(DockJob.id == job_id, DockJob.user_id == current_user.id).first()
+    if not job or not job.pose_path:
+        raise HTTPException(status_code=404, detail="Pose not found")
+    return [
+        {"model": m.model, "affinity": m.affinity, "rmsd_lb": m.rmsd_lb, "rmsd_ub": m.rmsd_ub}
+        for m in list_poses(job.pose_path)
+    ]
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
 @router.get("/pose/{job_id}")
 def download_pose(
     job_id: int,
+    request: Request,
     format: str = "pdbqt",
+    model: Optional[int] = None,
     db: Session = Depends(db_session),
     current_user: User = Depends(get_current_user),
 ):
     job = db.query(DockJob).filter(DockJob.id == job_id, DockJob.user_id == current_user.id).first()
     if not job or not job.pose_path:
         raise HTTPException(status_code=404, detail="Pose not found")
-    pose_abs = os.path.abspath(job.pose_path)
-    if format == "pdbqt":
-        if not os.path.exists(pose_abs):
-            raise HTTPException(status_code=404, detail="Pose file missing")
+    if format not in ("pdbqt", "sdf"):
+        raise HTTPException(status_code=400, detail="Unsupported format; use pdbqt or sdf")
+    if not pose_exists(job.pose_path):
+        raise HTTPException(status_code=404, detail="Pose file missing")
+
+    if format == "pdbqt" and model is None and not is_packed(job.pose_path):
+        pose_abs = os.path.abspath(job.pose_path)
         return FileResponse(pose_abs, media_type="chemical/x-pdbqt", filename=os.path.basename(pose_abs))
-    elif format == "sdf":
-        data = pdbqt_to_sdf_bytes(pose_abs)
-        if data is None:
-            raise HTTPException(status_code=500, detail="Failed to convert pose to SDF (requires OpenBabel)")
-        return Response(content=data, media_type="chemical/x-mdl-sdfile", headers={
-            "Content-Disposition": f"attachment; filename=pose_{job_id}.sdf"
-        })
+
+    if model is not None:
+        # Just this model's byte range, located via the pose table
+        pdbqt = read_pose_model(job.pose_path, model)
+        if pdbqt is None:
+            raise HTTPException(status_code=404, detail=f"Model {model} not found")
+        variant, filename = f"m{model}", f"pose_{job_id}_model{model}"
     else:
-        raise HTTPException(status_code=400, detail="Unsupported format; use pdbqt or sdf")
+        pdbqt = read_pose(job.pose_path)
+        if pdbqt is None:
+            raise HTTPException(status_code=404, detail="Pose file missing")
+        variant, filename = "all", f"pose_{job_id}"
+
+    etag = content_etag(pdbqt, f"{format}:{variant}")
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if format == "pdbqt":
+        return Response(content=pdbqt, media_type="chemical/x-pdbqt", headers={
+            **headers, "Content-Disposition": f"attachment; filename={filename}.pdbqt"
+        })
+    data = pose_sdf_bytes(job.pose_path, pdbqt, etag, variant)
+    if data is None:
+        raise HTTPException(status_code=500, detail="Failed to convert pose to SDF (requires Meeko or OpenBabel)")
+    return Response(content=data, media_type="chemical/x-mdl-sdfile", headers={
+        **headers, "Content-Disposition": f"attachment; filename={filename}.sdf"
+    })
+
+
+@router.get("/pose/{job_id}/contacts")
+def get_pose_contacts(
+    job_id: int,
+    model: int = 1,
+    cutoff: float = DEFAULT_CUTOFF,
+    db: Session = Depends(db_session),
+    current_user: User = Depends(get_current_user),
+):
+    job = db.query(DockJob).filter(DockJob.id == job_id, DockJob.user_id == current_user.id).first()
+    if not job or not job.pose_path:
+        raise HTTPException(status_code=404, detail="Pose not found")
+    if not 0.0 < cutoff <= 10.0:
+        raise HTTPException(status_code=400, detail="cutoff must be in (0, 10] A")
+    prot = db.query(ProteinModel).filter(ProteinModel.id == job.protein_id).first()
+    if not prot:
+        raise HTTPException(status_code=404, detail="Protein not found")
+    pdbqt = read_pose_model(job.pose_path, model)
+    if pdbqt is None:
+        raise HTTPException(status_code=404, detail=f"Model {model} not found")
+    try:
+        contacts = pose_contacts(prot.path, pdbqt, cutoff)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Contact analysis failed: {e}")
+    return {"job_id": job_id, "model": model, "cutoff": cutoff, "contacts": contacts}
 
 
 @router.get("/job/{job_id}", response_model=DockJobOut)
@@ -148,3 +348,18 @@ def get_job_status(
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     return job
+
+
+@router.delete("/job/{job_id}")
+def delete_job(
+    job_id: int,
+    db: Session = Depends(db_session),
+    current_user: User = Depends(get_current_user),
+):
+    # The pose itself is reclaimed by pose store GC once nothing references it
+    job = db.query(DockJob).filter(DockJob.id == job_id, DockJob.user_id == current_user.id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    db.delete(job)
+    db.commit()
+    return {"deleted": job_id}
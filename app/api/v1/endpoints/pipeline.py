@@ -10,8 +10,9 @@ from app.api.deps import db_session, get_current_user
 from app.models.user import User
 from app.models.pipeline_job import PipelineJob
 from app.models.protein import Protein
-from app.schemas.pipeline import PipelineJobOut, PipelineRunRequest
-from app.services.pipeline_orchestrator import run_pipeline_sync
+from app.schemas.pipeline import PipelineJobOut, PipelineRunRequest, SelectivityPanelRequest
+from app.services import checkpoints, progress
+from app.services.pipeline_orchestrator import run_pipeline_sync, run_selectivity_panel_sync
 
 router = APIRouter()
 
@@ -37,15 +38,94 @@ def run_pipeline(
         status="queued",
         progress=0.0,
         message="Queued",
-        strategy="pocket_provided" if req.pocket else None,
+        strategy="funnel" if req.funnel else ("pocket_provided" if req.pocket else None),
     )
     db.add(job)
     db.commit()
     db.refresh(job)
+    # Queued jobs belong to this process until their BackgroundTask starts
+    checkpoints.claim(db, job.id)
 
     # Fire-and-forget background execution (synchronous pipeline for now)
-    background_tasks.add_task(run_pipeline_sync, job.id, req.max_molecules, req.pocket)
+    funnel = req.funnel.model_dump() if req.funnel else None
+    background_tasks.add_task(
+        run_pipeline_sync, job.id, req.max_molecules, req.pocket, funnel, incremental=req.incremental
+    )
+
+    return job
+
+
+@router.post("/selectivity", response_model=PipelineJobOut)
+def run_selectivity_panel(
+    req: SelectivityPanelRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(db_session),
+    current_user: User = Depends(get_current_user),
+):
+    owned = {
+        p.id
+        for p in db.query(Protein).filter(Protein.id.in_(req.protein_ids), Protein.uploader_id == current_user.id).all()
+    }
+    missing = [pid for pid in req.protein_ids if pid not in owned]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Proteins not found: {missing}")
+
+    job = PipelineJob(
+        user_id=current_user.id,
+        protein_id=req.protein_ids[0],
+        status="queued",
+        progress=0.0,
+        message="Queued",
+        strategy="selectivity_panel",
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    # Queued jobs belong to this process until their BackgroundTask starts
+    checkpoints.claim(db, job.id)
+
+    background_tasks.add_task(
+        run_selectivity_panel_sync, job.id, list(dict.fromkeys(req.protein_ids)), req.molecule_ids, req.max_molecules
+    )
+    return job
+
+
+@router.post("/resume/{job_id}", response_model=PipelineJobOut)
+def resume_job(
+    job_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(db_session),
+    current_user: User = Depends(get_current_user),
+):
+    job = (
+        db.query(PipelineJob)
+        .filter(PipelineJob.id == job_id, PipelineJob.user_id == current_user.id)
+        .first()
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status not in checkpoints.RESUMABLE_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}; only interrupted or failed jobs can be resumed")
+    params = checkpoints.load(db, job.id, "params")
+    if params is None:
+        raise HTTPException(status_code=409, detail="Job has no checkpoint to resume from")
+
+    job.status = "queued"
+    job.message = "Queued for resume"
+    db.commit()
+    db.refresh(job)
+    checkpoints.claim(db, job.id)
 
+    # Finished stages and molecules are reused from the job's checkpoints
+    if job.strategy == "selectivity_panel":
+        background_tasks.add_task(
+            run_selectivity_panel_sync, job.id, params["protein_ids"], params.get("molecule_ids"), params["max_molecules"]
+        )
+    else:
+        background_tasks.add_task(
+            run_pipeline_sync, job.id, params["max_molecules"], params.get("pocket"), params.get("funnel"),
+            incremental=bool(params.get("incremental")), resume=True,
+        )
     return job
 
 
@@ -80,12 +160,27 @@ async def stream_job_status(
         raise HTTPException(status_code=404, detail="Job not found")
 
     async def event_generator():
+        snapshot, queue = progress.subscribe(job_id)
+        try:
+            if snapshot is not None:
+                # Running in this process: ticks arrive straight from the ProgressReporter
+                while True:
+                    payload = PipelineJobOut.model_validate(snapshot).model_dump(mode="json")
+                    yield f"data: {json.dumps(payload, default=str)}\n\n"
+                    if snapshot.get("status") in ("completed", "failed", "interrupted"):
+                        return
+                    snapshot = await queue.get()
+                    # Coalesce a burst of ticks into the latest one
+                    while not queue.empty():
+                        snapshot = queue.get_nowait()
+        finally:
+            progress.unsubscribe(job_id, queue)
         while True:
             db.refresh(job)
             payload = PipelineJobOut.model_validate(job).model_dump(mode="json")
             # Ensure all fields (e.g., datetime) are JSON-serializable
             yield f"data: {json.dumps(payload, default=str)}\n\n"
-            if job.status in ("completed", "failed"):
+            if job.status in ("completed", "failed", "interrupted"):
                 break
             await asyncio.sleep(2)
 
@@ -47,6 +47,13 @@ class Pocket(BaseModel):
     size: tuple[float, float, float]
     method: str
     note: str | None = None
+    # Ranked detectors (fpocket, grid) also report these
+    volume: float | None = None
+    score: float | None = None
+    rank: int | None = None
+    druggability: float | None = None
+    alpha_spheres: int | None = None
+    descriptors: dict[str, float] | None = None
 
 
 @router.get("/{protein_id}/pockets", response_model=List[Pocket])
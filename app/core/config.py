@@ -23,10 +23,53 @@ class Settings(BaseSettings):
 
     # External tools / docking (optional; can also come from DB settings)
     VINA_PATH: Optional[str] = None
+    VINA_BACKEND: Optional[str] = None  # exe (default) | python (in-process `vina` bindings)
+    VINA_ENGINE_POOL: Optional[str] = None  # max in-process engines kept per process, over all receptors/boxes
     OBABEL_PATH: Optional[str] = None
+    FPOCKET_PATH: Optional[str] = None
+    FPOCKET_TIMEOUT_S: Optional[str] = None  # default 600; pocket results are cached per protein
     VINA_EXHAUSTIVENESS: Optional[str] = None
     VINA_CENTER: Optional[str] = None
     VINA_SIZE: Optional[str] = None
+    VINA_BATCH_SIZE: Optional[str] = None  # max ligands per `vina --batch` process; single-box docks are chunked over DOCK_MAX_PROCS
+    VINA_SCORING: Optional[str] = None  # vina (default) | vinardo
+    VINA_USE_MAPS: Optional[str] = None  # reuse --write_maps grids per receptor/box (default on)
+    AFFINITY_MAPS_MAX_MB: Optional[str] = None
+    VINA_SEED: Optional[str] = None  # fixed --seed so runs are reproducible/memoisable
+    DOCK_MEMO: Optional[str] = None  # reuse stored results for identical runs (default on)
+
+    # Parallel docking: DOCK_MAX_PROCS Vina processes x VINA_CPU threads each
+    VINA_CPU: Optional[str] = None
+    DOCK_CPU_BUDGET: Optional[str] = None  # also the node-wide slot count leased by the docking governor
+    DOCK_GOVERNOR: Optional[str] = None  # "0" disables node-wide admission control
+    DOCK_MAX_PROCS: Optional[str] = None
+    DOCK_PREP_WORKERS: Optional[str] = None
+    DOCK_TIMEOUT_S: Optional[str] = None  # per-ligand Vina wall clock, default 1800; <= 0 disables
+    OBABEL_TIMEOUT_S: Optional[str] = None
+
+    # Docking box sizing: larger regions are split into overlapping sub-boxes
+    VINA_MAX_BOX_VOLUME: Optional[str] = None  # cubic Angstrom, default 27000
+    VINA_MAX_SUBBOXES: Optional[str] = None
+
+    # Receptor preparation (cached per protein content + options)
+    RECEPTOR_REMOVE_WATERS: Optional[str] = None
+    RECEPTOR_ADD_HYDROGENS: Optional[str] = None
+    RECEPTOR_PH: Optional[str] = None
+
+    # Ligand 3D preparation cache (keyed by canonical SMILES + embed params)
+    LIGAND_EMBED_SEED: Optional[str] = None
+    LIGAND_CACHE_MAX_ENTRIES: Optional[str] = None
+
+    # Parsed protein structures kept in memory per process (also cached on disk as .npz)
+    STRUCTURE_CACHE_MAX_ENTRIES: Optional[str] = None
+
+    # Pipeline progress is written to the job row at most this often (ms)
+    PROGRESS_FLUSH_MS: Optional[str] = None
+
+    # Pose storage: "files" (loose files in storage/poses) or "pack" (compressed shard packs;
+    # zstd when the optional zstandard package is installed, otherwise gzip)
+    POSE_STORE: Optional[str] = None
+    POSE_PACK_MAX_MB: Optional[str] = None  # roll over to a new pack file past this size, default 512
 
     class Config:
         env_file = ".env"
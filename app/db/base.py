@@ -9,3 +9,7 @@ from app.models.dock_job import DockJob  # noqa: F401
 from app.models.admet import AdmetResult  # noqa: F401
 from app.models.pipeline_job import PipelineJob  # noqa: F401
 from app.models.setting import Setting  # noqa: F401
+from app.models.dock_result import DockResult  # noqa: F401
+from app.models.dock_pose import DockPose  # noqa: F401
+from app.models.pose_blob import PoseBlob  # noqa: F401
+from app.models.pipeline_checkpoint import PipelineCheckpoint  # noqa: F401
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, Float, Index, UniqueConstraint
+from app.db.base_class import Base
+
+
+class DockPose(Base):
+    """One MODEL of a Vina output file, with its byte span for direct slicing."""
+
+    __tablename__ = "dock_poses"
+    __table_args__ = (
+        UniqueConstraint("pose_path", "model", name="uq_dock_poses_path_model"),
+        Index("ix_dock_poses_path_affinity", "pose_path", "affinity"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    pose_path = Column(String(512), nullable=False, index=True)
+    model = Column(Integer, nullable=False)
+    affinity = Column(Float, nullable=True)
+    rmsd_lb = Column(Float, nullable=True)
+    rmsd_ub = Column(Float, nullable=True)
+    offset = Column(Integer, nullable=False)
+    length = Column(Integer, nullable=False)
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, func
+from app.db.base_class import Base
+
+
+class DockResult(Base):
+    """Memoised docking outcome for a fully specified, seeded Vina run."""
+
+    __tablename__ = "dock_results"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), unique=True, index=True, nullable=False)
+    receptor_hash = Column(String(64), index=True, nullable=False)
+    ligand = Column(String(1024), nullable=False)  # canonical SMILES
+    center = Column(String(64), nullable=False)
+    size = Column(String(64), nullable=False)
+    exhaustiveness = Column(Integer, nullable=False)
+    scoring = Column(String(16), nullable=False)
+    seed = Column(Integer, nullable=False)
+    vina_version = Column(String(64), nullable=False)
+    score = Column(Float, nullable=False)
+    pose_path = Column(String(512), nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Index, func
+from app.db.base_class import Base
+
+
+class PipelineCheckpoint(Base):
+    """Durable progress of a pipeline job: one row per finished stage, or per molecule within a stage."""
+
+    __tablename__ = "pipeline_checkpoints"
+    __table_args__ = (Index("ix_pipeline_checkpoints_job_stage", "job_id", "stage", "molecule_id"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("pipeline_jobs.id"), nullable=False)
+    stage = Column(String(32), nullable=False)
+    molecule_id = Column(Integer, nullable=True)  # NULL for stage-level checkpoints
+    data = Column(Text, nullable=True)  # JSON payload
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
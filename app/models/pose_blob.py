@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, DateTime, func
+from app.db.base_class import Base
+
+
+class PoseBlob(Base):
+    """Location of a compressed pose or log record inside a pose pack file."""
+
+    __tablename__ = "pose_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String(255), unique=True, index=True, nullable=False)  # original file name
+    kind = Column(String(8), nullable=False)  # "pose", "log" or "derived"
+    parent = Column(String(255), nullable=True, index=True)  # pose key a log/derived file belongs to
+    pack = Column(String(64), nullable=False, index=True)  # pack file name
+    offset = Column(Integer, nullable=False)  # start of the record header
+    length = Column(Integer, nullable=False)  # compressed payload bytes
+    raw_length = Column(Integer, nullable=False)
+    codec = Column(String(8), nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class PipelineJobOut(BaseModel):
@@ -20,7 +20,27 @@ class PipelineJobOut(BaseModel):
         from_attributes = True
 
 
+class FunnelConfig(BaseModel):
+    # Coarse pass docks every candidate cheaply; only the best re-dock at full exhaustiveness
+    coarse_exhaustiveness: int = Field(default=2, ge=1, le=64)
+    top_fraction: float = Field(default=0.2, gt=0.0, le=1.0)
+    min_keep: int = Field(default=1, ge=0)
+    score_threshold: Optional[float] = None
+    seed_from_coarse: bool = False
+
+
 class PipelineRunRequest(BaseModel):
     protein_id: int
     max_molecules: int = 10
     pocket: Optional[Dict[str, Any]] = None
+    funnel: Optional[FunnelConfig] = None
+    # Reuse stored docking results for this protein, pocket and parameters; only new
+    # molecules are docked (funnel runs reuse per-stage results through the memo instead)
+    incremental: bool = False
+
+
+class SelectivityPanelRequest(BaseModel):
+    # First protein is the target, the rest are anti-targets
+    protein_ids: List[int] = Field(min_length=1)
+    molecule_ids: Optional[List[int]] = None
+    max_molecules: int = 10
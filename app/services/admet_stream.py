@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import heapq
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.services.admet_service import predict_admet_for_smiles
+
+_STOP = object()
+
+
+class TopKAdmetStream:
+    """
+    Streaming ADMET stage behind docking. Docked molecules are ``offer``-ed as they
+    finish; a heap keeps the k best (lowest) scores, and a molecule is queued for
+    ADMET the moment it enters the top-k. Workers skip molecules that dropped out
+    of the top-k while queued, so prediction overlaps with docking and is only
+    spent on candidates that can still make the final cut. The queue is bounded
+    (k entries), so a slow ADMET stage holds docking results back rather than
+    buffering them without limit.
+
+    ``offer``, ``drain`` and ``finish`` are meant to be called from one thread (the
+    docking callback); predictions run on ``workers`` background threads. ``done``
+    seeds results already known (e.g. from checkpoints) so they are not predicted
+    again.
+    """
+
+    def __init__(
+        self,
+        k: int,
+        predict: Callable[[str], Dict[str, Any]] = predict_admet_for_smiles,
+        done: Optional[Dict[int, Dict[str, Any]]] = None,
+        workers: int = 1,
+    ) -> None:
+        self.k = max(1, k)
+        self._predict = predict
+        # Max-heap by score via negation: the root is the weakest member of the top-k
+        self._heap: List[Tuple[float, int]] = []
+        self._members: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        # molecule id -> {"admet": ...} or {"admet_error": ...}
+        self._results: Dict[int, Dict[str, Any]] = {mid: {"admet": res} for mid, res in (done or {}).items()}
+        # Predicted since the last drain()
+        self._fresh: List[int] = []
+        self.predicted = 0
+        self.skipped = 0
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=self.k)
+        self._finished = False
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(max(1, workers))]
+        for t in self._threads:
+            t.start()
+
+    def offer(self, entry: Dict[str, Any]) -> bool:
+        """Consider a docked molecule ({"molecule_id", "smiles", "score", ...}); True if it entered the top-k."""
+        mid = entry["molecule_id"]
+        with self._lock:
+            item = (-float(entry["score"]), mid)
+            if len(self._heap) < self.k:
+                heapq.heappush(self._heap, item)
+            elif item > self._heap[0]:
+                _, dropped = heapq.heapreplace(self._heap, item)
+                self._members.pop(dropped, None)
+            else:
+                return False
+            self._members[mid] = entry
+            queued = mid not in self._results
+        if queued:
+            self._queue.put(mid)
+        return True
+
+    def _work(self) -> None:
+        while True:
+            mid = self._queue.get()
+            if mid is _STOP:
+                return
+            with self._lock:
+                entry = self._members.get(mid)
+                if entry is None or mid in self._results:
+                    # Dropped out of the top-k while queued
+                    self.skipped += 1
+                    continue
+            try:
+                out: Dict[str, Any] = {"admet": self._predict(entry["smiles"])}
+            except Exception as e:
+                out = {"admet_error": str(e)}
+            with self._lock:
+                self._results[mid] = out
+                self._fresh.append(mid)
+                self.predicted += 1
+
+    def drain(self) -> Dict[int, Dict[str, Any]]:
+        """Predictions completed since the last call, so the caller can persist them as they land."""
+        with self._lock:
+            fresh, self._fresh = self._fresh, []
+            return {mid: self._results[mid] for mid in fresh}
+
+    def finish(self) -> Dict[int, Dict[str, Any]]:
+        """
+        Wait for outstanding predictions and stop the workers (safe to call twice).
+        Returns molecule id -> {"admet": ...} or {"admet_error": ...} for the final top-k.
+        """
+        if not self._finished:
+            self._finished = True
+            for _ in self._threads:
+                self._queue.put(_STOP)
+            for t in self._threads:
+                t.join()
+        with self._lock:
+            return {mid: self._results[mid] for mid in self._members if mid in self._results}
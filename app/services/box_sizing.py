@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import logging
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from rdkit import Chem
+
+from app.services.settings_provider import settings_provider
+from app.services.structure_cache import load_structure
+
+logger = logging.getLogger(__name__)
+
+Vec3 = Tuple[float, float, float]
+
+# Box edge that maximises Vina accuracy for a ligand is ~2.857 x its radius of gyration
+# (Feinstein & Brylinski, J Cheminform 2015).
+RG_EDGE_FACTOR = 2.857
+MIN_EDGE = 12.0
+# A of through-space distance per bond of topological distance; fitted so the
+# estimate tracks (and slightly exceeds) the Rg of an embedded conformer
+_TOPO_BOND_LENGTH = 1.1
+DEFAULT_MAX_VOLUME = 27000.0  # 30 A cube, Vina's recommended upper bound
+DEFAULT_MAX_SUBBOXES = 27
+
+
+def _float_setting(key: str, default: float) -> float:
+    try:
+        return float(settings_provider.resolve(key, str(default)))  # type: ignore[arg-type]
+    except Exception:
+        return default
+
+
+def pdbqt_lines_coordinates(lines: Iterable[str], heavy_only: bool = True) -> np.ndarray:
+    """Atom coordinates of the first model in PDBQT lines."""
+    coords: List[Tuple[float, float, float]] = []
+    for line in lines:
+        if line.startswith("ENDMDL"):
+            break
+        if not line.startswith(("ATOM", "HETATM")):
+            continue
+        atom_type = line[77:79].strip()
+        if heavy_only and atom_type in ("H", "HD", "HS"):
+            continue
+        try:
+            coords.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+        except ValueError:
+            continue
+    return np.asarray(coords, dtype=float).reshape(-1, 3)
+
+
+def pdbqt_coordinates(pdbqt_path: str, heavy_only: bool = True) -> np.ndarray:
+    with open(pdbqt_path, "r", encoding="utf-8", errors="ignore") as f:
+        return pdbqt_lines_coordinates(f, heavy_only)
+
+
+def radius_of_gyration(coords: np.ndarray) -> float:
+    if coords.size == 0:
+        return 0.0
+    centered = coords - coords.mean(axis=0)
+    return float(np.sqrt((centered ** 2).sum(axis=1).mean()))
+
+
+def ligand_radius_of_gyration(pdbqt_path: str) -> float:
+    return radius_of_gyration(pdbqt_coordinates(pdbqt_path))
+
+
+def smiles_radius_of_gyration(smiles: str) -> Optional[float]:
+    """
+    Heavy-atom Rg estimated from the molecular graph, without embedding: pairwise
+    topological distances scaled by _TOPO_BOND_LENGTH. Within ~10% of a 3D
+    conformer's Rg for drug-like molecules, and cheap enough to size boxes before
+    any ligand is prepared. None for unparsable SMILES.
+    """
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None or mol.GetNumAtoms() == 0:
+        return None
+    d = Chem.GetDistanceMatrix(mol) * _TOPO_BOND_LENGTH
+    n = d.shape[0]
+    # Rg^2 = sum over pairs of d_ij^2 / n^2 (every pair counted twice in the matrix)
+    return float(np.sqrt((d ** 2).sum() / (2.0 * n * n)))
+
+
+def ligand_box_edge(rg: Optional[float]) -> float:
+    if not rg:
+        return MIN_EDGE
+    return max(MIN_EDGE, RG_EDGE_FACTOR * rg)
+
+
+def _axis_tiles(extent: float, tile: float, overlap: float) -> List[Tuple[float, float]]:
+    """Split [0, extent] into equal overlapping tiles no longer than `tile`; returns (offset, length)."""
+    if extent <= tile:
+        return [(extent / 2.0, extent)]
+    n = math.ceil((extent - overlap) / (tile - overlap))
+    length = (extent + (n - 1) * overlap) / n
+    step = length - overlap
+    return [(i * step + length / 2.0, length) for i in range(n)]
+
+
+def fit_boxes(
+    center: Iterable[float],
+    size: Iterable[float],
+    ligand_rg: Optional[float] = None,
+    max_volume: Optional[float] = None,
+    max_boxes: Optional[int] = None,
+    protein_file_rel: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Size docking boxes for a pocket region.
+
+    Each axis is at least the ligand-derived edge (so the ligand can rotate freely).
+    If the resulting volume exceeds ``max_volume`` the region is split into overlapping
+    sub-boxes (overlap = half the ligand edge, so no binding mode straddles a seam
+    unseen). With ``protein_file_rel``, sub-boxes that touch no protein residue
+    (pure solvent, or only waters and other HETATM groups) are dropped. Returns dicts with "center", "size" and "volume".
+    """
+    c = np.asarray(list(center), dtype=float)
+    s = np.asarray(list(size), dtype=float)
+    max_volume = max_volume or _float_setting("VINA_MAX_BOX_VOLUME", DEFAULT_MAX_VOLUME)
+    # A cap below one would never be met however large the tiles grow
+    max_boxes = max(1, max_boxes or int(_float_setting("VINA_MAX_SUBBOXES", DEFAULT_MAX_SUBBOXES)))
+    edge = ligand_box_edge(ligand_rg)
+    s = np.maximum(s, edge)
+
+    if float(np.prod(s)) <= max_volume:
+        return [{"center": tuple(float(v) for v in c), "size": tuple(float(v) for v in s), "volume": float(np.prod(s))}]
+
+    overlap = edge / 2.0
+    # Rounded so the default 27000 A^3 gives 30 A tiles, not 29.999...
+    tile = max(edge + 1.0, round(max_volume ** (1.0 / 3.0), 6))
+    while True:
+        axes = [_axis_tiles(float(extent), tile, overlap) for extent in s]
+        if len(axes[0]) * len(axes[1]) * len(axes[2]) <= max_boxes:
+            break
+        # Too many sub-boxes: accept larger tiles rather than an unbounded job count
+        tile *= 1.1
+
+    tile_volume = axes[0][0][1] * axes[1][0][1] * axes[2][0][1]
+    if tile_volume > max_volume:
+        logger.warning(
+            "VINA_MAX_SUBBOXES=%d forces %.0f A^3 sub-boxes, above VINA_MAX_BOX_VOLUME=%.0f, for a %.0fx%.0fx%.0f region",
+            max_boxes, tile_volume, max_volume, *s,
+        )
+
+    origin = c - s / 2.0
+    boxes: List[Dict[str, Any]] = []
+    for ox, lx in axes[0]:
+        for oy, ly in axes[1]:
+            for oz, lz in axes[2]:
+                bc = (float(origin[0] + ox), float(origin[1] + oy), float(origin[2] + oz))
+                boxes.append({"center": bc, "size": (lx, ly, lz), "volume": lx * ly * lz})
+    if protein_file_rel is not None:
+        try:
+            structure = load_structure(protein_file_rel)
+            touching = [
+                b for b in boxes
+                if (~structure.residue_het[structure.residues_in_box(b["center"], b["size"])]).any()
+            ]
+            boxes = touching or boxes
+        except Exception:
+            # Without a readable structure every tile is docked
+            pass
+    return boxes
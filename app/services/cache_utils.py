@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import uuid
+from contextlib import contextmanager
+from threading import Lock
+from typing import BinaryIO, Dict, Iterator, Tuple
+
+try:  # POSIX
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+    import msvcrt
+
+from app.core.config import settings
+
+CACHE_DIR = os.path.join(settings.STORAGE_DIR, "cache")
+
+_DIGEST_CACHE: Dict[str, Tuple[int, int, str]] = {}
+_DIGEST_LOCK = Lock()
+
+
+def file_sha256(path: str) -> str:
+    """
+    Hex SHA-256 of a file's contents.
+    Digests are memoised per (path, size, mtime) so repeated calls on an unchanged
+    protein file do not re-read it.
+    """
+    abs_path = os.path.abspath(path)
+    st = os.stat(abs_path)
+    with _DIGEST_LOCK:
+        hit = _DIGEST_CACHE.get(abs_path)
+        if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+            return hit[2]
+    h = hashlib.sha256()
+    with open(abs_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _DIGEST_LOCK:
+        _DIGEST_CACHE[abs_path] = (st.st_size, st.st_mtime_ns, digest)
+    return digest
+
+
+def options_digest(*parts: object) -> str:
+    raw = "|".join("" if p is None else str(p) for p in parts)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def temp_path_for(final_path: str) -> str:
+    # Keep the extension so tools that infer formats from it (obabel) still work
+    d, name = os.path.split(final_path)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(d, f".{stem}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp{ext}")
+
+
+def atomic_write_bytes(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = temp_path_for(path)
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+def atomic_write_text(path: str, text: str) -> None:
+    atomic_write_bytes(path, text.encode("utf-8"))
+
+
+def lock_fd(f: BinaryIO, blocking: bool = True) -> bool:
+    """Take an exclusive advisory lock on an open file; returns False if ``blocking`` is off and it is held elsewhere."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+    except OSError:
+        if blocking:
+            raise
+        return False
+    return True
+
+
+def unlock_fd(f: BinaryIO) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """Exclusive advisory lock on ``path``, held across processes for the duration of the block."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a+b") as f:
+        lock_fd(f)
+        try:
+            yield
+        finally:
+            unlock_fd(f)
+
+
+class CacheStats:
+    """Thread-safe hit/miss counters for a cache."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
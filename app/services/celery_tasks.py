@@ -7,9 +7,12 @@ from app.services.tasks import task_run_docking, task_run_admet
 _app = get_celery()
 
 if _app:
-    @_app.task(name="druggenix.run_docking")
-    def run_docking(dock_job_id: int) -> None:
-        task_run_docking(dock_job_id)
+    @_app.task(name="druggenix.run_docking", bind=True)
+    def run_docking(self, dock_job_id: int) -> None:
+        def _report(frac: float) -> None:
+            self.update_state(state="PROGRESS", meta={"dock_job_id": dock_job_id, "progress": round(frac, 3)})
+
+        task_run_docking(dock_job_id, on_progress=_report)
 
     @_app.task(name="druggenix.run_admet")
     def run_admet(molecule_id: int, user_id: int) -> Optional[int]:
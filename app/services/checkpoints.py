@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.pipeline_checkpoint import PipelineCheckpoint
+from app.models.pipeline_job import PipelineJob
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+RESUMABLE_STATUSES = ("interrupted", "failed")
+# Identifies this process's lifetime; a restarted server (even one that gets the
+# same PID, as PID 1 in a container does) never shares it
+BOOT_ID = uuid.uuid4().hex
+
+
+def _row(db: Session, job_id: int, stage: str, molecule_id: Optional[int]) -> Optional[PipelineCheckpoint]:
+    q = db.query(PipelineCheckpoint).filter(PipelineCheckpoint.job_id == job_id, PipelineCheckpoint.stage == stage)
+    if molecule_id is None:
+        q = q.filter(PipelineCheckpoint.molecule_id.is_(None))
+    else:
+        q = q.filter(PipelineCheckpoint.molecule_id == molecule_id)
+    return q.first()
+
+
+def save(db: Session, job_id: int, stage: str, data: Any = None, molecule_id: Optional[int] = None) -> None:
+    """Record (or overwrite) a checkpoint and commit, so it survives a crash right after."""
+    row = _row(db, job_id, stage, molecule_id)
+    if row is None:
+        row = PipelineCheckpoint(job_id=job_id, stage=stage, molecule_id=molecule_id)
+        db.add(row)
+    row.data = json.dumps(data, default=str)
+    row.updated_at = datetime.utcnow()
+    db.commit()
+
+
+def load(db: Session, job_id: int, stage: str) -> Optional[Any]:
+    row = _row(db, job_id, stage, None)
+    return json.loads(row.data) if row is not None and row.data is not None else None
+
+
+def load_molecules(db: Session, job_id: int, stage: str) -> Dict[int, Any]:
+    rows = (
+        db.query(PipelineCheckpoint)
+        .filter(
+            PipelineCheckpoint.job_id == job_id,
+            PipelineCheckpoint.stage == stage,
+            PipelineCheckpoint.molecule_id.isnot(None),
+        )
+        .all()
+    )
+    return {int(r.molecule_id): json.loads(r.data) if r.data else None for r in rows}
+
+
+def clear(db: Session, job_id: int) -> None:
+    db.query(PipelineCheckpoint).filter(PipelineCheckpoint.job_id == job_id).delete(synchronize_session=False)
+    db.commit()
+
+
+def _start_ticks(pid: int) -> Optional[str]:
+    """Process start time (clock ticks since boot) from /proc; None where unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Field 22; the command name (field 2) may itself contain spaces or parentheses
+    fields = stat.rsplit(")", 1)[-1].split()
+    return fields[19] if len(fields) > 19 else None
+
+
+def claim(db: Session, job_id: int) -> None:
+    """Mark this process as the job's owner, for orphan detection after a restart."""
+    save(
+        db, job_id, "owner",
+        {"boot": BOOT_ID, "host": socket.gethostname(), "pid": os.getpid(), "started": _start_ticks(os.getpid())},
+    )
+
+
+def _is_orphaned(db: Session, job: PipelineJob) -> bool:
+    """
+    Jobs run as BackgroundTasks of the process that queued them, so a job whose
+    owner token is not this process's is orphaned, unless it belongs to a sibling
+    worker on this host that is still alive (same PID and same start time).
+    """
+    owner = load(db, job.id, "owner")
+    if owner is None:
+        # Queued before owners were recorded, or died before claiming
+        return True
+    if owner.get("boot") == BOOT_ID:
+        return False
+    started = owner.get("started")
+    if owner.get("host") == socket.gethostname() and started is not None:
+        return _start_ticks(int(owner.get("pid", 0))) != started
+    return True
+
+
+def recover_orphaned_jobs() -> List[int]:
+    """
+    Startup pass: pipeline jobs left queued/running by a process that no longer exists
+    are marked "interrupted" so they can be resumed instead of spinning forever.
+    """
+    db = SessionLocal()
+    recovered: List[int] = []
+    try:
+        for job in db.query(PipelineJob).filter(PipelineJob.status.in_(ACTIVE_STATUSES)).all():
+            if _is_orphaned(db, job):
+                job.status = "interrupted"
+                job.message = "Interrupted by a restart; resume to continue from the last checkpoint"
+                recovered.append(job.id)
+        db.commit()
+    except Exception:
+        logger.exception("Pipeline recovery pass failed")
+    finally:
+        db.close()
+    if recovered:
+        logger.warning("Marked orphaned pipeline jobs as interrupted: %s", recovered)
+    return recovered
@@ -0,0 +1,337 @@
+from __future__ import annotations
+
+import logging
+import math
+import multiprocessing
+import os
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.services import dock_memo
+from app.services.cache_utils import file_sha256
+from app.services.ligand_cache import default_seed, get_or_prepare_ligand
+from app.services.settings_provider import settings_provider
+from app.services.vina import (
+    dock_prepared_ligand,
+    dock_smiles_batch_against_protein,
+    docking_context,
+    docking_run_fields,
+    vina_batch_size,
+    vina_timeout,
+)
+
+logger = logging.getLogger(__name__)
+
+Box = Tuple[Optional[Tuple[float, float, float]], Optional[Tuple[float, float, float]]]
+ResultCallback = Callable[[Hashable, Dict[str, Any], int, int], None]
+# (target, ligand key, result, done, total) for matrix runs
+CellCallback = Callable[[Hashable, Hashable, Dict[str, Any], int, int], None]
+
+
+def _int_setting(key: str, default: int) -> int:
+    try:
+        return int(settings_provider.resolve(key, str(default)))  # type: ignore[arg-type]
+    except Exception:
+        return default
+
+
+class DockingExecutor:
+    """
+    Runs many Vina jobs concurrently within a CPU budget of
+    ``max_procs`` processes x ``cpu_per_proc`` Vina threads.
+
+    Ligand preparation (RDKit embedding + Meeko) runs in a process pool and each
+    ligand is handed to the docking pool as soon as it is ready, so embedding and
+    Vina search overlap. Results are reported as they complete.
+    """
+
+    def __init__(
+        self,
+        max_procs: Optional[int] = None,
+        cpu_per_proc: Optional[int] = None,
+        prep_workers: Optional[int] = None,
+        timeout_s: Optional[float] = None,
+    ) -> None:
+        cores = os.cpu_count() or 1
+        self.cpu_per_proc = max(1, cpu_per_proc or _int_setting("VINA_CPU", 1))
+        budget = max(1, _int_setting("DOCK_CPU_BUDGET", cores))
+        self.max_procs = max(1, max_procs or _int_setting("DOCK_MAX_PROCS", max(1, budget // self.cpu_per_proc)))
+        self.prep_workers = max(1, prep_workers or _int_setting("DOCK_PREP_WORKERS", min(4, cores)))
+        self.timeout_s = timeout_s if timeout_s is not None else vina_timeout()
+
+    def _prep_pool(self, n_jobs: int) -> Executor:
+        workers = min(self.prep_workers, n_jobs)
+        # Daemonic workers (e.g. Celery prefork) may not start child processes
+        if workers > 1 and not multiprocessing.current_process().daemon:
+            try:
+                return ProcessPoolExecutor(max_workers=workers)
+            except Exception as e:
+                logger.info("Process pool unavailable for ligand prep (%s); using threads", e)
+        return ThreadPoolExecutor(max_workers=workers)
+
+    def prepare_ligands(self, items: List[Tuple[Hashable, str]]) -> Dict[Hashable, str]:
+        """Prepare (key, smiles) ligands through the cache in the prep pool; failures are omitted."""
+        out: Dict[Hashable, str] = {}
+        if not items:
+            return out
+        seed = default_seed()
+        pool = self._prep_pool(len(items))
+        try:
+            futs = {pool.submit(get_or_prepare_ligand, smi, seed): key for key, smi in items}
+            for fut in as_completed(futs):
+                try:
+                    out[futs[fut]] = fut.result()
+                except Exception:
+                    continue
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+        return out
+
+    def dock_smiles(
+        self,
+        items: List[Tuple[Hashable, str]],
+        protein_file_rel: str,
+        center: Optional[Tuple[float, float, float]] = None,
+        size: Optional[Tuple[float, float, float]] = None,
+        exhaustiveness: Optional[str] = None,
+        on_result: Optional[ResultCallback] = None,
+        ligand_paths: Optional[Dict[Hashable, str]] = None,
+    ) -> Dict[Hashable, Dict[str, Any]]:
+        """
+        Dock (key, smiles) pairs. Returns key -> {"pose_path", "score"} or {"error"}.
+        ``on_result(key, result, done, total)`` is called as each job finishes.
+        ``ligand_paths`` supplies ready ligand PDBQTs (e.g. a previous pose) for some
+        keys; those skip preparation and are memoised separately from SMILES-prepared runs.
+        """
+        return self.dock_smiles_boxes(
+            items, protein_file_rel, [(center, size)], exhaustiveness=exhaustiveness,
+            on_result=on_result, ligand_paths=ligand_paths,
+        )
+
+    def dock_smiles_boxes(
+        self,
+        items: List[Tuple[Hashable, str]],
+        protein_file_rel: str,
+        boxes: List[Box],
+        exhaustiveness: Optional[str] = None,
+        on_result: Optional[ResultCallback] = None,
+        ligand_paths: Optional[Dict[Hashable, str]] = None,
+    ) -> Dict[Hashable, Dict[str, Any]]:
+        """
+        Dock every ligand into every box, all (ligand, box) jobs sharing the pool.
+        A ligand's result is its best score over the boxes; "box_index" names the box.
+
+        A single box of SMILES-prepared ligands is docked in `vina --batch` chunks
+        (at most VINA_BATCH_SIZE, spread over ``max_procs`` workers) so each process
+        computes the grid once per chunk. Ligands in a chunk are prepared by its
+        worker before the chunk docks, trading prep/dock overlap for fewer grid setups.
+        """
+        ligand_paths = ligand_paths or {}
+        total = len(items)
+        results: Dict[Hashable, Dict[str, Any]] = {}
+        if not items or not boxes:
+            return results
+
+        def _finish(key: Hashable, res: Dict[str, Any]) -> None:
+            results[key] = res
+            if on_result is not None:
+                on_result(key, res, len(results), total)
+
+        if len(boxes) == 1 and not ligand_paths:
+            center, size = boxes[0]
+            chunk_size = min(vina_batch_size(), math.ceil(total / self.max_procs))
+            chunks = [items[i:i + chunk_size] for i in range(0, total, chunk_size)]
+
+            def _dock_chunk(chunk: List[Tuple[Hashable, str]]) -> List[Dict[str, Any]]:
+                return dock_smiles_batch_against_protein(
+                    [smi for _, smi in chunk], protein_file_rel, center=center, size=size,
+                    exhaustiveness=exhaustiveness, cpu=self.cpu_per_proc,
+                )
+
+            with ThreadPoolExecutor(max_workers=min(self.max_procs, len(chunks))) as pool:
+                futs = {pool.submit(_dock_chunk, chunk): chunk for chunk in chunks}
+                for fut in as_completed(futs):
+                    chunk = futs[fut]
+                    try:
+                        docked = fut.result()
+                    except Exception as e:
+                        docked = [{"error": str(e)} for _ in chunk]
+                    for (key, _), res in zip(chunk, docked):
+                        _finish(key, {**res, "box_index": 0} if "score" in res else res)
+            return results
+
+        def _on_cell(_target: Hashable, key: Hashable, res: Dict[str, Any], done: int, n: int) -> None:
+            if on_result is not None:
+                on_result(key, res, done, n)
+
+        matrix = self.dock_matrix(
+            items, [(None, protein_file_rel, boxes)], exhaustiveness=exhaustiveness,
+            on_result=_on_cell, ligand_paths=ligand_paths,
+        )
+        return matrix[None]
+
+    def stored_results(
+        self,
+        items: List[Tuple[Hashable, str]],
+        protein_file_rel: str,
+        boxes: List[Box],
+        exhaustiveness: Optional[str] = None,
+    ) -> Dict[Hashable, Dict[str, Any]]:
+        """
+        Results already in the docking memo for ligands docked with these exact
+        parameters into every one of ``boxes``, shaped like ``dock_smiles_boxes``
+        results. Reads the memo even when DOCK_MEMO is off; nothing is docked.
+        """
+        ctxs = [docking_context(protein_file_rel, c, sz) for c, sz in boxes]
+        keys: Dict[Hashable, List[str]] = {}
+        for key, smi in items:
+            try:
+                keys[key] = [str(docking_run_fields(ctx, smi, exhaustiveness)["cache_key"]) for ctx in ctxs]
+            except Exception:
+                continue
+        hits = dock_memo.lookup_many(k for ks in keys.values() for k in ks)
+        found: Dict[Hashable, Dict[str, Any]] = {}
+        for key, ks in keys.items():
+            if ks and all(k in hits for k in ks):
+                bi = min(range(len(ks)), key=lambda i: hits[ks[i]][1])
+                pose_path, score = hits[ks[bi]]
+                found[key] = {"pose_path": pose_path, "score": score, "box_index": bi, "cached": True}
+        return found
+
+    def dock_matrix(
+        self,
+        items: List[Tuple[Hashable, str]],
+        targets: List[Tuple[Hashable, str, List[Box]]],
+        exhaustiveness: Optional[str] = None,
+        on_result: Optional[CellCallback] = None,
+        ligand_paths: Optional[Dict[Hashable, str]] = None,
+    ) -> Dict[Hashable, Dict[Hashable, Dict[str, Any]]]:
+        """
+        Dock every ligand against every (target key, protein path, boxes) target.
+        Each ligand is prepared once and each receptor once; all (target, ligand, box)
+        jobs share the pool. Returns target -> ligand -> best result over that target's
+        boxes. ``on_result(target, key, result, done, total)`` fires per finished cell.
+        """
+        ligand_paths = ligand_paths or {}
+        results: Dict[Hashable, Dict[Hashable, Dict[str, Any]]] = {t: {} for t, _, _ in targets}
+        total = len(items) * len(targets)
+        done_cells = 0
+        if not items or not targets:
+            return results
+
+        # Per (target, ligand) cell: outstanding box count, best result so far, last error
+        Cell = Tuple[Hashable, Hashable]
+        remaining: Dict[Cell, int] = {}
+        best: Dict[Cell, Dict[str, Any]] = {}
+        errors: Dict[Cell, str] = {}
+
+        def _finish(cell: Cell, res: Dict[str, Any]) -> None:
+            nonlocal done_cells
+            results[cell[0]][cell[1]] = res
+            done_cells += 1
+            if on_result is not None:
+                on_result(cell[0], cell[1], res, done_cells, total)
+
+        def _box_done(cell: Cell, box_idx: int, res: Dict[str, Any]) -> None:
+            if "score" in res:
+                if cell not in best or res["score"] < best[cell]["score"]:
+                    best[cell] = {**res, "box_index": box_idx}
+            else:
+                errors[cell] = res.get("error", "Docking failed")
+            remaining[cell] -= 1
+            if remaining[cell] == 0:
+                _finish(cell, best.get(cell) or {"error": errors.get(cell, "Docking failed")})
+
+        # Receptors are prepared (and maps computed) once per target box here
+        ctxs: Dict[Hashable, List[Dict[str, Any]]] = {}
+        for target, protein_file_rel, boxes in targets:
+            try:
+                ctxs[target] = [docking_context(protein_file_rel, c, sz) for c, sz in boxes]
+            except Exception as e:
+                for key, _ in items:
+                    _finish((target, key), {"error": f"Receptor preparation failed: {e}"})
+        use_memo = dock_memo.memo_enabled()
+        # ligand key -> [(target, box index, run fields)] still needing a dock
+        pending: Dict[Hashable, List[Tuple[Hashable, int, Dict[str, object]]]] = {}
+        smiles_of: Dict[Hashable, str] = {}
+        cell_runs: List[Tuple[Cell, int, Dict[str, object]]] = []
+        for key, smi in items:
+            smiles_of[key] = smi
+            try:
+                variant = f"input:{file_sha256(ligand_paths[key])}" if key in ligand_paths else ""
+            except Exception as e:
+                for target in ctxs:
+                    _finish((target, key), {"error": str(e)})
+                continue
+            for target, tctxs in ctxs.items():
+                cell = (target, key)
+                remaining[cell] = len(tctxs)
+                try:
+                    runs = [(bi, docking_run_fields(ctx, smi, exhaustiveness, variant)) for bi, ctx in enumerate(tctxs)]
+                except Exception as e:
+                    remaining[cell] = 0
+                    _finish(cell, {"error": str(e)})
+                    continue
+                cell_runs.extend((cell, bi, fields) for bi, fields in runs)
+        # One memo query for the whole matrix rather than one per cell
+        hits = dock_memo.lookup_many(str(f["cache_key"]) for _, _, f in cell_runs) if use_memo else {}
+        for cell, bi, fields in cell_runs:
+            hit = hits.get(str(fields["cache_key"]))
+            if hit is not None:
+                _box_done(cell, bi, {"pose_path": hit[0], "score": hit[1], "cached": True})
+            else:
+                pending.setdefault(cell[1], []).append((cell[0], bi, fields))
+        if not pending:
+            return results
+
+        seed = default_seed()
+        prep_pool = self._prep_pool(len(pending))
+        dock_pool = ThreadPoolExecutor(max_workers=self.max_procs)
+        prep_futs: Dict[Future, Hashable] = {}
+        dock_futs: Dict[Future, Tuple[Cell, int]] = {}
+
+        def _submit_docks(key: Hashable, ligand_path: str) -> None:
+            for target, bi, fields in pending[key]:
+                fut = dock_pool.submit(
+                    dock_prepared_ligand, ctxs[target][bi], ligand_path, fields,
+                    exhaustiveness, self.cpu_per_proc, self.timeout_s,
+                )
+                dock_futs[fut] = ((target, key), bi)
+
+        try:
+            for key in pending:
+                if key in ligand_paths:
+                    _submit_docks(key, ligand_paths[key])
+                else:
+                    prep_futs[prep_pool.submit(get_or_prepare_ligand, smiles_of[key], seed)] = key
+            while prep_futs or dock_futs:
+                done, _ = wait(list(prep_futs) + list(dock_futs), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    if fut in prep_futs:
+                        key = prep_futs.pop(fut)
+                        try:
+                            ligand_path = fut.result()
+                        except Exception as e:
+                            for target, bi, _ in pending[key]:
+                                _box_done((target, key), bi, {"error": str(e)})
+                            continue
+                        _submit_docks(key, ligand_path)
+                    else:
+                        cell, bi = dock_futs.pop(fut)
+                        try:
+                            pose_path, score = fut.result()
+                            _box_done(cell, bi, {"pose_path": pose_path, "score": score})
+                        except Exception as e:
+                            _box_done(cell, bi, {"error": str(e)})
+        finally:
+            prep_pool.shutdown(wait=True, cancel_futures=True)
+            dock_pool.shutdown(wait=True, cancel_futures=True)
+        return results
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import subprocess
+from threading import Lock
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from app.db.session import SessionLocal
+from app.models.dock_result import DockResult
+from app.services.cache_utils import CacheStats, file_sha256
+from app.services.ligand_cache import canonical_smiles
+from app.services.pose_store import pose_exists
+from app.services.settings_provider import settings_provider
+
+_DEFAULT_SEED = 42
+# Bound on the size of an IN (...) clause
+_LOOKUP_CHUNK = 500
+
+stats = CacheStats()
+
+_versions: Dict[str, str] = {}
+_versions_lock = Lock()
+
+
+def memo_enabled() -> bool:
+    val = settings_provider.resolve("DOCK_MEMO", "1") or "1"
+    return val.strip().lower() in ("1", "true", "yes", "on")
+
+
+def vina_seed() -> int:
+    try:
+        return int(settings_provider.resolve("VINA_SEED", str(_DEFAULT_SEED)))  # type: ignore[arg-type]
+    except Exception:
+        return _DEFAULT_SEED
+
+
+def vina_version(vina: str) -> str:
+    with _versions_lock:
+        if vina in _versions:
+            return _versions[vina]
+    try:
+        proc = subprocess.run([vina, "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=30)
+        text = (proc.stdout or proc.stderr or "").strip()
+        version = text.splitlines()[0].strip() if text else "unknown"
+    except Exception:
+        version = "unknown"
+    # Fold in the binary identity so an in-place upgrade is not mistaken for the old build
+    try:
+        st = os.stat(vina)
+        version = f"{version}#{st.st_size}:{int(st.st_mtime)}"
+    except OSError:
+        pass
+    with _versions_lock:
+        _versions[vina] = version[:64]
+    return _versions[vina]
+
+
+def _fmt3(v: Tuple[float, float, float]) -> str:
+    return ",".join(f"{float(x):.3f}" for x in v)
+
+
+def result_key(
+    receptor_pdbqt: str,
+    smiles: str,
+    center: Tuple[float, float, float],
+    size: Tuple[float, float, float],
+    exhaustiveness: int,
+    scoring: str,
+    seed: int,
+    version: str,
+    ligand_seed: int,
+    variant: str = "",
+) -> Dict[str, object]:
+    """Describe a docking run; ``cache_key`` is a digest over every field that affects the result."""
+    fields: Dict[str, object] = {
+        "receptor_hash": file_sha256(receptor_pdbqt),
+        "ligand": canonical_smiles(smiles),
+        "center": _fmt3(center),
+        "size": _fmt3(size),
+        "exhaustiveness": int(exhaustiveness),
+        "scoring": scoring,
+        "seed": int(seed),
+        "vina_version": version,
+    }
+    raw = "|".join(str(fields[k]) for k in sorted(fields)) + f"|lig_seed={ligand_seed}"
+    if variant:
+        # e.g. a docking started from a specific input conformation
+        raw += f"|variant={variant}"
+    fields["cache_key"] = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    return fields
+
+
+def lookup(cache_key: str) -> Optional[Tuple[str, float]]:
+    db = SessionLocal()
+    try:
+        row = db.query(DockResult).filter(DockResult.cache_key == cache_key).first()
+        if row is None:
+            stats.miss()
+            return None
+        if not pose_exists(row.pose_path):
+            # Pose was removed from storage; forget the stale entry
+            db.delete(row)
+            db.commit()
+            stats.miss()
+            return None
+        stats.hit()
+        return row.pose_path, float(row.score)
+    finally:
+        db.close()
+
+
+def lookup_many(cache_keys: Iterable[str]) -> Dict[str, Tuple[str, float]]:
+    """Bulk ``lookup``: cache_key -> (pose_path, score) for every key with a usable stored result."""
+    keys = list(dict.fromkeys(cache_keys))
+    found: Dict[str, Tuple[str, float]] = {}
+    if not keys:
+        return found
+    db = SessionLocal()
+    try:
+        stale = []
+        for i in range(0, len(keys), _LOOKUP_CHUNK):
+            for row in db.query(DockResult).filter(DockResult.cache_key.in_(keys[i:i + _LOOKUP_CHUNK])).all():
+                if pose_exists(row.pose_path):
+                    found[row.cache_key] = (row.pose_path, float(row.score))
+                else:
+                    stale.append(row)
+        if stale:
+            for row in stale:
+                db.delete(row)
+            db.commit()
+    finally:
+        db.close()
+    for _ in range(len(found)):
+        stats.hit()
+    for _ in range(len(keys) - len(found)):
+        stats.miss()
+    return found
+
+
+def store(fields: Dict[str, object], score: float, pose_path: str) -> None:
+    db = SessionLocal()
+    try:
+        db.add(DockResult(**fields, score=score, pose_path=pose_path))
+        db.commit()
+    except IntegrityError:
+        # A concurrent dock of the same inputs stored it first
+        db.rollback()
+    finally:
+        db.close()
@@ -1,4 +1,5 @@
 from __future__ import annotations
+import hashlib
 import os
 import shutil
 import tempfile
@@ -7,6 +8,8 @@ from typing import Iterable, Optional
 
 from rdkit import Chem
 
+from app.services.pose_store import read_derived, write_derived
+
 
 def smiles_iter_to_sdf_bytes(smiles_iter: Iterable[str]) -> bytes:
     suppl = []
@@ -28,12 +31,28 @@ def smiles_iter_to_sdf_bytes(smiles_iter: Iterable[str]) -> bytes:
     return data
 
 
-def pdbqt_to_sdf_bytes(pdbqt_path: str) -> Optional[bytes]:
+def _meeko_pdbqt_to_sdf(pdbqt_text: str) -> Optional[bytes]:
+    """In-process conversion; needs the REMARK SMILES lines Meeko writes into prepared ligands."""
+    try:
+        from meeko import PDBQTMolecule, RDKitMolCreate
+    except ImportError:
+        return None
+    try:
+        pmol = PDBQTMolecule(pdbqt_text, skip_typing=True)
+        result = RDKitMolCreate.write_sd_string(pmol)
+    except Exception:
+        return None
+    # (sdf_string, failures) in current Meeko; older releases return the string alone
+    sdf, failures = result if isinstance(result, tuple) else (result, [])
+    if not sdf or failures:
+        return None
+    return sdf.encode("utf-8")
+
+
+def _obabel_pdbqt_to_sdf(pdbqt_path: str) -> Optional[bytes]:
     obabel = shutil.which("obabel") or shutil.which("obabel.exe")
     if obabel is None:
         return None
-    if not os.path.exists(pdbqt_path):
-        return None
     with tempfile.TemporaryDirectory() as td:
         out_path = os.path.join(td, "pose.sdf")
         cmd = [obabel, pdbqt_path, "-O", out_path]
@@ -43,3 +62,48 @@ def pdbqt_to_sdf_bytes(pdbqt_path: str) -> Optional[bytes]:
             return None
         with open(out_path, "rb") as f:
             return f.read()
+
+
+def pdbqt_to_sdf_bytes(pdbqt_path: str) -> Optional[bytes]:
+    if not os.path.exists(pdbqt_path):
+        return None
+    with open(pdbqt_path, "r", encoding="utf-8", errors="ignore") as f:
+        data = _meeko_pdbqt_to_sdf(f.read())
+    return data if data is not None else _obabel_pdbqt_to_sdf(pdbqt_path)
+
+
+def pdbqt_bytes_to_sdf_bytes(data: bytes) -> Optional[bytes]:
+    sdf = _meeko_pdbqt_to_sdf(data.decode("utf-8", errors="ignore"))
+    if sdf is not None:
+        return sdf
+    # Fallback: obabel needs a file
+    with tempfile.TemporaryDirectory() as td:
+        in_path = os.path.join(td, "pose.pdbqt")
+        with open(in_path, "wb") as f:
+            f.write(data)
+        return _obabel_pdbqt_to_sdf(in_path)
+
+
+def content_etag(data: bytes, variant: str = "") -> str:
+    h = hashlib.sha256(data)
+    h.update(variant.encode("utf-8"))
+    return h.hexdigest()[:32]
+
+
+def pose_sdf_bytes(pose_ref: str, pdbqt: bytes, etag: str, variant: str = "all") -> Optional[bytes]:
+    """
+    SDF for a stored pose (or one of its models, given as ``pdbqt``), converted once and
+    cached next to the pose. The cache entry is named by ``etag`` (a digest of the
+    PDBQT), so a re-docked pose never serves a stale conversion.
+    """
+    suffix = f"{variant}.{etag[:16]}.sdf"
+    cached = read_derived(pose_ref, suffix)
+    if cached is not None:
+        return cached
+    sdf = pdbqt_bytes_to_sdf_bytes(pdbqt)
+    if sdf is not None:
+        try:
+            write_derived(pose_ref, suffix, sdf)
+        except OSError:
+            pass
+    return sdf
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.cache_utils import CACHE_DIR, CacheStats, atomic_write_text, file_lock, file_sha256
+from app.services.procrunner import run_process_sync
+from app.services.settings_provider import settings_provider
+
+logger = logging.getLogger(__name__)
+
+POCKET_CACHE_DIR = os.path.join(CACHE_DIR, "pockets")
+
+# Bump when parsing or the stored fields change
+_PARSE_VERSION = "1"
+_DEFAULT_TIMEOUT_S = 600.0
+
+stats = CacheStats()
+
+_POCKET_HEADER_RE = re.compile(r"^Pocket\s+(\d+)\s*:")
+_DESCRIPTOR_RE = re.compile(r"^\s+(.+?)\s*:\s*([-+]?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)\s*$")
+# fpocket descriptor name -> field promoted onto the pocket dict
+_PROMOTED = {
+    "score": "score",
+    "druggability_score": "druggability",
+    "volume": "volume",
+    "number_of_alpha_spheres": "alpha_spheres",
+}
+
+
+def fpocket_path() -> Optional[str]:
+    return (
+        settings_provider.resolve("FPOCKET_PATH")
+        or shutil.which("fpocket")
+        or shutil.which("fpocket.exe")
+    )
+
+
+def _timeout() -> Optional[float]:
+    try:
+        val = float(settings_provider.resolve("FPOCKET_TIMEOUT_S", str(_DEFAULT_TIMEOUT_S)))  # type: ignore[arg-type]
+    except Exception:
+        val = _DEFAULT_TIMEOUT_S
+    return val if val > 0 else None
+
+
+def _snake(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", name.strip().lower()).strip("_")
+
+
+def parse_info(text: str) -> Dict[int, Dict[str, float]]:
+    """``<name>_info.txt``: pocket number -> {snake_case descriptor: value}."""
+    pockets: Dict[int, Dict[str, float]] = {}
+    current: Optional[Dict[str, float]] = None
+    for line in text.splitlines():
+        m = _POCKET_HEADER_RE.match(line)
+        if m:
+            current = pockets.setdefault(int(m.group(1)), {})
+            continue
+        m = _DESCRIPTOR_RE.match(line)
+        if m and current is not None:
+            current[_snake(m.group(1))] = float(m.group(2))
+    return pockets
+
+
+def parse_vert(path: str) -> List[Tuple[float, float, float, float]]:
+    """Alpha-sphere centres and radii from ``pocketN_vert.pqr``."""
+    spheres: List[Tuple[float, float, float, float]] = []
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            if not line.startswith(("ATOM", "HETATM")):
+                continue
+            try:
+                spheres.append((float(line[30:38]), float(line[38:46]), float(line[46:54]), float(line.split()[-1])))
+            except (ValueError, IndexError):
+                continue
+    return spheres
+
+
+def _pocket_from_spheres(number: int, spheres: List[Tuple[float, float, float, float]], descriptors: Dict[str, float]) -> Dict[str, Any]:
+    # Box spans every alpha sphere, not just the sphere centres
+    lo = [min(s[i] - s[3] for s in spheres) for i in range(3)]
+    hi = [max(s[i] + s[3] for s in spheres) for i in range(3)]
+    pocket: Dict[str, Any] = {
+        "center": tuple(round((a + b) / 2.0, 3) for a, b in zip(lo, hi)),
+        "size": tuple(round(b - a, 3) for a, b in zip(lo, hi)),
+        "method": "fpocket",
+        "rank": number,
+    }
+    for key, field in _PROMOTED.items():
+        if key in descriptors:
+            val = descriptors[key]
+            pocket[field] = int(val) if field == "alpha_spheres" else val
+    pocket["descriptors"] = descriptors
+    return pocket
+
+
+def parse_output(out_dir: str, stem: str) -> List[Dict[str, Any]]:
+    """Every pocket in an fpocket output directory, in fpocket's rank order."""
+    info_path = os.path.join(out_dir, f"{stem}_info.txt")
+    info: Dict[int, Dict[str, float]] = {}
+    if os.path.exists(info_path):
+        with open(info_path, "r", encoding="utf-8", errors="ignore") as f:
+            info = parse_info(f.read())
+    pockets_dir = os.path.join(out_dir, "pockets")
+    numbers = set(info)
+    if os.path.isdir(pockets_dir):
+        for name in os.listdir(pockets_dir):
+            m = re.match(r"^pocket(\d+)_vert\.pqr$", name)
+            if m:
+                numbers.add(int(m.group(1)))
+    pockets: List[Dict[str, Any]] = []
+    for number in sorted(numbers):
+        vert = os.path.join(pockets_dir, f"pocket{number}_vert.pqr")
+        spheres = parse_vert(vert) if os.path.exists(vert) else []
+        if spheres:
+            pockets.append(_pocket_from_spheres(number, spheres, info.get(number, {})))
+    return pockets
+
+
+def _run(protein_abs: str, exe: str) -> Optional[List[Dict[str, Any]]]:
+    # A scratch copy keeps fpocket's <name>_out tree away from the uploads directory
+    with tempfile.TemporaryDirectory(prefix="fpocket_") as scratch:
+        stem = "protein"
+        local = os.path.join(scratch, stem + os.path.splitext(protein_abs)[1].lower())
+        shutil.copyfile(protein_abs, local)
+        proc = run_process_sync([exe, "-f", os.path.basename(local)], timeout=_timeout(), cwd=scratch)
+        if proc.returncode != 0:
+            logger.warning("fpocket failed: %s", proc.stderr.strip() or proc.stdout.strip())
+            return None
+        return parse_output(os.path.join(scratch, f"{stem}_out"), stem)
+
+
+def fpocket_pockets(protein_file_rel: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    All fpocket pockets for a protein with fpocket's own descriptors, ranked as
+    fpocket ranks them. Results are cached as JSON keyed by the protein's content
+    hash, so fpocket runs once per structure. Returns None when fpocket is not
+    installed or fails (failures are not cached).
+    """
+    protein_abs = os.path.abspath(protein_file_rel)
+    path = os.path.join(POCKET_CACHE_DIR, f"{file_sha256(protein_abs)}.fpocket.v{_PARSE_VERSION}.json")
+
+    def _cached() -> Optional[List[Dict[str, Any]]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)["pockets"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    hit = _cached()
+    if hit is not None:
+        stats.hit()
+        return hit
+    exe = fpocket_path()
+    if not exe:
+        return None
+    # One fpocket run per structure even when several requests miss at once
+    with file_lock(path + ".lock"):
+        hit = _cached()
+        if hit is not None:
+            stats.hit()
+            return hit
+        stats.miss()
+        try:
+            pockets = _run(protein_abs, exe)
+        except Exception as e:
+            logger.warning("fpocket detection failed: %s", e)
+            return None
+        if pockets is not None:
+            atomic_write_text(path, json.dumps({"pockets": pockets}))
+    return pockets
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import math
+import os
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.services.dock_executor import Box, DockingExecutor
+from app.services.pose_store import pose_name
+from app.services.vina import POSES_DIR, extract_first_model
+
+# Called with (stage, done, total) as docking results arrive
+StageProgress = Callable[[str, int, int], None]
+# Called with (key, final result) as soon as a molecule's funnel result is settled
+FinalResult = Callable[[Hashable, Dict[str, Any]], None]
+
+DEFAULT_FUNNEL: Dict[str, Any] = {
+    "coarse_exhaustiveness": 2,
+    "top_fraction": 0.2,
+    "min_keep": 1,
+    "score_threshold": None,
+    "seed_from_coarse": False,
+}
+
+
+def funnel_config(raw: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    cfg = {**DEFAULT_FUNNEL, **{k: v for k, v in (raw or {}).items() if v is not None}}
+    cfg["coarse_exhaustiveness"] = max(1, int(cfg["coarse_exhaustiveness"]))
+    cfg["top_fraction"] = min(1.0, max(0.0, float(cfg["top_fraction"])))
+    cfg["min_keep"] = max(0, int(cfg["min_keep"]))
+    return cfg
+
+
+def select_for_refinement(coarse: Dict[Hashable, Dict[str, Any]], cfg: Dict[str, Any]) -> List[Hashable]:
+    """Keys of the best coarse results: top fraction (at least min_keep), optionally under a score threshold."""
+    scored = sorted(((k, r["score"]) for k, r in coarse.items() if "score" in r), key=lambda kv: kv[1])
+    if not scored:
+        return []
+    n = max(cfg["min_keep"], math.ceil(cfg["top_fraction"] * len(scored)))
+    keep = scored[:n]
+    threshold = cfg.get("score_threshold")
+    if threshold is not None:
+        keep = [kv for kv in keep if kv[1] <= float(threshold)]
+    return [k for k, _ in keep]
+
+
+def run_docking_funnel(
+    items: List[Tuple[Hashable, str]],
+    protein_file_rel: str,
+    boxes: List[Box],
+    config: Optional[Dict[str, Any]] = None,
+    executor: Optional[DockingExecutor] = None,
+    on_progress: Optional[StageProgress] = None,
+    on_result: Optional[FinalResult] = None,
+) -> Dict[Hashable, Dict[str, Any]]:
+    """
+    Coarse-to-fine screening: dock everything at low exhaustiveness, then re-dock only
+    the best fraction at the full VINA_EXHAUSTIVENESS. Each result carries "stage"
+    ("coarse" or "fine") naming the stage that produced its score, and "cached"
+    when every stage it went through was served by the docking memo.
+
+    ``on_result(key, result)`` fires once per molecule with its final result:
+    right after selection for molecules that are not refined, and as each fine
+    dock completes for the survivors, so consumers can overlap with refinement.
+    """
+    cfg = funnel_config(config)
+    executor = executor or DockingExecutor()
+    smiles_by_key = dict(items)
+
+    def _progress(stage: str) -> Optional[Callable[[Hashable, Dict[str, Any], int, int], None]]:
+        if on_progress is None:
+            return None
+        return lambda _key, _res, done, total: on_progress(stage, done, total)
+
+    def _settle(key: Hashable, res: Dict[str, Any]) -> None:
+        results[key] = res
+        if on_result is not None:
+            on_result(key, res)
+
+    coarse = executor.dock_smiles_boxes(
+        items, protein_file_rel, boxes,
+        exhaustiveness=str(cfg["coarse_exhaustiveness"]), on_result=_progress("coarse"),
+    )
+    results: Dict[Hashable, Dict[str, Any]] = {
+        k: {**r, "stage": "coarse", "coarse_score": r.get("score")} for k, r in coarse.items()
+    }
+
+    refine = select_for_refinement(coarse, cfg)
+    refine_set = set(refine)
+    for k in coarse:
+        if k not in refine_set:
+            _settle(k, results[k])
+    if not refine:
+        return results
+
+    ligand_paths: Dict[Hashable, str] = {}
+    if cfg["seed_from_coarse"]:
+        # Start the full search from the best coarse conformation
+        for k in refine:
+            pose = coarse[k]["pose_path"]
+            seed_path = os.path.join(POSES_DIR, f"seed_{os.path.splitext(pose_name(pose))[0]}.pdbqt")
+            try:
+                if not os.path.exists(seed_path):
+                    extract_first_model(pose, seed_path)
+                ligand_paths[k] = seed_path
+            except Exception:
+                continue
+
+    # Refine each survivor only in the box where its coarse pose was found
+    by_box: Dict[int, List[Hashable]] = {}
+    for k in refine:
+        by_box.setdefault(int(coarse[k].get("box_index", 0)), []).append(k)
+    def _refined(k: Hashable, r: Dict[str, Any]) -> Dict[str, Any]:
+        if "score" not in r:
+            # Keep the coarse score but surface why refinement failed
+            return {**results[k], "fine_error": r.get("error")}
+        out = {**r, "stage": "fine", "coarse_score": coarse[k].get("score")}
+        # "cached" only when no stage of this molecule ran Vina
+        out.pop("cached", None)
+        if r.get("cached") and coarse[k].get("cached"):
+            out["cached"] = True
+        return out
+
+    stage_progress = _progress("fine")
+    for bi, keys in sorted(by_box.items()):
+        def _on_fine(k: Hashable, r: Dict[str, Any], done: int, total: int, bi: int = bi) -> None:
+            _settle(k, _refined(k, {**r, "box_index": bi}))
+            if stage_progress is not None:
+                stage_progress(k, r, done, total)
+
+        executor.dock_smiles_boxes(
+            [(k, smiles_by_key[k]) for k in keys], protein_file_rel, [boxes[bi]],
+            on_result=_on_fine, ligand_paths={k: ligand_paths[k] for k in keys if k in ligand_paths},
+        )
+    # Seeds are only refinement inputs; the fine poses are stored on their own
+    for seed_path in set(ligand_paths.values()):
+        try:
+            os.remove(seed_path)
+        except OSError:
+            pass
+    return results
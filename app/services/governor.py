@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional
+
+from app.core.config import settings
+from app.services.cache_utils import atomic_write_text, file_lock, lock_fd, unlock_fd
+from app.services.procrunner import ProcessCancelled
+from app.services.settings_provider import settings_provider
+
+GOVERNOR_DIR = os.path.join(settings.STORAGE_DIR, "governor")
+_SLOTS_DIR = os.path.join(GOVERNOR_DIR, "slots")
+_WAITING_DIR = os.path.join(GOVERNOR_DIR, "waiting")
+_ACTIVE_DIR = os.path.join(GOVERNOR_DIR, "active")
+_ADMISSION_LOCK = os.path.join(GOVERNOR_DIR, "admission.lock")
+_STATS_PATH = os.path.join(GOVERNOR_DIR, "stats.json")
+_STATS_LOCK = os.path.join(GOVERNOR_DIR, "stats.lock")
+
+_POLL_S = 0.1
+_EWMA_ALPHA = 0.2
+
+
+def enabled() -> bool:
+    val = settings_provider.resolve("DOCK_GOVERNOR", "1") or "1"
+    return val.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _int_setting(key: str, default: int) -> int:
+    try:
+        return int(settings_provider.resolve(key, str(default)))  # type: ignore[arg-type]
+    except Exception:
+        return default
+
+
+def total_slots() -> int:
+    """CPU slots shared by every Vina process on this node (DOCK_CPU_BUDGET, default all cores)."""
+    return max(1, _int_setting("DOCK_CPU_BUDGET", os.cpu_count() or 1))
+
+
+def default_cpus() -> int:
+    # A run without an explicit --cpu would use every core, so it leases them all
+    return max(1, _int_setting("VINA_CPU", total_slots()))
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid() or sys.platform == "win32":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _write_marker(directory: str, token: str, info: Dict[str, Any]) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{token}.json")
+    atomic_write_text(path, json.dumps(info))
+    return path
+
+
+def _remove(path: Optional[str]) -> None:
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _markers(directory: str) -> List[Dict[str, Any]]:
+    """Live markers in a directory; markers left by dead processes are removed."""
+    out: List[Dict[str, Any]] = []
+    if not os.path.isdir(directory):
+        return out
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not _pid_alive(int(info.get("pid", 0))):
+            _remove(path)
+            continue
+        out.append(info)
+    return out
+
+
+def _wait_until(attempt: Callable[[], bool], cancel_event: Optional[threading.Event]) -> None:
+    while not attempt():
+        if cancel_event is not None and cancel_event.is_set():
+            raise ProcessCancelled("Docking was cancelled while queued for a CPU slot")
+        time.sleep(_POLL_S)
+
+
+def _load_stats() -> Dict[str, Any]:
+    try:
+        with open(_STATS_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _record_wait(wait_s: float) -> None:
+    with file_lock(_STATS_LOCK):
+        st = _load_stats()
+        count = int(st.get("count", 0)) + 1
+        st.update({
+            "count": count,
+            "total_s": float(st.get("total_s", 0.0)) + wait_s,
+            "max_s": max(float(st.get("max_s", 0.0)), wait_s),
+            "last_s": wait_s,
+            "ewma_s": wait_s if count == 1 else (1 - _EWMA_ALPHA) * float(st.get("ewma_s", 0.0)) + _EWMA_ALPHA * wait_s,
+        })
+        atomic_write_text(_STATS_PATH, json.dumps(st))
+
+
+@contextmanager
+def lease(
+    cpus: Optional[int] = None,
+    cancel_event: Optional[threading.Event] = None,
+    label: str = "vina",
+) -> Iterator[int]:
+    """
+    Lease CPU slots from the node-wide pool for the duration of the block and yield
+    the number granted (pass it to Vina as --cpu). Slots are advisory file locks, so
+    they are shared by API workers, RQ/Celery workers and background tasks alike, and
+    are released automatically if the holder dies. Callers queue while the pool is
+    exhausted; admission is serialised so a large request is not starved by small ones.
+    """
+    total = total_slots()
+    want = min(total, max(1, int(cpus or default_cpus())))
+    if not enabled():
+        yield want
+        return
+
+    os.makedirs(_SLOTS_DIR, exist_ok=True)
+    token = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    info = {"pid": os.getpid(), "cpus": want, "label": label, "since": time.time()}
+    waiting = _write_marker(_WAITING_DIR, token, info)
+    started = time.monotonic()
+    held: List[BinaryIO] = []
+    active: Optional[str] = None
+    try:
+        with open(_ADMISSION_LOCK, "a+b") as admission:
+            _wait_until(lambda: lock_fd(admission, blocking=False), cancel_event)
+            try:
+                slots = [open(os.path.join(_SLOTS_DIR, f"{i:03d}.lock"), "a+b") for i in range(total)]
+
+                def _grab() -> bool:
+                    for f in slots:
+                        if f not in held and lock_fd(f, blocking=False):
+                            held.append(f)
+                            if len(held) == want:
+                                return True
+                    return False
+
+                try:
+                    _wait_until(_grab, cancel_event)
+                finally:
+                    for f in slots:
+                        if f not in held:
+                            f.close()
+            finally:
+                unlock_fd(admission)
+        wait_s = time.monotonic() - started
+        _remove(waiting)
+        waiting = None
+        active = _write_marker(_ACTIVE_DIR, token, {**info, "since": time.time(), "waited_s": wait_s})
+        _record_wait(wait_s)
+        yield want
+    finally:
+        for f in held:
+            try:
+                unlock_fd(f)
+            finally:
+                f.close()
+        _remove(waiting)
+        _remove(active)
+
+
+def status() -> Dict[str, Any]:
+    waiting = _markers(_WAITING_DIR)
+    active = _markers(_ACTIVE_DIR)
+    now = time.time()
+    st = _load_stats()
+    count = int(st.get("count", 0))
+    return {
+        "enabled": enabled(),
+        "slots": total_slots(),
+        "in_use": sum(int(m.get("cpus", 0)) for m in active),
+        "active_leases": len(active),
+        "queue_depth": len(waiting),
+        "queued_cpus": sum(int(m.get("cpus", 0)) for m in waiting),
+        "oldest_wait_s": max((now - float(m.get("since", now)) for m in waiting), default=0.0),
+        "wait": {
+            "count": count,
+            "mean_s": float(st.get("total_s", 0.0)) / count if count else 0.0,
+            "ewma_s": float(st.get("ewma_s", 0.0)),
+            "max_s": float(st.get("max_s", 0.0)),
+            "last_s": float(st.get("last_s", 0.0)),
+        },
+    }
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from scipy import ndimage
+
+from app.services.structure_cache import load_structure
+
+# Finest grid spacing (A); coarsened for large proteins to stay under _MAX_VOXELS
+_SPACING = 1.0
+_MAX_VOXELS = 2_000_000
+# A voxel centre closer than this to a protein heavy atom is protein (vdW + small probe)
+_PROTEIN_RADIUS = 3.0
+# Protein must be hit within this distance along a scan line to count as enclosing
+_SCAN_DISTANCE = 8.0
+# Of the 7 scan lines (3 axes + 4 cube diagonals), how many must be enclosed on both sides
+_MIN_BURIEDNESS = 5
+_MIN_VOLUME = 40.0  # A^3
+_PAD = 4.0
+_MAX_POCKETS = 10
+
+_SCAN_LINES = ((1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 1), (1, 1, -1), (1, -1, 1), (-1, 1, 1))
+# Face neighbours only: cavities joined by an edge or corner stay separate
+_CONNECTIVITY = ndimage.generate_binary_structure(3, 1)
+
+
+def _shifted(a: np.ndarray, d: Tuple[int, int, int], fill: Any) -> np.ndarray:
+    """out[x] = a[x + d], with ``fill`` where x + d falls outside the grid."""
+    out = np.full_like(a, fill)
+    src = tuple(slice(max(k, 0), a.shape[i] + min(k, 0)) for i, k in enumerate(d))
+    dst = tuple(slice(max(-k, 0), a.shape[i] + min(-k, 0)) for i, k in enumerate(d))
+    out[dst] = a[src]
+    return out
+
+
+def _occupancy(coords: np.ndarray, origin: np.ndarray, shape: Tuple[int, int, int], spacing: float) -> np.ndarray:
+    """Voxels whose centre lies within _PROTEIN_RADIUS of an atom."""
+    r = int(np.ceil(_PROTEIN_RADIUS / spacing))
+    ax = np.arange(-r, r + 1)
+    off = np.stack(np.meshgrid(ax, ax, ax, indexing="ij"), axis=-1).reshape(-1, 3)
+    off = off[(off ** 2).sum(axis=1) * spacing ** 2 <= _PROTEIN_RADIUS ** 2]
+    occ = np.zeros(shape, dtype=bool)
+    base = np.rint((coords - origin) / spacing).astype(np.int64)
+    dims = np.asarray(shape)
+    step = max(1, 1_000_000 // len(off))
+    for b in range(0, len(base), step):
+        idx = (base[b:b + step, None, :] + off[None, :, :]).reshape(-1, 3)
+        idx = idx[np.all((idx >= 0) & (idx < dims), axis=1)]
+        occ[idx[:, 0], idx[:, 1], idx[:, 2]] = True
+    return occ
+
+
+def _buriedness(occ: np.ndarray, spacing: float) -> np.ndarray:
+    """Per empty voxel, the number of scan lines with protein on both sides within _SCAN_DISTANCE."""
+    steps = max(1, int(_SCAN_DISTANCE / spacing))
+    buried = np.zeros(occ.shape, dtype=np.int8)
+    for line in _SCAN_LINES:
+        both = np.ones(occ.shape, dtype=bool)
+        for sign in (1, -1):
+            seen = np.zeros(occ.shape, dtype=bool)
+            for k in range(1, steps + 1):
+                seen |= _shifted(occ, tuple(sign * k * v for v in line), False)  # type: ignore[arg-type]
+            both &= seen
+        buried += both
+    buried[occ] = 0
+    return buried
+
+
+def detect_grid_pockets(protein_file_rel: str, max_pockets: int = _MAX_POCKETS) -> List[Dict[str, Any]]:
+    """
+    Built-in cavity detector (LIGSITE-style). The protein's heavy atoms are
+    voxelised, each empty voxel is scored by how many of 7 scan lines are enclosed
+    by protein on both sides, and buried voxels are flood-filled into cavities.
+    Returns pockets ranked by size x buriedness, each with "center", "size" (voxel
+    bounding box plus padding), "volume" (A^3) and "score". Deterministic.
+    """
+    structure = load_structure(protein_file_rel)
+    keep = ~structure.het_atoms & (np.char.upper(np.char.strip(structure.elements)) != "H")
+    coords = structure.coords[keep].astype(np.float64)
+    if len(coords) < 10:
+        return []
+
+    lo = coords.min(axis=0) - _PROTEIN_RADIUS
+    hi = coords.max(axis=0) + _PROTEIN_RADIUS
+    extent = hi - lo
+    spacing = max(_SPACING, float((np.prod(extent) / _MAX_VOXELS) ** (1.0 / 3.0)))
+    shape = tuple(int(v) for v in np.ceil(extent / spacing).astype(np.int64) + 1)
+
+    occ = _occupancy(coords, lo, shape, spacing)  # type: ignore[arg-type]
+    buried = _buriedness(occ, spacing)
+    cavity = buried >= _MIN_BURIEDNESS
+    if not cavity.any():
+        return []
+
+    # Label only the box around buried voxels
+    nz = np.nonzero(cavity)
+    crop = tuple(slice(int(ix.min()), int(ix.max()) + 1) for ix in nz)
+    cavity = cavity[crop]
+    buried = buried[crop]
+    lo = lo + np.array([sl.start for sl in crop]) * spacing
+    shape = cavity.shape
+    labels, _ = ndimage.label(cavity, structure=_CONNECTIVITY)
+    voxels = np.flatnonzero(cavity)
+    comp, inverse, counts = np.unique(labels.reshape(-1)[voxels], return_inverse=True, return_counts=True)
+    ijk = np.stack(np.unravel_index(voxels, shape), axis=1).astype(np.float64)
+    xyz = lo + ijk * spacing
+    voxel_volume = spacing ** 3
+
+    pockets: List[Dict[str, Any]] = []
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    for c in range(len(comp)):
+        volume = float(counts[c]) * voxel_volume
+        if volume < _MIN_VOLUME:
+            continue
+        members = order[bounds[c]:bounds[c + 1]]
+        pts = xyz[members]
+        mean_buried = float(buried.reshape(-1)[voxels[members]].mean())
+        pmin, pmax = pts.min(axis=0), pts.max(axis=0)
+        pockets.append({
+            "center": tuple(round(float(v), 3) for v in pts.mean(axis=0)),
+            "size": tuple(round(float(v), 3) for v in (pmax - pmin) + _PAD),
+            "volume": round(volume, 1),
+            "score": round(volume * mean_buried / len(_SCAN_LINES), 2),
+            "buriedness": round(mean_buried, 2),
+            "method": "grid",
+        })
+    # Ties broken by position so the ranking is stable across runs
+    pockets.sort(key=lambda p: (-p["score"], p["center"]))
+    pockets = pockets[:max_pockets]
+    for rank, p in enumerate(pockets, start=1):
+        p["rank"] = rank
+    return pockets
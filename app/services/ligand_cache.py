@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import os
+from collections import OrderedDict
+from threading import RLock
+from typing import Any, Dict, List, Optional
+
+from app.services.cache_utils import (
+    CACHE_DIR,
+    CacheStats,
+    atomic_write_text,
+    file_lock,
+    options_digest,
+    temp_path_for,
+)
+from app.services.settings_provider import settings_provider
+
+LIGAND_CACHE_DIR = os.path.join(CACHE_DIR, "ligands")
+# raw SMILES -> canonical SMILES, one small file per spelling, shared by every process
+_ALIAS_DIR = os.path.join(LIGAND_CACHE_DIR, "aliases")
+_EVICT_LOCK = os.path.join(LIGAND_CACHE_DIR, ".evict.lock")
+
+# Bump when embedding/optimisation/Meeko settings change
+_PREP_VERSION = "1"
+_UFF_MAX_ITERS = 200
+_DEFAULT_SEED = 42
+_DEFAULT_MAX_ENTRIES = 50000
+_ALIAS_MAX = 100000
+# Evict down to this fraction of the limit so the directory is not rescanned on every miss
+_LOW_WATERMARK = 0.9
+
+stats = CacheStats()
+
+_lock = RLock()
+# In-process front of the alias files
+_aliases: "OrderedDict[str, str]" = OrderedDict()
+
+
+def default_seed() -> int:
+    try:
+        return int(settings_provider.resolve("LIGAND_EMBED_SEED", str(_DEFAULT_SEED)))  # type: ignore[arg-type]
+    except Exception:
+        return _DEFAULT_SEED
+
+
+def _max_entries() -> int:
+    try:
+        return max(1, int(settings_provider.resolve("LIGAND_CACHE_MAX_ENTRIES", str(_DEFAULT_MAX_ENTRIES))))  # type: ignore[arg-type]
+    except Exception:
+        return _DEFAULT_MAX_ENTRIES
+
+
+def _alias_path(smiles: str) -> str:
+    return os.path.join(_ALIAS_DIR, f"{options_digest(smiles)}.smi")
+
+
+def _read_alias(smiles: str) -> Optional[str]:
+    try:
+        with open(_alias_path(smiles), "r", encoding="utf-8") as f:
+            raw, _, canon = f.read().partition("\n")
+    except OSError:
+        return None
+    # The file name is a short digest, so confirm the spelling it was written for
+    return canon if raw == smiles and canon else None
+
+
+def _remember_alias(smiles: str, canon: str) -> None:
+    with _lock:
+        _aliases[smiles] = canon
+        _aliases.move_to_end(smiles)
+        while len(_aliases) > _ALIAS_MAX:
+            _aliases.popitem(last=False)
+
+
+def canonical_smiles(smiles: str) -> str:
+    """Canonical form of a SMILES; spellings seen by any process are answered without RDKit."""
+    with _lock:
+        hit = _aliases.get(smiles)
+        if hit is not None:
+            _aliases.move_to_end(smiles)
+            return hit
+    canon = _read_alias(smiles)
+    if canon is not None:
+        _remember_alias(smiles, canon)
+        return canon
+
+    from rdkit import Chem
+
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        raise ValueError("Invalid SMILES for ligand")
+    canon = Chem.MolToSmiles(mol)
+    _remember_alias(smiles, canon)
+    if "\n" not in smiles:
+        try:
+            atomic_write_text(_alias_path(smiles), f"{smiles}\n{canon}")
+        except OSError:
+            pass
+    return canon
+
+
+def ligand_cache_key(smiles: str, seed: Optional[int] = None) -> str:
+    seed = default_seed() if seed is None else seed
+    return options_digest(_PREP_VERSION, canonical_smiles(smiles), "ETKDG", _UFF_MAX_ITERS, seed)
+
+
+def ligand_cache_path(key: str) -> str:
+    return os.path.join(LIGAND_CACHE_DIR, f"{key}.pdbqt")
+
+
+def _entry_names(directory: str, suffix: str) -> List[str]:
+    try:
+        return [n for n in os.listdir(directory) if n.endswith(suffix) and not n.startswith(".")]
+    except FileNotFoundError:
+        return []
+
+
+def _touch(key: str) -> None:
+    # Recency lives in the file mtime, so every process evicts in the same order
+    try:
+        os.utime(ligand_cache_path(key), None)
+    except OSError:
+        pass
+
+
+def _trim(directory: str, suffix: str, limit: int) -> int:
+    """Remove the least recently used files past ``limit``, down to the low watermark."""
+    if len(_entry_names(directory, suffix)) <= limit:
+        return 0
+    with file_lock(_EVICT_LOCK):
+        # Rescan under the lock: another process may have trimmed already
+        entries = []
+        for name in _entry_names(directory, suffix):
+            try:
+                entries.append((os.path.getmtime(os.path.join(directory, name)), name))
+            except OSError:
+                continue
+        if len(entries) <= limit:
+            return 0
+        entries.sort()
+        removed = 0
+        for _, name in entries[: len(entries) - max(1, int(limit * _LOW_WATERMARK))]:
+            try:
+                os.remove(os.path.join(directory, name))
+                removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+
+def _evict() -> int:
+    """Enforce LIGAND_CACHE_MAX_ENTRIES over the shared directory, whichever process filled it."""
+    removed = _trim(LIGAND_CACHE_DIR, ".pdbqt", _max_entries())
+    _trim(_ALIAS_DIR, ".smi", _ALIAS_MAX)
+    return removed
+
+
+def get_or_prepare_ligand(smiles: str, seed: Optional[int] = None) -> str:
+    """
+    Return the path of a prepared ligand PDBQT, keyed by canonical SMILES plus the
+    embedding parameters and seed. Equivalent SMILES spellings share one entry.
+    """
+    # Local import: vina imports this module for its docking entry point
+    from app.services.vina import prepare_ligand_pdbqt_from_smiles
+
+    seed = default_seed() if seed is None else seed
+    key = ligand_cache_key(smiles, seed)
+    final_path = ligand_cache_path(key)
+    if os.path.exists(final_path) and os.path.getsize(final_path) > 0:
+        stats.hit()
+        _touch(key)
+        return final_path
+
+    stats.miss()
+    os.makedirs(LIGAND_CACHE_DIR, exist_ok=True)
+    tmp = temp_path_for(final_path)
+    try:
+        prepare_ligand_pdbqt_from_smiles(canonical_smiles(smiles), tmp, seed=seed)
+        os.replace(tmp, final_path)
+    finally:
+        if os.path.exists(tmp):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+    _touch(key)
+    _evict()
+    return final_path
+
+
+def invalidate(smiles: Optional[str] = None, seed: Optional[int] = None) -> int:
+    """Drop one ligand entry or, with no SMILES, the whole ligand cache."""
+    if not os.path.isdir(LIGAND_CACHE_DIR):
+        return 0
+    if smiles is not None:
+        keys = [ligand_cache_key(smiles, seed)]
+    else:
+        keys = [n[: -len(".pdbqt")] for n in os.listdir(LIGAND_CACHE_DIR) if n.endswith(".pdbqt") and not n.startswith(".")]
+    removed = 0
+    for key in keys:
+        try:
+            os.remove(ligand_cache_path(key))
+            removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
+
+
+def cache_info() -> Dict[str, Any]:
+    entries = len(_entry_names(LIGAND_CACHE_DIR, ".pdbqt"))
+    return {**stats.as_dict(), "entries": entries, "max_entries": _max_entries()}
@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from threading import RLock
+from typing import Any, Dict, Optional, Tuple
+
+from app.services import governor
+from app.services.cache_utils import CACHE_DIR, CacheStats, atomic_write_text, file_sha256, options_digest
+from app.services.procrunner import run_process_sync
+from app.services.settings_provider import settings_provider
+
+logger = logging.getLogger(__name__)
+
+MAPS_DIR = os.path.join(CACHE_DIR, "maps")
+INDEX_PATH = os.path.join(MAPS_DIR, "index.json")
+MAP_PREFIX = "receptor"
+
+_MAPS_VERSION = "1"
+_DEFAULT_MAX_MB = 2048
+# Avoid rewriting the index on every hit of a hot entry
+_TOUCH_INTERVAL_S = 30.0
+_MAPS_TIMEOUT_S = 600.0
+
+stats = CacheStats()
+
+_lock = RLock()
+# Vina executables that rejected --write_maps (e.g. 1.1.x); don't retry them
+_unsupported: set[str] = set()
+
+
+def maps_enabled() -> bool:
+    val = settings_provider.resolve("VINA_USE_MAPS", "1") or "1"
+    return val.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _max_bytes() -> int:
+    try:
+        mb = float(settings_provider.resolve("AFFINITY_MAPS_MAX_MB", str(_DEFAULT_MAX_MB)))  # type: ignore[arg-type]
+    except Exception:
+        mb = float(_DEFAULT_MAX_MB)
+    return int(mb * 1024 * 1024)
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for name in os.listdir(path):
+        try:
+            total += os.path.getsize(os.path.join(path, name))
+        except OSError:
+            continue
+    return total
+
+
+def _load_index() -> Dict[str, Dict[str, Any]]:
+    index: Dict[str, Dict[str, Any]] = {}
+    if os.path.exists(INDEX_PATH):
+        try:
+            with open(INDEX_PATH, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except Exception:
+            index = {}
+    # Reconcile with what is actually on disk (other processes may have added/evicted)
+    present = set()
+    if os.path.isdir(MAPS_DIR):
+        for name in os.listdir(MAPS_DIR):
+            full = os.path.join(MAPS_DIR, name)
+            if name.startswith(".") or not os.path.isdir(full):
+                continue
+            present.add(name)
+            if name not in index:
+                index[name] = {"bytes": _dir_bytes(full), "last_used": os.path.getmtime(full)}
+    return {k: v for k, v in index.items() if k in present}
+
+
+def _save_index(index: Dict[str, Dict[str, Any]]) -> None:
+    atomic_write_text(INDEX_PATH, json.dumps(index, indent=1, sort_keys=True))
+
+
+def _evict(index: Dict[str, Dict[str, Any]], keep: Optional[str] = None) -> None:
+    limit = _max_bytes()
+    total = sum(int(e.get("bytes", 0)) for e in index.values())
+    for key in sorted(index, key=lambda k: index[k].get("last_used", 0)):
+        if total <= limit:
+            break
+        if key == keep:
+            continue
+        shutil.rmtree(os.path.join(MAPS_DIR, key), ignore_errors=True)
+        total -= int(index.pop(key).get("bytes", 0))
+
+
+def maps_key(
+    receptor_pdbqt: str,
+    center: Tuple[float, float, float],
+    size: Tuple[float, float, float],
+    scoring: str,
+) -> str:
+    c = ",".join(f"{v:.3f}" for v in center)
+    s = ",".join(f"{v:.3f}" for v in size)
+    return options_digest(_MAPS_VERSION, file_sha256(receptor_pdbqt), c, s, scoring)
+
+
+def get_or_compute_maps(
+    vina: str,
+    receptor_pdbqt: str,
+    center: Tuple[float, float, float],
+    size: Tuple[float, float, float],
+    scoring: str = "vina",
+) -> Optional[str]:
+    """
+    Return a map prefix usable with ``vina --maps`` for this receptor/box/scoring
+    function, computing the grid once with ``--write_maps`` when absent. Returns None
+    when maps are disabled or the Vina build cannot write them, so callers fall back
+    to ``--receptor``.
+    """
+    if not maps_enabled() or vina in _unsupported or scoring == "ad4":
+        return None
+    key = maps_key(receptor_pdbqt, center, size, scoring)
+    entry_dir = os.path.join(MAPS_DIR, key)
+    prefix = os.path.join(entry_dir, MAP_PREFIX)
+
+    if os.path.isdir(entry_dir):
+        stats.hit()
+        with _lock:
+            index = _load_index()
+            meta = index.get(key)
+            now = time.time()
+            if meta is not None and now - float(meta.get("last_used", 0)) > _TOUCH_INTERVAL_S:
+                meta["last_used"] = now
+                _save_index(index)
+        return prefix
+
+    stats.miss()
+    os.makedirs(MAPS_DIR, exist_ok=True)
+    tmp_dir = os.path.join(MAPS_DIR, f".{key}.{os.getpid()}.{uuid.uuid4().hex[:8]}")
+    os.makedirs(tmp_dir)
+    cmd = [
+        vina,
+        "--receptor", receptor_pdbqt,
+        "--center_x", str(center[0]),
+        "--center_y", str(center[1]),
+        "--center_z", str(center[2]),
+        "--size_x", str(size[0]),
+        "--size_y", str(size[1]),
+        "--size_z", str(size[2]),
+        "--write_maps", os.path.join(tmp_dir, MAP_PREFIX),
+        "--force_even_voxels",
+    ]
+    if scoring != "vina":
+        cmd.extend(["--scoring", scoring])
+    try:
+        try:
+            with governor.lease(1, label="vina-maps"):
+                run_process_sync(cmd, timeout=_MAPS_TIMEOUT_S)
+        except Exception as e:
+            logger.warning("Affinity map generation failed (%s); docking without precomputed maps", e)
+            return None
+        if not any(n.endswith(".map") for n in os.listdir(tmp_dir)):
+            _unsupported.add(vina)
+            logger.warning("Vina at %s did not write affinity maps; docking without precomputed maps", vina)
+            return None
+        try:
+            os.replace(tmp_dir, entry_dir)
+        except OSError:
+            # Another writer finished first; its maps are equivalent
+            if not os.path.isdir(entry_dir):
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    with _lock:
+        index = _load_index()
+        index[key] = {
+            "bytes": _dir_bytes(entry_dir),
+            "last_used": time.time(),
+            "center": list(center),
+            "size": list(size),
+            "scoring": scoring,
+        }
+        _evict(index, keep=key)
+        _save_index(index)
+    return prefix
+
+
+def invalidate() -> int:
+    with _lock:
+        index = _load_index()
+        for key in list(index):
+            shutil.rmtree(os.path.join(MAPS_DIR, key), ignore_errors=True)
+        _save_index({})
+    return len(index)
+
+
+def cache_info() -> Dict[str, Any]:
+    with _lock:
+        index = _load_index()
+    return {
+        **stats.as_dict(),
+        "entries": len(index),
+        "bytes": sum(int(e.get("bytes", 0)) for e in index.values()),
+        "max_bytes": _max_bytes(),
+    }
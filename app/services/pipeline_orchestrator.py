@@ -2,10 +2,7 @@ from __future__ import annotations
 
 import json
 import logging
-import os
-import shutil
-import subprocess
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from sqlalchemy.orm import Session
 
@@ -14,204 +11,498 @@ from app.models.admet import AdmetResult
 from app.models.molecule import Molecule
 from app.models.pipeline_job import PipelineJob
 from app.models.protein import Protein
+from app.services import checkpoints
 from app.services.admet_service import predict_admet_for_smiles
+from app.services.admet_stream import TopKAdmetStream
+from app.services.box_sizing import fit_boxes, ligand_box_edge, smiles_radius_of_gyration
 from app.services.chem import generate_molecules_placeholder
+from app.services.dock_executor import DockingExecutor
+from app.services.funnel import run_docking_funnel
 from app.services.pockets import detect_pockets
-from app.services.target_features import analyze_pocket_features
-from app.services.vina import dock_smiles_against_protein
+from app.services.progress import ProgressReporter
+from app.services.target_features import analyze_pocket_features_many
 
 logger = logging.getLogger(__name__)
 
+# Best-scoring docked molecules that get ADMET predictions
+_ADMET_TOP_K = 10
 
-def _update_job(db: Session, job: PipelineJob, **kwargs: Any) -> None:
-    for k, v in kwargs.items():
-        setattr(job, k, v)
-    db.commit()
-    db.refresh(job)
+
+def _select_center_size(pockets: List[Dict[str, Any]]) -> Tuple[Tuple[float, float, float], Tuple[float, float, float]]:
+    if not pockets:
+        return ((0.0, 0.0, 0.0), (20.0, 20.0, 20.0))
+    p = pockets[0]
+    return tuple(p.get("center", (0.0, 0.0, 0.0))), tuple(p.get("size", (20.0, 20.0, 20.0)))  # type: ignore[return-value]
 
 
-def _try_fpocket(protein_abs: str) -> Optional[List[Dict[str, Any]]]:
+def _fit_docking_boxes(
+    items: List[Tuple[int, str]],
+    center: Tuple[float, float, float],
+    size: Tuple[float, float, float],
+    protein_path: Optional[str] = None,
+) -> List[Tuple[Tuple[float, float, float], Tuple[float, float, float]]]:
     """
-    If fpocket is installed, run it and extract pocket bounding boxes.
-    Falls back to None if unavailable or fails.
+    Fit the docking box to the pocket and the largest ligand's radius of gyration,
+    splitting regions above VINA_MAX_BOX_VOLUME into overlapping sub-boxes.
     """
-    exe = shutil.which("fpocket") or shutil.which("fpocket.exe")
-    if not exe:
-        return None
+    boxes = fit_boxes(center, size, ligand_rg=_max_ligand_rg(items), protein_file_rel=protein_path)
+    return [(b["center"], b["size"]) for b in boxes]
+
+
+def _max_ligand_rg(items: List[Tuple[int, str]]) -> Optional[float]:
+    """Largest Rg estimated from SMILES, so box sizing does not wait on ligand prep."""
+    rgs: List[float] = []
+    for _, smi in items:
+        try:
+            rg = smiles_radius_of_gyration(smi)
+        except Exception:
+            continue
+        if rg is not None:
+            rgs.append(rg)
+    return max(rgs) if rgs else None
+
+
+def _same_vec(a: Any, b: Any) -> bool:
     try:
-        subprocess.run([exe, "-f", protein_abs], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        out_dir = os.path.join(os.path.dirname(protein_abs), f"{os.path.basename(protein_abs)}_out")
-        pockets_txt = os.path.join(out_dir, "pockets", "pocket0", "pocket.pqr")
-        if not os.path.exists(pockets_txt):
-            return None
-        # Crude parser: compute bbox of pocket0 atoms
-        xs: List[float] = []
-        ys: List[float] = []
-        zs: List[float] = []
-        with open(pockets_txt, "r", encoding="utf-8", errors="ignore") as f:
-            for line in f:
-                if not line.startswith("HETATM"):
-                    continue
-                try:
-                    x = float(line[30:38])
-                    y = float(line[38:46])
-                    z = float(line[46:54])
-                    xs.append(x)
-                    ys.append(y)
-                    zs.append(z)
-                except Exception:
-                    continue
-        if not xs:
-            return None
-        pad = 4.0
-        center = ((min(xs) + max(xs)) / 2, (min(ys) + max(ys)) / 2, (min(zs) + max(zs)) / 2)
-        size = ((max(xs) - min(xs)) + pad, (max(ys) - min(ys)) + pad, (max(zs) - min(zs)) + pad)
-        return [{"center": center, "size": size, "method": "fpocket"}]
-    except Exception as e:
-        logger.warning("fpocket detection failed: %s", e)
-        return None
+        return [round(float(v), 3) for v in a] == [round(float(v), 3) for v in b]
+    except (TypeError, ValueError):
+        return False
 
 
-def _select_center_size(pockets: List[Dict[str, Any]]) -> Tuple[Tuple[float, float, float], Tuple[float, float, float]]:
+def _previous_boxes(
+    db: Session, job: PipelineJob, pocket: Dict[str, Any], items: List[Tuple[int, str]]
+) -> Optional[List[Tuple[Tuple[float, float, float], Tuple[float, float, float]]]]:
+    """
+    Boxes of the latest completed run on the same protein and pocket. Stored docking
+    results are keyed on the boxes, so incremental runs keep them fixed across
+    iterations instead of refitting them to each run's largest ligand. None (refit)
+    when a ligand in ``items`` needs a larger box edge than those boxes have.
+    """
+    edge = ligand_box_edge(_max_ligand_rg(items))
+    prior = (
+        db.query(PipelineJob.results)
+        .filter(
+            PipelineJob.protein_id == job.protein_id,
+            PipelineJob.status == "completed",
+            PipelineJob.id != job.id,
+            PipelineJob.results.isnot(None),
+        )
+        .order_by(PipelineJob.id.desc())
+        .limit(50)
+    )
+    for (text,) in prior:
+        try:
+            summary = json.loads(text)
+            used = summary["pockets"][0]
+            if _same_vec(used["center"], pocket.get("center")) and _same_vec(used["size"], pocket.get("size")):
+                boxes = [(tuple(b["center"]), tuple(b["size"])) for b in summary["boxes"]]
+                if min(min(sz) for _, sz in boxes) + 1e-6 < edge:
+                    return None
+                return boxes  # type: ignore[return-value]
+        except (ValueError, KeyError, IndexError, TypeError):
+            continue
+    return None
+
+
+def _detect_pocket(protein: Protein, pocket: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Provided pocket, else detected ones (fpocket, grid, bbox); every entry gets pocket features."""
+    pockets = [pocket] if pocket else detect_pockets(protein.path)
     if not pockets:
-        return ((0.0, 0.0, 0.0), (20.0, 20.0, 20.0))
-    p = pockets[0]
-    return tuple(p.get("center", (0.0, 0.0, 0.0))), tuple(p.get("size", (20.0, 20.0, 20.0)))  # type: ignore[return-value]
+        return []
+    try:
+        # One structure read for all pockets
+        features = analyze_pocket_features_many(protein.path, pockets)
+        pockets = [{**p, "features": f} if f else p for p, f in zip(pockets, features)]
+    except Exception:
+        pass
+    return pockets
+
+
+def _load_molecules(db: Session, ids: List[int]) -> List[Molecule]:
+    """Molecules by id in the given order; ids that no longer exist are dropped."""
+    by_id = {m.id: m for m in db.query(Molecule).filter(Molecule.id.in_(ids)).all()}
+    return [by_id[mid] for mid in ids if mid in by_id]
 
 
-def run_pipeline_sync(job_id: int, max_molecules: int = 10, pocket: Optional[Dict[str, Any]] = None) -> None:
+def _source_molecules(db: Session, job: PipelineJob, max_molecules: int, pocket: Optional[Dict[str, Any]]) -> List[Molecule]:
+    existing = (
+        db.query(Molecule)
+        .filter(Molecule.creator_id == job.user_id)
+        .order_by(Molecule.id.desc())
+        .limit(max_molecules)
+        .all()
+    )
+    generated: List[Molecule] = []
+    need = max(0, max_molecules - len(existing))
+    if need > 0:
+        smiles_list = generate_molecules_placeholder(str(job.protein_id), need, pocket=pocket)
+        for s in smiles_list:
+            m = Molecule(smiles=s, generated_for_protein_id=job.protein_id, creator_id=job.user_id)
+            db.add(m)
+            generated.append(m)
+        db.commit()
+        for m in generated:
+            db.refresh(m)
+    return existing + generated
+
+
+def run_pipeline_sync(
+    job_id: int,
+    max_molecules: int = 10,
+    pocket: Optional[Dict[str, Any]] = None,
+    funnel: Optional[Dict[str, Any]] = None,
+    incremental: bool = False,
+    resume: bool = False,
+) -> None:
     """
     Concrete synchronous pipeline (CPU-friendly):
-    1) pocket detection (fpocket if available, fallback to bbox heuristic)
+    1) pocket detection (cached fpocket if available, else the grid detector, else a bbox)
     2) molecule sourcing (reuse existing + placeholder generation)
-    3) docking loop via Vina
-    4) ADMET scoring
+    3) docking via Vina (optionally a coarse-to-fine funnel)
+    4) ADMET scoring, streamed: a molecule is scored as soon as it enters the docking top-k
     5) summary stub for retrosynthesis/protocol
+
+    Each stage, and each docked / ADMET-scored molecule, is checkpointed; with
+    ``resume`` the finished stages and molecules of an interrupted run are reused.
+    With ``incremental``, molecules that already have a stored result for this
+    protein, box and docking parameters are not docked again.
     """
     db: Session = SessionLocal()
+    reporter: Optional[ProgressReporter] = None
     try:
         job: Optional[PipelineJob] = db.query(PipelineJob).filter(PipelineJob.id == job_id).first()
         if not job:
             return
-        _update_job(db, job, status="running", progress=0.05, message="Starting pipeline")
+        reporter = ProgressReporter(db, job)
+        if not resume:
+            checkpoints.save(
+                db, job_id, "params",
+                {"max_molecules": max_molecules, "pocket": pocket, "funnel": funnel, "incremental": incremental},
+            )
+        checkpoints.claim(db, job_id)
+        reporter.update(status="running", progress=0.05, message="Resuming pipeline" if resume else "Starting pipeline")
 
         protein: Optional[Protein] = db.query(Protein).filter(Protein.id == job.protein_id).first()
         if not protein:
-            _update_job(db, job, status="failed", message="Protein not found")
+            reporter.update(status="failed", message="Protein not found")
             return
 
-        protein_abs = os.path.abspath(protein.path)
-
         # Step 1: pocket detection (or use provided)
-        pockets = [pocket] if pocket else (_try_fpocket(protein_abs) or detect_pockets(protein.path))
-        if not pockets:
-            _update_job(db, job, status="failed", message="No pockets detected")
-            return
+        saved = checkpoints.load(db, job_id, "pocket") if resume else None
+        if saved:
+            pockets = saved["pockets"]
+        else:
+            pockets = _detect_pocket(protein, pocket)
+            if not pockets:
+                reporter.update(status="failed", message="No pockets detected")
+                return
+            checkpoints.save(db, job_id, "pocket", {"pockets": pockets})
         center, size = _select_center_size(pockets)
         pocket_for_gen = pockets[0]
-        try:
-            features = analyze_pocket_features(protein.path, pocket_for_gen)
-            if features:
-                pocket_for_gen = {**pocket_for_gen, "features": features}
-                pockets[0] = pocket_for_gen
-        except Exception:
-            pass
-        _update_job(db, job, current_step="pocket_detection", progress=0.18, message="Pocket detected")
+        reporter.update(current_step="pocket_detection", progress=0.18, message="Pocket detected")
 
         # Step 2: source molecules (existing recent + generate placeholders)
-        existing = (
-            db.query(Molecule)
-            .filter(Molecule.creator_id == job.user_id)
-            .order_by(Molecule.id.desc())
-            .limit(max_molecules)
-            .all()
-        )
-        generated: List[Molecule] = []
-        need = max(0, max_molecules - len(existing))
-        if need > 0:
-            smiles_list = generate_molecules_placeholder(str(job.protein_id), need, pocket=pocket_for_gen)
-            for s in smiles_list:
-                m = Molecule(smiles=s, generated_for_protein_id=job.protein_id, creator_id=job.user_id)
-                db.add(m)
-                generated.append(m)
-            db.commit()
-            for m in generated:
-                db.refresh(m)
-        molecules = existing + generated
+        saved = checkpoints.load(db, job_id, "molecules") if resume else None
+        molecules = _load_molecules(db, saved["ids"]) if saved else []
         if not molecules:
-            _update_job(db, job, status="failed", message="No molecules available")
-            return
-        _update_job(
-            db,
-            job,
+            molecules = _source_molecules(db, job, max_molecules, pocket_for_gen)
+            if not molecules:
+                reporter.update(status="failed", message="No molecules available")
+                return
+            checkpoints.save(db, job_id, "molecules", {"ids": [m.id for m in molecules]})
+        reporter.update(
             current_step="molecule_selection",
             progress=0.28,
             message=f"{len(molecules)} molecules ready for docking",
         )
 
-        # Step 3: docking loop
+        # Step 3: parallel docking (ligand prep overlapped with Vina runs)
+        items = [(m.id, m.smiles) for m in molecules]
+        executor = DockingExecutor()
+        saved = checkpoints.load(db, job_id, "boxes") if resume else None
+        if saved:
+            boxes = [(tuple(c), tuple(sz)) for c, sz in saved["boxes"]]
+        else:
+            # Incremental runs keep the previous run's boxes so its stored results still match
+            boxes = (_previous_boxes(db, job, pockets[0], items) if incremental else None) or _fit_docking_boxes(
+                items, center, size, protein.path
+            )
+            checkpoints.save(db, job_id, "boxes", {"boxes": boxes})
+        # Molecules served from stored results vs docked with Vina in this run
+        reused_ids: Set[int] = set()
+        ran_ids: Set[int] = set()
+        smiles_of = dict(items)
+        # Step 4 runs alongside step 3: docked molecules stream into the ADMET stage
+        admet_done = checkpoints.load_molecules(db, job_id, "admet") if resume else {}
+        admet_stage = TopKAdmetStream(_ADMET_TOP_K, done=admet_done)
+
+        def _save_admet(mid: int, res: Dict[str, Any]) -> None:
+            db.add(AdmetResult(
+                molecule_id=mid,
+                user_id=job.user_id,
+                solubility=res.get("solubility") or 0.0,
+                toxicity=res.get("toxicity") or 0.0,
+                clearance=res.get("clearance") or 0.0,
+            ))
+            # Commits the AdmetResult row together with its checkpoint
+            checkpoints.save(db, job_id, "admet", res, molecule_id=mid)
+            admet_done[mid] = res
+
+        def _stream(key: Any, res: Dict[str, Any]) -> None:
+            if "score" in res:
+                admet_stage.offer({"molecule_id": key, "smiles": smiles_of[key], "score": res["score"]})
+            # Persist predictions as they land, so a crash mid-docking keeps them
+            for mid, out in admet_stage.drain().items():
+                if "admet" in out and mid not in admet_done:
+                    _save_admet(mid, out["admet"])
+
+        try:
+            if funnel is not None:
+                def _on_stage(stage: str, done: int, total: int) -> None:
+                    lo, span = (0.28, 0.22) if stage == "coarse" else (0.5, 0.2)
+                    prog = lo + span * done / max(total, 1)
+                    reporter.update(current_step=f"docking_{stage}", progress=min(0.7, prog), message=f"Docked ({stage}) {done}/{total}")
+
+                # Funnel selection spans the whole set, so it is checkpointed as a unit; an
+                # interrupted funnel is re-run and its finished docks come from the memo
+                saved = checkpoints.load(db, job_id, "dock") if resume else None
+                if saved:
+                    docked = {int(k): v for k, v in saved.items()}
+                    for key, res in docked.items():
+                        _stream(key, res)
+                else:
+                    # Settled molecules stream into ADMET while survivors are still refined
+                    docked = run_docking_funnel(
+                        items, protein.path, boxes, config=funnel, executor=executor,
+                        on_progress=_on_stage, on_result=_stream,
+                    )
+                    checkpoints.save(db, job_id, "dock", docked)
+                    for key, res in docked.items():
+                        if "score" in res:
+                            (reused_ids if res.get("cached") else ran_ids).add(key)
+            else:
+                docked = checkpoints.load_molecules(db, job_id, "dock") if resume else {}
+                todo = [it for it in items if it[0] not in docked]
+                if incremental and todo:
+                    reuse = executor.stored_results(todo, protein.path, boxes)
+                    reused_ids.update(reuse)
+                    docked.update(reuse)
+                    todo = [it for it in todo if it[0] not in reuse]
+                offset = len(items) - len(todo)
+                for key, res in docked.items():
+                    _stream(key, res)
+
+                def _on_result(key: Any, res: Dict[str, Any], done: int, total: int) -> None:
+                    if "score" in res:
+                        checkpoints.save(db, job_id, "dock", res, molecule_id=key)
+                        (reused_ids if res.get("cached") else ran_ids).add(key)
+                    _stream(key, res)
+                    prog = 0.28 + (0.4 * (offset + done) / max(len(items), 1))
+                    reporter.update(current_step="docking", progress=min(0.7, prog), message=f"Docked {offset + done}/{len(items)}")
+
+                if offset:
+                    reporter.update(current_step="docking", message=f"Docking {len(todo)}/{len(items)}; {offset} already done")
+                docked.update(executor.dock_smiles_boxes(todo, protein.path, boxes, on_result=_on_result))
+        finally:
+            admet_out = admet_stage.finish()
         dock_results: List[Dict[str, Any]] = []
-        for idx, m in enumerate(molecules):
-            try:
-                pose_path, score = dock_smiles_against_protein(m.smiles, protein.path, center=center, size=size)
-                m.score = score
+        for m in molecules:
+            res = docked.get(m.id, {"error": "Docking failed"})
+            if "score" in res:
+                m.score = res["score"]
                 db.add(m)
-                dock_results.append({"molecule_id": m.id, "smiles": m.smiles, "score": score, "pose_path": pose_path})
-            except Exception as e:
-                dock_results.append({"molecule_id": m.id, "smiles": m.smiles, "error": str(e)})
-            prog = 0.28 + (0.4 * (idx + 1) / max(len(molecules), 1))
-            _update_job(db, job, current_step="docking", progress=min(0.7, prog), message=f"Docked {idx+1}/{len(molecules)}")
+                entry = {"molecule_id": m.id, "smiles": m.smiles, "score": res["score"], "pose_path": res["pose_path"]}
+                if len(boxes) > 1:
+                    entry["box_index"] = res.get("box_index")
+                if "stage" in res:
+                    entry["stage"] = res["stage"]
+                    entry["coarse_score"] = res.get("coarse_score")
+                if m.id in reused_ids:
+                    entry["reused"] = True
+                dock_results.append(entry)
+            else:
+                dock_results.append({"molecule_id": m.id, "smiles": m.smiles, "error": res.get("error", "Docking failed")})
         db.commit()
         dock_success = [r for r in dock_results if "score" in r]
         if not dock_success:
-            _update_job(db, job, status="failed", message="Docking failed for all molecules")
+            reporter.update(status="failed", message="Docking failed for all molecules")
             return
 
+        if incremental:
+            reporter.update(message=f"Docked {len(ran_ids)} new, reused {len(reused_ids)} stored results")
         dock_success = sorted(dock_success, key=lambda x: x["score"])
-        top_for_admet = dock_success[: min(10, len(dock_success))]
+        top_for_admet = dock_success[:_ADMET_TOP_K]
 
-        # Step 4: ADMET
+        # Step 4: ADMET results of the final top-k, most already predicted during docking
+        reporter.update(current_step="admet", progress=0.75, message=f"ADMET for top {len(top_for_admet)}")
         admet_results: List[Dict[str, Any]] = []
-        for idx, r in enumerate(top_for_admet):
-            try:
-                res = predict_admet_for_smiles(r["smiles"])
-                admet_results.append({**r, "admet": res})
-                rec = AdmetResult(
-                    molecule_id=r["molecule_id"],
-                    user_id=job.user_id,
-                    solubility=res.get("solubility") or 0.0,
-                    toxicity=res.get("toxicity") or 0.0,
-                    clearance=res.get("clearance") or 0.0,
-                )
-                db.add(rec)
-            except Exception as e:
-                admet_results.append({**r, "admet_error": str(e)})
-            prog = 0.7 + (0.15 * (idx + 1) / max(len(top_for_admet), 1))
-            _update_job(db, job, current_step="admet", progress=min(0.9, prog), message=f"ADMET {idx+1}/{len(top_for_admet)}")
+        for r in top_for_admet:
+            mid = r["molecule_id"]
+            out = admet_out.get(mid)
+            if out is None:
+                # Only on a score tie at the top-k boundary
+                try:
+                    out = {"admet": predict_admet_for_smiles(r["smiles"])}
+                except Exception as e:
+                    out = {"admet_error": str(e)}
+            admet_results.append({**r, **out})
+            if "admet" in out and mid not in admet_done:
+                _save_admet(mid, out["admet"])
         db.commit()
+        reporter.update(
+            progress=0.9,
+            message=f"ADMET {len(admet_results)} candidates ({admet_stage.predicted} predicted while docking, "
+            f"{admet_stage.skipped} skipped after leaving the top {_ADMET_TOP_K})",
+        )
 
         # Step 5: placeholders for retrosynthesis / protocol
         summary = {
             "pockets": pockets[:1],
+            "boxes": [{"center": c, "size": sz} for c, sz in boxes],
             "docking": dock_results,
             "admet": admet_results,
+            **({"incremental": {"reused": len(reused_ids), "docked": len(ran_ids)}} if incremental else {}),
             "retrosynthesis": "pending (hook AiZynthFinder/ASKCOS here)",
             "protocol": "pending (LLM-based SOP generation)",
         }
-        _update_job(
-            db,
-            job,
+        reporter.update(
             status="completed",
             progress=1.0,
             current_step="complete",
             message="Pipeline finished",
             results=json.dumps(summary),
         )
+        checkpoints.clear(db, job_id)
     except Exception as e:
         try:
-            _update_job(db, job, status="failed", message=str(e))  # type: ignore[arg-type]
+            if reporter is not None:
+                reporter.update(status="failed", message=str(e))
         except Exception:
             pass
         logger.exception("Pipeline failed")
     finally:
         db.close()
+
+
+def run_selectivity_panel_sync(
+    job_id: int,
+    protein_ids: List[int],
+    molecule_ids: Optional[List[int]] = None,
+    max_molecules: int = 10,
+) -> None:
+    """
+    Dock one ligand set against a panel of proteins (the job's target first, then
+    anti-targets) and store the full score matrix. Ligands are prepared once, each
+    receptor once, and all receptor x ligand x box jobs share one executor pool.
+    """
+    db: Session = SessionLocal()
+    reporter: Optional[ProgressReporter] = None
+    try:
+        job: Optional[PipelineJob] = db.query(PipelineJob).filter(PipelineJob.id == job_id).first()
+        if not job:
+            return
+        reporter = ProgressReporter(db, job)
+        # Finished cells of an interrupted panel are memo hits when it is resumed
+        checkpoints.save(
+            db, job_id, "params",
+            {"protein_ids": protein_ids, "molecule_ids": molecule_ids, "max_molecules": max_molecules},
+        )
+        checkpoints.claim(db, job_id)
+        reporter.update(status="running", progress=0.05, message="Starting selectivity panel")
+
+        by_id = {p.id: p for p in db.query(Protein).filter(Protein.id.in_(protein_ids)).all()}
+        proteins = [by_id[pid] for pid in protein_ids if pid in by_id]
+        if len(proteins) != len(protein_ids):
+            reporter.update(status="failed", message="Protein not found")
+            return
+
+        # Step 1: a pocket per protein
+        pockets: Dict[int, Dict[str, Any]] = {}
+        for prot in proteins:
+            found = _detect_pocket(prot)
+            if not found:
+                reporter.update(status="failed", message=f"No pockets detected for protein {prot.id}")
+                return
+            pockets[prot.id] = found[0]
+        reporter.update(current_step="pocket_detection", progress=0.15, message=f"Pockets detected for {len(proteins)} proteins")
+
+        # Step 2: the shared ligand set
+        saved = checkpoints.load(db, job_id, "molecules")
+        if saved:
+            molecules = _load_molecules(db, saved["ids"])
+        elif molecule_ids:
+            molecules = _load_molecules(db, molecule_ids)
+        else:
+            molecules = _source_molecules(db, job, max_molecules, pockets[proteins[0].id])
+        if not molecules:
+            reporter.update(status="failed", message="No molecules available")
+            return
+        checkpoints.save(db, job_id, "molecules", {"ids": [m.id for m in molecules]})
+        items = [(m.id, m.smiles) for m in molecules]
+
+        # Step 3: dock the matrix; boxes are sized from SMILES so prep overlaps docking
+        executor = DockingExecutor()
+        rg = _max_ligand_rg(items)
+        targets = []
+        for prot in proteins:
+            center, size = _select_center_size([pockets[prot.id]])
+            boxes = [(b["center"], b["size"]) for b in fit_boxes(center, size, ligand_rg=rg, protein_file_rel=prot.path)]
+            targets.append((prot.id, prot.path, boxes))
+        reporter.update(
+            current_step="docking", progress=0.2,
+            message=f"Docking {len(molecules)} molecules x {len(proteins)} proteins",
+        )
+
+        def _on_cell(target: Any, key: Any, res: Dict[str, Any], done: int, total: int) -> None:
+            prog = 0.2 + 0.75 * done / max(total, 1)
+            reporter.update(current_step="docking", progress=min(0.95, prog), message=f"Docked {done}/{total}")
+
+        matrix = executor.dock_matrix(items, targets, on_result=_on_cell)
+
+        # Rows follow molecules, columns follow protein_ids (target first)
+        rows: List[Dict[str, Any]] = []
+        for m in molecules:
+            scores: List[Optional[float]] = []
+            poses: List[Optional[str]] = []
+            errors: Dict[str, str] = {}
+            for prot in proteins:
+                res = matrix[prot.id].get(m.id, {"error": "Docking failed"})
+                scores.append(res.get("score"))
+                poses.append(res.get("pose_path"))
+                if "error" in res:
+                    errors[str(prot.id)] = res["error"]
+            target_score = scores[0]
+            off_target = [sc for sc in scores[1:] if sc is not None]
+            row: Dict[str, Any] = {"molecule_id": m.id, "smiles": m.smiles, "scores": scores, "pose_paths": poses}
+            if target_score is not None and off_target:
+                # Positive = binds the target more strongly than its best anti-target
+                row["selectivity"] = min(off_target) - target_score
+            if errors:
+                row["errors"] = errors
+            rows.append(row)
+        if all(all(sc is None for sc in r["scores"]) for r in rows):
+            reporter.update(status="failed", message="Docking failed for all pairs")
+            return
+        rows.sort(key=lambda r: (r.get("selectivity") is None, -(r.get("selectivity") or 0.0)))
+
+        summary = {
+            "proteins": [{"protein_id": p.id, "filename": p.filename, "pocket": pockets[p.id], "boxes": len(t[2])} for p, t in zip(proteins, targets)],
+            "matrix": rows,
+        }
+        reporter.update(
+            status="completed",
+            progress=1.0,
+            current_step="complete",
+            message="Selectivity panel finished",
+            results=json.dumps(summary),
+        )
+        checkpoints.clear(db, job_id)
+    except Exception as e:
+        try:
+            if reporter is not None:
+                reporter.update(status="failed", message=str(e))
+        except Exception:
+            pass
+        logger.exception("Selectivity panel failed")
+    finally:
+        db.close()
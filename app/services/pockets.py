@@ -1,51 +1,38 @@
 from __future__ import annotations
 
-import os
 from typing import List, Dict, Any
 
-import gemmi
+from app.services.fpocket import fpocket_pockets
+from app.services.grid_pockets import detect_grid_pockets
+from app.services.structure_cache import load_structure
 
 
 def detect_pockets(protein_file_rel: str) -> List[Dict[str, Any]]:
     """
-    Lightweight placeholder pocket detector.
-    If fpocket is available, you can plug it here; for now we compute a coarse bounding box
+    Ranked pockets: fpocket's (cached per protein) when it is installed, else
+    cavities from the built-in grid detector, falling back to a coarse bounding box
     of the structure (or hetero atoms if present) as a single "pocket".
     """
-    protein_abs = os.path.abspath(protein_file_rel)
-    structure = gemmi.read_structure(protein_abs)
-    atoms = []
-    het_atoms = []
-    for model in structure:
-        for chain in model:
-            for residue in chain:
-                for atom in residue:
-                    pos = atom.pos
-                    atoms.append((pos.x, pos.y, pos.z))
-                    if residue.het_flag == "H":
-                        het_atoms.append((pos.x, pos.y, pos.z))
-
-    coords = het_atoms or atoms
-    if not coords:
+    pockets = fpocket_pockets(protein_file_rel) or detect_grid_pockets(protein_file_rel)
+    if pockets:
+        return pockets
+    return _bbox_pocket(protein_file_rel)
+
+
+def _bbox_pocket(protein_file_rel: str) -> List[Dict[str, Any]]:
+    structure = load_structure(protein_file_rel)
+    het = structure.het_atoms
+    coords = structure.coords[het] if het.any() else structure.coords
+    if not len(coords):
         return []
 
-    xs, ys, zs = zip(*coords)
-    min_x, max_x = min(xs), max(xs)
-    min_y, max_y = min(ys), max(ys)
-    min_z, max_z = min(zs), max(zs)
+    lo = coords.min(axis=0).astype(float)
+    hi = coords.max(axis=0).astype(float)
 
     # Add padding to cover surrounding space
     pad = 4.0
-    center = (
-        (min_x + max_x) / 2.0,
-        (min_y + max_y) / 2.0,
-        (min_z + max_z) / 2.0,
-    )
-    size = (
-        (max_x - min_x) + pad,
-        (max_y - min_y) + pad,
-        (max_z - min_z) + pad,
-    )
+    center = tuple(float(v) for v in (lo + hi) / 2.0)
+    size = tuple(float(v) for v in (hi - lo) + pad)
 
     return [
         {
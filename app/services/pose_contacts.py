@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.services.box_sizing import pdbqt_lines_coordinates
+from app.services.structure_cache import load_structure
+
+DEFAULT_CUTOFF = 4.0
+
+
+def pose_contacts(protein_file_rel: str, pose_pdbqt: bytes, cutoff: float = DEFAULT_CUTOFF) -> List[Dict[str, Any]]:
+    """
+    Protein residues with an atom within ``cutoff`` A of a heavy atom of the pose's
+    first model, closest first. Only atoms in grid cells around the pose are
+    examined, via the structure's spatial index.
+    """
+    points = pdbqt_lines_coordinates(pose_pdbqt.decode("utf-8", errors="ignore").splitlines())
+    if not len(points):
+        return []
+    structure = load_structure(protein_file_rel)
+    atoms, dist = structure.atoms_near(points, cutoff)
+    if not len(atoms):
+        return []
+    residues = structure.atom_residue[atoms]
+    # Per residue: closest atom and number of atoms in contact
+    uniq, inverse, counts = np.unique(residues, return_inverse=True, return_counts=True)
+    closest = np.full(len(uniq), np.inf)
+    np.minimum.at(closest, inverse, dist)
+    out = [
+        {
+            "residue": structure.residue_key(int(r)),
+            "name": str(structure.names[structure.residue_name[r]]).strip(),
+            "chain": str(structure.chains[structure.residue_chain[r]]),
+            "het": bool(structure.residue_het[r]),
+            "min_distance": round(float(d), 2),
+            "atoms": int(n),
+        }
+        for r, d, n in zip(uniq, closest, counts)
+    ]
+    out.sort(key=lambda c: c["min_distance"])
+    return out
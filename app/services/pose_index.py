@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import io
+from typing import List, Optional
+
+from app.db.session import SessionLocal
+from app.models.dock_pose import DockPose
+from app.services.pose_parser import PoseModel, iter_pose_models
+from app.services.pose_store import read_pose, read_pose_range
+
+
+def record_poses(pose_path: str, models: Optional[List[PoseModel]] = None) -> List[PoseModel]:
+    """Parse a stored Vina output (unless ``models`` is given) and (re)write its rows in the pose table."""
+    if models is None:
+        data = read_pose(pose_path)
+        models = list(iter_pose_models(io.BytesIO(data))) if data is not None else []
+    db = SessionLocal()
+    try:
+        db.query(DockPose).filter(DockPose.pose_path == pose_path).delete(synchronize_session=False)
+        for m in models:
+            db.add(DockPose(
+                pose_path=pose_path,
+                model=m.model,
+                affinity=m.affinity,
+                rmsd_lb=m.rmsd_lb,
+                rmsd_ub=m.rmsd_ub,
+                offset=m.offset,
+                length=m.length,
+            ))
+        db.commit()
+    except Exception:
+        # The pose table is an index; it is rebuilt lazily on the next read
+        db.rollback()
+    finally:
+        db.close()
+    return models
+
+
+def list_poses(pose_path: str) -> List[PoseModel]:
+    """Indexed models of a pose file, ordered by model number; indexes the file on first use."""
+    db = SessionLocal()
+    try:
+        rows = db.query(DockPose).filter(DockPose.pose_path == pose_path).order_by(DockPose.model).all()
+        models = [PoseModel(r.model, r.affinity, r.rmsd_lb, r.rmsd_ub, r.offset, r.length) for r in rows]
+    finally:
+        db.close()
+    return models or record_poses(pose_path)
+
+
+def read_pose_model(pose_path: str, model: int) -> Optional[bytes]:
+    """Bytes of a single MODEL ... ENDMDL block, read by offset without parsing the rest of the file."""
+    for m in list_poses(pose_path):
+        if m.model == model:
+            data = read_pose_range(pose_path, m.offset, m.length)
+            if data is None:
+                return None
+            if len(data) == m.length and (m.offset == 0 or data.startswith(b"MODEL")):
+                return data
+            # File changed since it was indexed
+            break
+    else:
+        return None
+    for m in record_poses(pose_path):
+        if m.model == model:
+            return read_pose_range(pose_path, m.offset, m.length)
+    return None
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import re
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional
+
+_RESULT_RE = re.compile(rb"REMARK\s+VINA\s+RESULT:\s*([-+]?\d+(?:\.\d+)?)\s+([-+]?\d+(?:\.\d+)?)\s+([-+]?\d+(?:\.\d+)?)")
+
+
+class PoseModel(NamedTuple):
+    model: int
+    affinity: Optional[float]
+    rmsd_lb: Optional[float]
+    rmsd_ub: Optional[float]
+    offset: int  # byte offset of the MODEL record
+    length: int  # bytes up to and including ENDMDL
+
+
+def iter_pose_models(stream: BinaryIO) -> Iterator[PoseModel]:
+    """
+    Single streaming pass over Vina output PDBQT, yielding every MODEL with its
+    affinity, RMSD bounds and byte span. A file without MODEL records is treated as
+    one model covering the whole file.
+    """
+    pos = 0
+    start: Optional[int] = None
+    number = 0
+    saw_model = False
+    vals: tuple = (None, None, None)
+    for line in stream:
+        if line.startswith(b"MODEL"):
+            saw_model = True
+            start = pos
+            number += 1
+            parts = line.split()
+            if len(parts) > 1 and parts[1].isdigit():
+                number = int(parts[1])
+            vals = (None, None, None)
+        elif line.startswith(b"REMARK") and vals[0] is None:
+            m = _RESULT_RE.match(line)
+            if m:
+                vals = (float(m.group(1)), float(m.group(2)), float(m.group(3)))
+        elif line.startswith(b"ENDMDL") and start is not None:
+            end = pos + len(line)
+            yield PoseModel(number, vals[0], vals[1], vals[2], start, end - start)
+            start = None
+        pos += len(line)
+    if not saw_model and pos > 0:
+        yield PoseModel(1, vals[0], vals[1], vals[2], 0, pos)
+
+
+def parse_pose_file(path: str) -> List[PoseModel]:
+    with open(path, "rb") as f:
+        return list(iter_pose_models(f))
+
+
+def best_affinity(models: List[PoseModel]) -> Optional[float]:
+    scores = [m.affinity for m in models if m.affinity is not None]
+    return min(scores) if scores else None
@@ -0,0 +1,557 @@
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import struct
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.dock_job import DockJob
+from app.models.dock_pose import DockPose
+from app.models.dock_result import DockResult
+from app.models.pipeline_checkpoint import PipelineCheckpoint
+from app.models.pipeline_job import PipelineJob
+from app.models.pose_blob import PoseBlob
+from app.services.cache_utils import atomic_write_bytes, file_lock
+from app.services.settings_provider import settings_provider
+
+try:  # optional, better ratio and faster than gzip; without it packs use gzip
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore[assignment]
+
+POSES_DIR = os.path.join(settings.STORAGE_DIR, "poses")
+PACKS_DIR = os.path.join(POSES_DIR, "packs")
+PACK_PREFIX = "pack://"
+
+_SHARDS = 16
+_MAGIC = b"DGXP"
+# magic, codec id, key length, raw length, payload length
+_HEADER = struct.Struct("<4sBHII")
+_GZIP, _ZSTD = 1, 2
+_CODEC_NAMES = {_GZIP: "gzip", _ZSTD: "zstd"}
+_DEFAULT_PACK_MAX_MB = 512
+_GC_MIN_AGE_S = 3600
+_ORPHAN_LOG_MAX_AGE_S = 30 * 86400
+_COMPACT_DEAD_FRACTION = 0.25
+# A record is indexed just after it is appended; leave recently written packs alone
+_COMPACT_QUIET_S = 300
+_POSE_NAME_RE = re.compile(r"pose_[\w\-]+\.pdbqt")
+_DERIVED_NAME_RE = re.compile(r"(pose_[\w\-]+\.pdbqt)\..+")
+# Funnel refinement inputs, named after the coarse pose they were cut from
+_SEED_NAME_RE = re.compile(r"seed_pose_[\w\-]+\.pdbqt")
+
+
+def store_mode() -> str:
+    val = (settings_provider.resolve("POSE_STORE", "files") or "files").strip().lower()
+    return "pack" if val == "pack" else "files"
+
+
+def is_packed(ref: str) -> bool:
+    return ref.startswith(PACK_PREFIX)
+
+
+def pose_name(ref: str) -> str:
+    """File name of a pose reference, for either backend (also normalises Windows paths)."""
+    if is_packed(ref):
+        return ref[len(PACK_PREFIX):]
+    return re.split(r"[\\/]", ref)[-1]
+
+
+def _pack_max_bytes() -> int:
+    try:
+        mb = float(settings_provider.resolve("POSE_PACK_MAX_MB", str(_DEFAULT_PACK_MAX_MB)))  # type: ignore[arg-type]
+    except Exception:
+        mb = float(_DEFAULT_PACK_MAX_MB)
+    return int(mb * 1024 * 1024)
+
+
+def _compress(data: bytes) -> Tuple[int, bytes]:
+    if zstandard is not None:
+        return _ZSTD, zstandard.ZstdCompressor(level=9).compress(data)
+    return _GZIP, gzip.compress(data, compresslevel=6)
+
+
+def _decompress(codec: int, payload: bytes) -> bytes:
+    if codec == _ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Pose record is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return gzip.decompress(payload)
+
+
+def _shard(key: str) -> int:
+    return int(hashlib.sha1(key.encode("utf-8")).hexdigest()[:8], 16) % _SHARDS
+
+
+def _lock_path(shard: int) -> str:
+    return os.path.join(PACKS_DIR, f"{shard:02x}.lock")
+
+
+def _shard_packs(shard: int) -> List[Tuple[int, str]]:
+    """(generation, file name) of a shard's packs, oldest first."""
+    out: List[Tuple[int, str]] = []
+    if not os.path.isdir(PACKS_DIR):
+        return out
+    prefix = f"{shard:02x}-"
+    for name in os.listdir(PACKS_DIR):
+        if name.startswith(prefix) and name.endswith(".pack"):
+            try:
+                out.append((int(name[len(prefix):-5]), name))
+            except ValueError:
+                continue
+    return sorted(out)
+
+
+def _active_pack(shard: int) -> str:
+    # Caller holds the shard lock
+    packs = _shard_packs(shard)
+    if not packs:
+        return f"{shard:02x}-0000.pack"
+    gen, name = packs[-1]
+    if os.path.getsize(os.path.join(PACKS_DIR, name)) >= _pack_max_bytes():
+        return f"{shard:02x}-{gen + 1:04d}.pack"
+    return name
+
+
+def _append(key: str, data: bytes) -> Dict[str, Any]:
+    codec, payload = _compress(data)
+    kb = key.encode("utf-8")
+    shard = _shard(key)
+    os.makedirs(PACKS_DIR, exist_ok=True)
+    with file_lock(_lock_path(shard)):
+        name = _active_pack(shard)
+        with open(os.path.join(PACKS_DIR, name), "ab") as f:
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            f.write(_HEADER.pack(_MAGIC, codec, len(kb), len(data), len(payload)))
+            f.write(kb)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+    return {
+        "pack": name,
+        "offset": offset,
+        "length": len(payload),
+        "raw_length": len(data),
+        "codec": _CODEC_NAMES[codec],
+    }
+
+
+def put_bytes(key: str, data: bytes, kind: str = "pose", parent: Optional[str] = None) -> str:
+    """Append a record to its shard pack and point the index at it. Re-putting a key supersedes the old record."""
+    loc = _append(key, data)
+    for attempt in range(2):
+        db = SessionLocal()
+        try:
+            row = db.query(PoseBlob).filter(PoseBlob.key == key).first()
+            if row is None:
+                row = PoseBlob(key=key)
+                db.add(row)
+            row.kind = kind
+            row.parent = parent
+            for k, v in loc.items():
+                setattr(row, k, v)
+            db.commit()
+            break
+        except IntegrityError:
+            # Concurrent first insert of the same key; update the winner's row instead
+            db.rollback()
+            if attempt:
+                raise
+        finally:
+            db.close()
+    return PACK_PREFIX + key
+
+
+def _put_file(path: str, kind: str, parent: Optional[str] = None) -> str:
+    with open(path, "rb") as f:
+        ref = put_bytes(os.path.basename(path), f.read(), kind=kind, parent=parent)
+    os.remove(path)
+    return ref
+
+
+def finalize_pose(pose_path: str, log_path: Optional[str] = None) -> str:
+    """
+    Hand a freshly written pose (and its Vina log) to the configured store and return
+    the reference to persist in pose_path columns: a CWD-relative path for "files",
+    ``pack://<name>`` for "pack" (the loose files are removed).
+    """
+    if store_mode() != "pack":
+        return os.path.relpath(pose_path, start=os.getcwd())
+    ref = _put_file(pose_path, "pose")
+    if log_path and os.path.exists(log_path):
+        _put_file(log_path, "log", parent=os.path.basename(pose_path))
+    return ref
+
+
+def store_log(log_path: str) -> None:
+    """Keep a log that belongs to no single pose (e.g. a Vina --batch run)."""
+    if store_mode() == "pack" and os.path.exists(log_path):
+        _put_file(log_path, "log")
+
+
+def _derived_name(ref: str, suffix: str) -> str:
+    return f"{pose_name(ref)}.{suffix}"
+
+
+def read_derived(ref: str, suffix: str) -> Optional[bytes]:
+    """A file derived from a pose (e.g. an SDF conversion), stored alongside it."""
+    if is_packed(ref):
+        return _read_packed(_derived_name(ref, suffix))
+    path = os.path.join(os.path.dirname(os.path.abspath(ref)), _derived_name(ref, suffix))
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def write_derived(ref: str, suffix: str, data: bytes) -> None:
+    if is_packed(ref):
+        put_bytes(_derived_name(ref, suffix), data, kind="derived", parent=pose_name(ref))
+        return
+    atomic_write_bytes(os.path.join(os.path.dirname(os.path.abspath(ref)), _derived_name(ref, suffix)), data)
+
+
+def _read_record(row: PoseBlob) -> Optional[bytes]:
+    with open(os.path.join(PACKS_DIR, row.pack), "rb") as f:
+        f.seek(row.offset)
+        head = f.read(_HEADER.size)
+        if len(head) < _HEADER.size:
+            return None
+        magic, codec, klen, _raw_len, plen = _HEADER.unpack(head)
+        if magic != _MAGIC or plen != row.length or f.read(klen).decode("utf-8", errors="replace") != row.key:
+            return None
+        return _decompress(codec, f.read(plen))
+
+
+def _read_packed(key: str) -> Optional[bytes]:
+    # A compaction may move the record between the index lookup and the read; retry once
+    for _ in range(2):
+        db = SessionLocal()
+        try:
+            row = db.query(PoseBlob).filter(PoseBlob.key == key).first()
+        finally:
+            db.close()
+        if row is None:
+            return None
+        try:
+            data = _read_record(row)
+        except FileNotFoundError:
+            data = None
+        if data is not None:
+            return data
+    return None
+
+
+def read_pose(ref: str) -> Optional[bytes]:
+    if is_packed(ref):
+        return _read_packed(pose_name(ref))
+    try:
+        with open(os.path.abspath(ref), "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def read_pose_range(ref: str, offset: int, length: int) -> Optional[bytes]:
+    if is_packed(ref):
+        # Records are compressed as a unit; poses are small so decompress and slice
+        data = read_pose(ref)
+        return None if data is None else data[offset:offset + length]
+    try:
+        with open(os.path.abspath(ref), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+    except OSError:
+        return None
+
+
+def pose_exists(ref: str) -> bool:
+    if not is_packed(ref):
+        return os.path.exists(os.path.abspath(ref))
+    db = SessionLocal()
+    try:
+        row = db.query(PoseBlob.pack).filter(PoseBlob.key == pose_name(ref)).first()
+    finally:
+        db.close()
+    return row is not None and os.path.exists(os.path.join(PACKS_DIR, row[0]))
+
+
+def _live_pose_names(db) -> Set[str]:
+    """
+    Poses referenced by a dock job, pipeline result or checkpoint. Memoised docking
+    results are weak references: they do not keep a pose alive.
+    """
+    live: Set[str] = set()
+    for (ref,) in db.query(DockJob.pose_path).filter(DockJob.pose_path.isnot(None)):
+        live.add(pose_name(ref))
+    for (text,) in db.query(PipelineJob.results).filter(PipelineJob.results.isnot(None)):
+        live.update(_POSE_NAME_RE.findall(text))
+    # Docked-molecule checkpoints of interrupted jobs, reused on resume
+    for (text,) in db.query(PipelineCheckpoint.data).filter(PipelineCheckpoint.data.isnot(None)):
+        live.update(_POSE_NAME_RE.findall(text))
+    return live
+
+
+def _record_bytes(row: PoseBlob) -> int:
+    return _HEADER.size + len(row.key.encode("utf-8")) + int(row.length)
+
+
+def _compact(db) -> int:
+    """Rewrite packs whose dead fraction is high; returns bytes reclaimed."""
+    reclaimed = 0
+    for shard in range(_SHARDS):
+        if not _shard_packs(shard):
+            continue
+        with file_lock(_lock_path(shard)):
+            packs = _shard_packs(shard)
+            next_gen = packs[-1][0] + 1 if packs else 0
+            for _gen, name in packs:
+                path = os.path.join(PACKS_DIR, name)
+                if time.time() - os.path.getmtime(path) < _COMPACT_QUIET_S:
+                    continue
+                size = os.path.getsize(path)
+                rows = db.query(PoseBlob).filter(PoseBlob.pack == name).order_by(PoseBlob.offset).all()
+                live = sum(_record_bytes(r) for r in rows)
+                if size == 0 or (size - live) / size < _COMPACT_DEAD_FRACTION:
+                    continue
+                if rows:
+                    new_name = f"{shard:02x}-{next_gen:04d}.pack"
+                    next_gen += 1
+                    with open(path, "rb") as src, open(os.path.join(PACKS_DIR, new_name), "wb") as dst:
+                        for r in rows:
+                            src.seek(r.offset)
+                            rec = src.read(_record_bytes(r))
+                            r.offset = dst.tell()
+                            r.pack = new_name
+                            dst.write(rec)
+                        dst.flush()
+                        os.fsync(dst.fileno())
+                    db.commit()
+                os.remove(path)
+                reclaimed += size - live
+    return reclaimed
+
+
+def gc(min_age_s: float = _GC_MIN_AGE_S, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Remove poses no longer referenced by a dock job, pipeline result or checkpoint,
+    together with their logs, pose table rows and the memoised docking results that
+    point at them, then compact packs. Poses younger than ``min_age_s`` are kept so
+    in-flight docks are not collected before their job row is written.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=min_age_s)
+    db = SessionLocal()
+    try:
+        live = _live_pose_names(db)
+        dead_blobs = [
+            r for r in db.query(PoseBlob).filter(PoseBlob.kind == "pose", PoseBlob.created_at < cutoff)
+            if r.key not in live
+        ]
+        dead: Set[str] = {r.key for r in dead_blobs}
+        # Logs and derived files (e.g. cached SDF) go with their pose
+        dead_logs = [
+            r for r in db.query(PoseBlob).filter(PoseBlob.kind != "pose", PoseBlob.parent.isnot(None))
+            if r.parent in dead
+        ]
+        orphan_cutoff = datetime.utcnow() - timedelta(seconds=_ORPHAN_LOG_MAX_AGE_S)
+        dead_logs += db.query(PoseBlob).filter(
+            PoseBlob.kind == "log", PoseBlob.parent.is_(None), PoseBlob.created_at < orphan_cutoff
+        ).all()
+
+        dead_files: List[str] = []
+        if os.path.isdir(POSES_DIR):
+            now = time.time()
+            entries = os.listdir(POSES_DIR)
+            derived: Dict[str, List[str]] = {}
+            for name in entries:
+                m = _DERIVED_NAME_RE.fullmatch(name)
+                if m:
+                    derived.setdefault(m.group(1), []).append(name)
+            for name in entries:
+                if _SEED_NAME_RE.fullmatch(name):
+                    # Leftover funnel refinement input, only needed while its fine stage runs
+                    path = os.path.join(POSES_DIR, name)
+                    if now - os.path.getmtime(path) >= min_age_s:
+                        dead_files.append(path)
+                    continue
+                if not _POSE_NAME_RE.fullmatch(name) or name in live:
+                    continue
+                path = os.path.join(POSES_DIR, name)
+                if now - os.path.getmtime(path) < min_age_s:
+                    continue
+                dead.add(name)
+                stem = name[len("pose_"):-len(".pdbqt")]
+                for extra in (name, f"vina_{stem}.log", *derived.get(name, [])):
+                    if os.path.exists(os.path.join(POSES_DIR, extra)):
+                        dead_files.append(os.path.join(POSES_DIR, extra))
+
+        dead_memo = [row for row in db.query(DockResult) if pose_name(row.pose_path) in dead]
+        result: Dict[str, Any] = {
+            "poses_removed": len(dead),
+            "memo_removed": len(dead_memo),
+            "logs_removed": len(dead_logs),
+            "files_removed": len(dead_files),
+            "bytes_reclaimed": 0,
+            "dry_run": dry_run,
+        }
+        if dry_run:
+            return result
+
+        for r in dead_blobs + dead_logs:
+            db.delete(r)
+        for (ref,) in db.query(DockPose.pose_path).distinct():
+            if pose_name(ref) in dead:
+                db.query(DockPose).filter(DockPose.pose_path == ref).delete(synchronize_session=False)
+        for row in dead_memo:
+            db.delete(row)
+        db.commit()
+        for path in dead_files:
+            try:
+                result["bytes_reclaimed"] += os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                continue
+        result["bytes_reclaimed"] += _compact(db)
+        return result
+    finally:
+        db.close()
+
+
+def _rewrite_pipeline_refs(node: Any, mapping: Dict[str, str]) -> Any:
+    if isinstance(node, dict):
+        out = {k: _rewrite_pipeline_refs(v, mapping) for k, v in node.items()}
+        ref = out.get("pose_path")
+        if isinstance(ref, str) and pose_name(ref) in mapping:
+            out["pose_path"] = mapping[pose_name(ref)]
+        return out
+    if isinstance(node, list):
+        return [_rewrite_pipeline_refs(v, mapping) for v in node]
+    return node
+
+
+def migrate(keep_files: bool = False) -> Dict[str, Any]:
+    """
+    Move loose pose and log files from POSES_DIR into packs and repoint every stored
+    reference (dock jobs, memoised results, pose table, pipeline summaries). Loose files
+    are deleted only after all references are rewritten, so an interrupted run can
+    simply be repeated.
+    """
+    if not os.path.isdir(POSES_DIR):
+        return {"poses": 0, "logs": 0}
+    names = sorted(n for n in os.listdir(POSES_DIR) if _POSE_NAME_RE.fullmatch(n))
+    mapping: Dict[str, str] = {}
+    moved: List[str] = []
+    logs = 0
+    for name in names:
+        path = os.path.join(POSES_DIR, name)
+        with open(path, "rb") as f:
+            mapping[name] = put_bytes(name, f.read(), kind="pose")
+        moved.append(path)
+        log_path = os.path.join(POSES_DIR, f"vina_{name[len('pose_'):-len('.pdbqt')]}.log")
+        if os.path.exists(log_path):
+            with open(log_path, "rb") as f:
+                put_bytes(os.path.basename(log_path), f.read(), kind="log", parent=name)
+            moved.append(log_path)
+            logs += 1
+    # Remaining logs (e.g. from --batch runs) are kept without a parent pose;
+    # cached conversions are simply regenerated on demand
+    moved_set = set(moved)
+    for name in sorted(os.listdir(POSES_DIR)):
+        m = _DERIVED_NAME_RE.fullmatch(name)
+        if m and m.group(1) in mapping:
+            moved.append(os.path.join(POSES_DIR, name))
+    for name in sorted(os.listdir(POSES_DIR)):
+        path = os.path.join(POSES_DIR, name)
+        if name.startswith("vina_") and name.endswith(".log") and path not in moved_set:
+            with open(path, "rb") as f:
+                put_bytes(name, f.read(), kind="log")
+            moved.append(path)
+            logs += 1
+
+    db = SessionLocal()
+    try:
+        for model in (DockJob, DockResult, DockPose):
+            updates = [
+                {"id": row_id, "pose_path": mapping[pose_name(ref)]}
+                for row_id, ref in db.query(model.id, model.pose_path).filter(model.pose_path.isnot(None))
+                if not is_packed(ref) and pose_name(ref) in mapping
+            ]
+            if updates:
+                db.bulk_update_mappings(model, updates)
+        for job in db.query(PipelineJob).filter(PipelineJob.results.isnot(None)):
+            try:
+                data = json.loads(job.results)
+            except ValueError:
+                continue
+            rewritten = _rewrite_pipeline_refs(data, mapping)
+            if rewritten != data:
+                job.results = json.dumps(rewritten)
+        db.commit()
+    finally:
+        db.close()
+
+    if not keep_files:
+        for path in moved:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return {"poses": len(mapping), "logs": logs, "files_removed": 0 if keep_files else len(moved)}
+
+
+def store_info() -> Dict[str, Any]:
+    packs = []
+    if os.path.isdir(PACKS_DIR):
+        packs = [n for n in os.listdir(PACKS_DIR) if n.endswith(".pack")]
+    db = SessionLocal()
+    try:
+        records = db.query(PoseBlob).count()
+    finally:
+        db.close()
+    return {
+        "mode": store_mode(),
+        "codec": "zstd" if zstandard is not None else "gzip",
+        "packs": len(packs),
+        "pack_bytes": sum(os.path.getsize(os.path.join(PACKS_DIR, n)) for n in packs),
+        "records": records,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.services.pose_store", description="Pose pack maintenance")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_mig = sub.add_parser("migrate", help="move loose pose/log files into packs")
+    p_mig.add_argument("--keep-files", action="store_true", help="leave the loose files in place")
+    p_gc = sub.add_parser("gc", help="remove unreferenced poses and compact packs")
+    p_gc.add_argument("--min-age", type=float, default=_GC_MIN_AGE_S, help="seconds; younger poses are kept")
+    p_gc.add_argument("--dry-run", action="store_true")
+    sub.add_parser("info", help="show pack statistics")
+    args = parser.parse_args(argv)
+
+    from app.db.base import Base
+    from app.db.session import engine
+
+    Base.metadata.create_all(bind=engine)
+    if args.cmd == "migrate":
+        result = migrate(keep_files=args.keep_files)
+    elif args.cmd == "gc":
+        result = gc(min_age_s=args.min_age, dry_run=args.dry_run)
+    else:
+        result = store_info()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
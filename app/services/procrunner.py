@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import threading
+from typing import Callable, List, NamedTuple, Optional
+
+OutputCallback = Callable[[str], None]
+
+_KILL_GRACE_S = 3.0
+_CANCEL_POLL_S = 0.2
+_CHUNK = 4096
+
+
+class ProcessResult(NamedTuple):
+    returncode: int
+    stdout: str
+    stderr: str
+
+
+class ProcessTimeout(RuntimeError):
+    pass
+
+
+class ProcessCancelled(RuntimeError):
+    pass
+
+
+def _spawn_kwargs() -> dict:
+    # Own process group so a kill also reaches children (e.g. obabel plugins, vina threads)
+    if sys.platform == "win32":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def _kill_group(proc: asyncio.subprocess.Process, sig: int) -> None:
+    if proc.returncode is not None:
+        return
+    try:
+        if sys.platform == "win32":
+            if sig == signal.SIGTERM:
+                proc.terminate()
+            else:
+                subprocess.run(["taskkill", "/T", "/F", "/PID", str(proc.pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            os.killpg(proc.pid, sig)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+
+async def _terminate(proc: asyncio.subprocess.Process) -> None:
+    _kill_group(proc, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(proc.wait(), timeout=_KILL_GRACE_S)
+    except asyncio.TimeoutError:
+        _kill_group(proc, getattr(signal, "SIGKILL", signal.SIGTERM))
+        await proc.wait()
+
+
+async def _pump(stream: Optional[asyncio.StreamReader], sink: List[str], on_output: Optional[OutputCallback]) -> None:
+    if stream is None:
+        return
+    # Read raw chunks rather than lines: Vina's progress bar is written without newlines
+    while True:
+        data = await stream.read(_CHUNK)
+        if not data:
+            break
+        text = data.decode("utf-8", errors="replace")
+        sink.append(text)
+        if on_output is not None:
+            try:
+                on_output(text)
+            except Exception:
+                pass
+
+
+async def run_process(
+    cmd: List[str],
+    timeout: Optional[float] = None,
+    on_output: Optional[OutputCallback] = None,
+    cancel_event: Optional[threading.Event] = None,
+    cwd: Optional[str] = None,
+) -> ProcessResult:
+    """
+    Run an external tool with a wall-clock timeout and cooperative cancellation.
+    stdout is streamed to ``on_output`` as it arrives. On timeout, cancellation (via
+    ``cancel_event`` or task cancellation) the whole process group is terminated.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, cwd=cwd, **_spawn_kwargs()
+    )
+    out: List[str] = []
+    err: List[str] = []
+
+    async def _watch_cancel() -> None:
+        while cancel_event is not None and not cancel_event.is_set():
+            await asyncio.sleep(_CANCEL_POLL_S)
+
+    io_task = asyncio.gather(_pump(proc.stdout, out, on_output), _pump(proc.stderr, err, None), proc.wait())
+    waiters = {asyncio.ensure_future(io_task)}
+    cancel_task = asyncio.ensure_future(_watch_cancel()) if cancel_event is not None else None
+    if cancel_task is not None:
+        waiters.add(cancel_task)
+    try:
+        done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            await _terminate(proc)
+            raise ProcessTimeout(f"{os.path.basename(cmd[0])} timed out after {timeout:g}s")
+        if cancel_task is not None and cancel_task in done:
+            await _terminate(proc)
+            raise ProcessCancelled(f"{os.path.basename(cmd[0])} was cancelled")
+    except asyncio.CancelledError:
+        await _terminate(proc)
+        raise
+    finally:
+        if cancel_task is not None:
+            cancel_task.cancel()
+        for w in waiters:
+            if not w.done():
+                w.cancel()
+    return ProcessResult(proc.returncode or 0, "".join(out), "".join(err))
+
+
+def run_process_sync(
+    cmd: List[str],
+    timeout: Optional[float] = None,
+    on_output: Optional[OutputCallback] = None,
+    cancel_event: Optional[threading.Event] = None,
+    cwd: Optional[str] = None,
+) -> ProcessResult:
+    """Blocking wrapper around run_process, usable from worker threads and from code already inside an event loop."""
+    coro_args = (cmd, timeout, on_output, cancel_event, cwd)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(run_process(*coro_args))
+
+    # Called from within a running loop's thread: run on a private loop in a helper thread
+    box: dict = {}
+
+    def _target() -> None:
+        try:
+            box["result"] = asyncio.run(run_process(*coro_args))
+        except BaseException as e:  # re-raised in the caller's thread
+            box["error"] = e
+
+    t = threading.Thread(target=_target, daemon=True)
+    t.start()
+    t.join()
+    if "error" in box:
+        raise box["error"]
+    return box["result"]
+
+
+class VinaProgress:
+    """
+    Turns Vina's console progress bar into a 0..1 fraction. Vina prints a ruler
+    (``|----|----|...``) followed by up to 51 ``*`` characters as the search advances;
+    in batch mode the bar repeats per ligand.
+    """
+
+    STARS = 51
+
+    def __init__(self, on_progress: Callable[[float], None]) -> None:
+        self._on_progress = on_progress
+        self._stars = 0
+        self._armed = False
+        self._last = -1.0
+
+    def feed(self, text: str) -> None:
+        for ch in text:
+            if ch == "|":
+                # Start of a new ruler: the next run of stars belongs to a fresh search
+                if not self._armed:
+                    self._stars = 0
+                self._armed = True
+            elif ch == "*" and self._armed:
+                self._stars += 1
+            elif ch == "\n" and self._stars:
+                self._armed = False
+        frac = min(1.0, self._stars / float(self.STARS))
+        if frac != self._last:
+            self._last = frac
+            self._on_progress(frac)
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.pipeline_job import PipelineJob
+from app.services.settings_provider import settings_provider
+
+_DEFAULT_FLUSH_MS = 1000
+# Fields whose change is flushed immediately rather than on the timer
+_IMMEDIATE = ("status", "current_step", "results")
+_FIELDS = ("id", "user_id", "protein_id", "status", "current_step", "strategy", "progress", "message", "results", "created_at")
+
+_subs_lock = Lock()
+_subscribers: Dict[int, List[Tuple[asyncio.AbstractEventLoop, "asyncio.Queue[Dict[str, Any]]"]]] = {}
+_live: Dict[int, Dict[str, Any]] = {}
+
+
+def _flush_interval_s() -> float:
+    try:
+        ms = float(settings_provider.resolve("PROGRESS_FLUSH_MS", str(_DEFAULT_FLUSH_MS)))  # type: ignore[arg-type]
+    except Exception:
+        ms = float(_DEFAULT_FLUSH_MS)
+    return max(0.0, ms) / 1000.0
+
+
+def subscribe(job_id: int) -> Tuple[Optional[Dict[str, Any]], "asyncio.Queue[Dict[str, Any]]"]:
+    """
+    Register the running event loop for ticks of ``job_id``. Returns the latest
+    snapshot (None if the job is not running in this process) and the queue ticks
+    will arrive on.
+    """
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    with _subs_lock:
+        _subscribers.setdefault(job_id, []).append((loop, queue))
+        return (dict(_live[job_id]) if job_id in _live else None), queue
+
+
+def unsubscribe(job_id: int, queue: "asyncio.Queue[Dict[str, Any]]") -> None:
+    with _subs_lock:
+        subs = [s for s in _subscribers.get(job_id, []) if s[1] is not queue]
+        if subs:
+            _subscribers[job_id] = subs
+        else:
+            _subscribers.pop(job_id, None)
+
+
+def _publish(job_id: int, snapshot: Dict[str, Any]) -> None:
+    with _subs_lock:
+        _live[job_id] = snapshot
+        subs = list(_subscribers.get(job_id, []))
+    for loop, queue in subs:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, snapshot)
+        except RuntimeError:
+            # Subscriber's loop has closed
+            unsubscribe(job_id, queue)
+
+
+class ProgressReporter:
+    """
+    Progress for one PipelineJob kept in memory and written to its row at most every
+    PROGRESS_FLUSH_MS (default 1000), or at once when the status, step or results
+    change. Every tick is also pushed to in-process subscribers (the SSE stream)
+    without a database round trip.
+    """
+
+    def __init__(self, db: Session, job: PipelineJob, min_interval_s: Optional[float] = None) -> None:
+        self._db = db
+        self._job = job
+        self._interval = _flush_interval_s() if min_interval_s is None else min_interval_s
+        self._lock = Lock()
+        self._state: Dict[str, Any] = {f: getattr(job, f) for f in _FIELDS}
+        self._dirty: Dict[str, Any] = {}
+        self._last_flush = 0.0
+
+    @property
+    def state(self) -> Dict[str, Any]:
+        return dict(self._state)
+
+    def update(self, **fields: Any) -> None:
+        with self._lock:
+            immediate = any(k in _IMMEDIATE and self._state.get(k) != v for k, v in fields.items())
+            self._state.update(fields)
+            self._dirty.update(fields)
+            snapshot = dict(self._state)
+            due = immediate or time.monotonic() - self._last_flush >= self._interval
+            if due:
+                self._flush_locked()
+        _publish(self._job.id, snapshot)
+        if snapshot.get("status") in ("completed", "failed"):
+            with _subs_lock:
+                _live.pop(self._job.id, None)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if self._dirty:
+            for k, v in self._dirty.items():
+                setattr(self._job, k, v)
+            self._db.commit()
+            self._dirty = {}
+        self._last_flush = time.monotonic()
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, Optional
+
+from app.services.cache_utils import (
+    CACHE_DIR,
+    CacheStats,
+    file_sha256,
+    options_digest,
+    temp_path_for,
+)
+from app.services.settings_provider import settings_provider
+
+RECEPTOR_CACHE_DIR = os.path.join(CACHE_DIR, "receptors")
+
+# Bump when the preparation recipe changes so stale entries are never reused
+_PREP_VERSION = "1"
+
+stats = CacheStats()
+
+
+def _as_bool(val: Optional[str], default: bool) -> bool:
+    if val is None:
+        return default
+    return str(val).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _as_ph(val: Any) -> Optional[float]:
+    if val is None or val == "":
+        return None
+    try:
+        return float(val)
+    except Exception:
+        return None
+
+
+def default_options() -> Dict[str, Any]:
+    return {
+        "remove_waters": _as_bool(settings_provider.resolve("RECEPTOR_REMOVE_WATERS"), True),
+        "add_hydrogens": _as_bool(settings_provider.resolve("RECEPTOR_ADD_HYDROGENS"), True),
+        "ph": _as_ph(settings_provider.resolve("RECEPTOR_PH")),
+    }
+
+
+def receptor_cache_key(
+    protein_path: str,
+    remove_waters: bool = True,
+    add_hydrogens: bool = True,
+    ph: Optional[float] = None,
+) -> str:
+    content = file_sha256(protein_path)
+    ext = os.path.splitext(protein_path)[1].lower()
+    opts = options_digest(_PREP_VERSION, ext, int(remove_waters), int(add_hydrogens), ph)
+    return f"{content}_{opts}"
+
+
+def receptor_cache_path(key: str) -> str:
+    return os.path.join(RECEPTOR_CACHE_DIR, f"{key}.pdbqt")
+
+
+def get_or_prepare_receptor(
+    protein_path: str,
+    remove_waters: Optional[bool] = None,
+    add_hydrogens: Optional[bool] = None,
+    ph: Optional[float] = None,
+) -> str:
+    """
+    Return the path of a prepared receptor PDBQT for this protein file, preparing it
+    only when no entry exists for (file contents, preparation options).
+    Concurrent writers each prepare into a private temp file and atomically rename it
+    into place, so readers never observe a partially written receptor.
+    """
+    # Local import: vina imports this module for its docking entry point
+    from app.services.vina import prepare_receptor_pdbqt_from_protein
+
+    opts = default_options()
+    if remove_waters is not None:
+        opts["remove_waters"] = remove_waters
+    if add_hydrogens is not None:
+        opts["add_hydrogens"] = add_hydrogens
+    if ph is not None:
+        opts["ph"] = ph
+
+    protein_abs = os.path.abspath(protein_path)
+    key = receptor_cache_key(protein_abs, **opts)
+    final_path = receptor_cache_path(key)
+    if os.path.exists(final_path) and os.path.getsize(final_path) > 0:
+        stats.hit()
+        return final_path
+
+    stats.miss()
+    os.makedirs(RECEPTOR_CACHE_DIR, exist_ok=True)
+    tmp = temp_path_for(final_path)
+    try:
+        prepare_receptor_pdbqt_from_protein(protein_abs, tmp, **opts)
+        if not os.path.exists(tmp) or os.path.getsize(tmp) == 0:
+            raise RuntimeError("Receptor preparation produced an empty PDBQT")
+        os.replace(tmp, final_path)
+    finally:
+        if os.path.exists(tmp):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+    return final_path
+
+
+def invalidate(protein_path: Optional[str] = None) -> int:
+    """
+    Remove cached receptors for one protein file (all option variants), or every
+    cached receptor when no path is given. Returns the number of entries removed.
+    """
+    if not os.path.isdir(RECEPTOR_CACHE_DIR):
+        return 0
+    prefix = None
+    if protein_path is not None:
+        if not os.path.exists(protein_path):
+            return 0
+        prefix = file_sha256(protein_path) + "_"
+    removed = 0
+    for name in os.listdir(RECEPTOR_CACHE_DIR):
+        if not name.endswith(".pdbqt") or name.startswith("."):
+            continue
+        if prefix is not None and not name.startswith(prefix):
+            continue
+        try:
+            os.remove(os.path.join(RECEPTOR_CACHE_DIR, name))
+            removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
+
+
+def cache_info() -> Dict[str, Any]:
+    entries = 0
+    total_bytes = 0
+    if os.path.isdir(RECEPTOR_CACHE_DIR):
+        for name in os.listdir(RECEPTOR_CACHE_DIR):
+            if not name.endswith(".pdbqt") or name.startswith("."):
+                continue
+            try:
+                total_bytes += os.path.getsize(os.path.join(RECEPTOR_CACHE_DIR, name))
+                entries += 1
+            except OSError:
+                continue
+    return {**stats.as_dict(), "entries": entries, "bytes": total_bytes}
@@ -1,6 +1,8 @@
 from __future__ import annotations
+import os
 from typing import Optional, Dict
 from threading import RLock
+from app.core.config import settings
 from app.db.session import SessionLocal
 from app.services.settings import get_setting
 
@@ -14,6 +16,7 @@ class SettingsProvider:
         "QDRANT_COLLECTION",
         "CHEMBERT_MODEL",
         "VINA_PATH",
+        "VINA_BACKEND",
         "VINA_EXHAUSTIVENESS",
         "VINA_CENTER",
         "VINA_SIZE",
@@ -22,12 +25,19 @@ class SettingsProvider:
     @classmethod
     def get(cls, key: str, default: Optional[str] = None) -> Optional[str]:
         with cls._lock:
-            if key in cls._cache:
-                return cls._cache[key]
-        # lazy load if not cached
-        cls.reload(keys=[key])
-        with cls._lock:
-            return cls._cache.get(key, default)
+            if key not in cls._cache:
+                # lazy load if not cached; unset keys are cached as None so they are read once
+                cls.reload(keys=[key])
+            val = cls._cache.get(key)
+        return default if val is None else val
+
+    @classmethod
+    def resolve(cls, key: str, default: Optional[str] = None) -> Optional[str]:
+        # Preference: DB setting -> env -> .env/pydantic settings -> default
+        val = cls.get(key) or os.environ.get(key) or getattr(settings, key, None)
+        if val is None or val == "":
+            return default
+        return str(val)
 
     @classmethod
     def reload(cls, keys: Optional[list[str]] = None) -> None:
@@ -36,9 +46,7 @@ class SettingsProvider:
             try:
                 target_keys = keys or list(cls.IMPORTANT_KEYS)
                 for k in target_keys:
-                    val = get_setting(db, k, None)
-                    if val is not None:
-                        cls._cache[k] = val
+                    cls._cache[k] = get_setting(db, k, None)
             finally:
                 db.close()
 
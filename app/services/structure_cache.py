@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import io
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from app.services.cache_utils import CACHE_DIR, CacheStats, atomic_write_bytes, file_sha256
+from app.services.settings_provider import settings_provider
+
+STRUCTURE_CACHE_DIR = os.path.join(CACHE_DIR, "structures")
+
+# Bump when the stored arrays change
+_FORMAT_VERSION = "1"
+_DEFAULT_MAX_ENTRIES = 8
+
+stats = CacheStats()
+
+_lock = Lock()
+# content digest -> parsed structure, least recently used first
+_lru: "OrderedDict[str, Structure]" = OrderedDict()
+
+
+class SpatialIndex:
+    """KD-tree over atom coordinates (scipy ``cKDTree``) for box and radius queries."""
+
+    def __init__(self, coords: np.ndarray) -> None:
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        self.tree: Optional[cKDTree] = cKDTree(self.coords) if len(self.coords) else None
+
+    def atoms_in_box(self, lo: Iterable[float], hi: Iterable[float]) -> np.ndarray:
+        """Sorted indices of atoms inside the box [lo, hi]."""
+        lo_a = np.asarray(list(lo), dtype=np.float64)
+        hi_a = np.asarray(list(hi), dtype=np.float64)
+        if self.tree is None:
+            return np.zeros(0, dtype=np.int64)
+        # Chebyshev ball around the box centre covers the box; trim the excess per axis
+        idx = np.asarray(
+            self.tree.query_ball_point((lo_a + hi_a) / 2.0, float((hi_a - lo_a).max()) / 2.0, p=np.inf),
+            dtype=np.int64,
+        )
+        pts = self.coords[idx]
+        return np.sort(idx[np.all((pts >= lo_a) & (pts <= hi_a), axis=1)])
+
+    def atoms_near(self, points: np.ndarray, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Atoms within ``radius`` of any of ``points`` (M, 3): (atom indices, distance to the nearest point)."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if self.tree is None or not len(points):
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        hits = self.tree.query_ball_point(points, radius)
+        idx = np.unique(np.concatenate([np.asarray(h, dtype=np.int64) for h in hits]))
+        if not len(idx):
+            return idx, np.zeros(0)
+        dist, _ = cKDTree(points).query(self.coords[idx])
+        return idx, np.asarray(dist, dtype=np.float64)
+
+
+class Structure:
+    """
+    A protein parsed into flat NumPy arrays. Atoms are in file order (every model,
+    chain and residue, as gemmi walks them); per-residue arrays are indexed by
+    ``atom_residue``.
+    """
+
+    __slots__ = (
+        "coords", "atom_residue", "atom_names", "elements",
+        "residue_name", "residue_chain", "residue_seq", "residue_icode", "residue_het",
+        "names", "chains", "_het_atoms", "_index",
+    )
+
+    def __init__(self, arrays: Dict[str, np.ndarray]) -> None:
+        self.coords: np.ndarray = arrays["coords"]  # (N, 3) float32
+        self.atom_residue: np.ndarray = arrays["atom_residue"]  # (N,) int32
+        self.atom_names: np.ndarray = arrays["atom_names"]  # (N,) str
+        self.elements: np.ndarray = arrays["elements"]  # (N,) str
+        self.residue_name: np.ndarray = arrays["residue_name"]  # (R,) int32 code into ``names``
+        self.residue_chain: np.ndarray = arrays["residue_chain"]  # (R,) int32 code into ``chains``
+        self.residue_seq: np.ndarray = arrays["residue_seq"]  # (R,) int32
+        self.residue_icode: np.ndarray = arrays["residue_icode"]  # (R,) str
+        self.residue_het: np.ndarray = arrays["residue_het"]  # (R,) bool, HETATM records
+        self.names: np.ndarray = arrays["names"]  # residue name vocabulary
+        self.chains: np.ndarray = arrays["chains"]  # chain name vocabulary
+        self._het_atoms: Optional[np.ndarray] = None
+        self._index: Optional[SpatialIndex] = None
+
+    @property
+    def n_atoms(self) -> int:
+        return int(self.coords.shape[0])
+
+    @property
+    def n_residues(self) -> int:
+        return int(self.residue_name.shape[0])
+
+    @property
+    def het_atoms(self) -> np.ndarray:
+        """Per-atom mask of HETATM records."""
+        if self._het_atoms is None:
+            self._het_atoms = self.residue_het[self.atom_residue]
+        return self._het_atoms
+
+    @property
+    def index(self) -> SpatialIndex:
+        """KD-tree over all atoms, built on first use and kept with the cached structure."""
+        if self._index is None:
+            self._index = SpatialIndex(self.coords)
+        return self._index
+
+    def residues_in_box(self, center: Iterable[float], size: Iterable[float]) -> np.ndarray:
+        """Sorted indices of residues with at least one atom inside the box."""
+        c = np.asarray(list(center), dtype=np.float64)
+        half = np.asarray(list(size), dtype=np.float64) / 2.0
+        return np.unique(self.atom_residue[self.index.atoms_in_box(c - half, c + half)])
+
+    def residues_within(self, point: Iterable[float], radius: float) -> np.ndarray:
+        """Sorted indices of residues with at least one atom within ``radius`` of ``point``."""
+        atoms, _ = self.index.atoms_near(np.asarray(list(point), dtype=np.float64), radius)
+        return np.unique(self.atom_residue[atoms])
+
+    def atoms_near(self, points: np.ndarray, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+        return self.index.atoms_near(points, radius)
+
+    def residue_names(self) -> np.ndarray:
+        return self.names[self.residue_name]
+
+    def residue_key(self, i: int) -> str:
+        """Residue label used in pocket features: chain:NAMEnum plus insertion code."""
+        return (
+            f"{self.chains[self.residue_chain[i]]}:{self.names[self.residue_name[i]]}"
+            f"{int(self.residue_seq[i])}{self.residue_icode[i]}"
+        )
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self.__slots__ if not name.startswith("_")}
+
+
+def _max_entries() -> int:
+    try:
+        return max(1, int(settings_provider.resolve("STRUCTURE_CACHE_MAX_ENTRIES", str(_DEFAULT_MAX_ENTRIES))))  # type: ignore[arg-type]
+    except Exception:
+        return _DEFAULT_MAX_ENTRIES
+
+
+def structure_cache_path(digest: str) -> str:
+    return os.path.join(STRUCTURE_CACHE_DIR, f"{digest}.v{_FORMAT_VERSION}.npz")
+
+
+def _vocab_code(vocab: Dict[str, int], value: str) -> int:
+    code = vocab.get(value)
+    if code is None:
+        code = vocab[value] = len(vocab)
+    return code
+
+
+def parse_structure(protein_abs: str) -> Structure:
+    """Walk a structure file once with gemmi and flatten it into arrays."""
+    import gemmi
+
+    st = gemmi.read_structure(protein_abs)
+    coords: List[List[float]] = []
+    atom_residue: List[int] = []
+    atom_names: List[str] = []
+    elements: List[str] = []
+    res_name: List[int] = []
+    res_chain: List[int] = []
+    res_seq: List[int] = []
+    res_icode: List[str] = []
+    res_het: List[bool] = []
+    names: Dict[str, int] = {}
+    chains: Dict[str, int] = {}
+    for model in st:
+        for chain in model:
+            chain_code = _vocab_code(chains, chain.name)
+            for residue in chain:
+                ri = len(res_name)
+                res_name.append(_vocab_code(names, residue.name))
+                res_chain.append(chain_code)
+                try:
+                    res_seq.append(int(residue.seqid.num))
+                except Exception:
+                    res_seq.append(0)
+                try:
+                    res_icode.append(residue.seqid.icode.strip())
+                except Exception:
+                    res_icode.append("")
+                res_het.append(residue.het_flag == "H")
+                for atom in residue:
+                    pos = atom.pos
+                    coords.append([pos.x, pos.y, pos.z])
+                    atom_residue.append(ri)
+                    atom_names.append(atom.name)
+                    elements.append(atom.element.name)
+    return Structure({
+        "coords": np.asarray(coords, dtype=np.float32).reshape(-1, 3),
+        "atom_residue": np.asarray(atom_residue, dtype=np.int32),
+        "atom_names": np.asarray(atom_names, dtype="<U4"),
+        "elements": np.asarray(elements, dtype="<U2"),
+        "residue_name": np.asarray(res_name, dtype=np.int32),
+        "residue_chain": np.asarray(res_chain, dtype=np.int32),
+        "residue_seq": np.asarray(res_seq, dtype=np.int32),
+        "residue_icode": np.asarray(res_icode, dtype="<U1"),
+        "residue_het": np.asarray(res_het, dtype=bool),
+        "names": np.asarray(list(names), dtype=str),
+        "chains": np.asarray(list(chains), dtype=str),
+    })
+
+
+def _read_sidecar(path: str) -> Optional[Structure]:
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return Structure({k: data[k] for k in data.files})
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _remember(digest: str, structure: Structure) -> None:
+    limit = _max_entries()
+    with _lock:
+        _lru[digest] = structure
+        _lru.move_to_end(digest)
+        while len(_lru) > limit:
+            _lru.popitem(last=False)
+
+
+def load_structure(protein_file_rel: str) -> Structure:
+    """
+    Parsed arrays for a protein file, keyed by its content hash: from the in-process
+    LRU, else the .npz sidecar under storage/cache/structures, else parsed once with
+    gemmi and the sidecar written for every later caller.
+    """
+    protein_abs = os.path.abspath(protein_file_rel)
+    digest = file_sha256(protein_abs)
+    with _lock:
+        hit = _lru.get(digest)
+        if hit is not None:
+            _lru.move_to_end(digest)
+    if hit is not None:
+        stats.hit()
+        return hit
+
+    path = structure_cache_path(digest)
+    structure = _read_sidecar(path) if os.path.exists(path) else None
+    if structure is not None:
+        stats.hit()
+    else:
+        stats.miss()
+        structure = parse_structure(protein_abs)
+        buf = io.BytesIO()
+        np.savez(buf, **structure.arrays())
+        try:
+            atomic_write_bytes(path, buf.getvalue())
+        except OSError:
+            # The sidecar is only an accelerator
+            pass
+    _remember(digest, structure)
+    return structure
@@ -1,9 +1,10 @@
 from __future__ import annotations
 
-import os
-from typing import Any, Dict, Iterable, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
-import gemmi
+import numpy as np
+
+from app.services.structure_cache import load_structure
 
 _STANDARD_AA = {
     "ALA",
@@ -36,6 +37,17 @@ _NEGATIVE = {"ASP", "GLU"}
 _HBOND_DONOR = {"SER", "THR", "TYR", "LYS", "ARG", "HIS", "ASN", "GLN", "TRP", "CYS"}
 _HBOND_ACCEPTOR = {"ASP", "GLU", "SER", "THR", "TYR", "HIS", "ASN", "GLN", "CYS"}
 
+_CATEGORIES = (
+    ("hydrophobic_residues", _HYDROPHOBIC),
+    ("aromatic_residues", _AROMATIC),
+    ("positive_residues", _POSITIVE),
+    ("negative_residues", _NEGATIVE),
+    ("hbond_donor_residues", _HBOND_DONOR),
+    ("hbond_acceptor_residues", _HBOND_ACCEPTOR),
+)
+
+_MAX_LISTED_RESIDUES = 50
+
 
 def _as_tuple3(val: Any) -> Optional[Tuple[float, float, float]]:
     if val is None:
@@ -48,114 +60,64 @@ def _as_tuple3(val: Any) -> Optional[Tuple[float, float, float]]:
     return None
 
 
-def _bbox_from_center_size(
-    center: Tuple[float, float, float], size: Tuple[float, float, float]
-) -> Tuple[Tuple[float, float, float], Tuple[float, float, float]]:
-    cx, cy, cz = center
-    sx, sy, sz = size
-    half = (sx / 2.0, sy / 2.0, sz / 2.0)
-    min_xyz = (cx - half[0], cy - half[1], cz - half[2])
-    max_xyz = (cx + half[0], cy + half[1], cz + half[2])
-    return min_xyz, max_xyz
-
-
-def _in_bbox(x: float, y: float, z: float, min_xyz: Tuple[float, float, float], max_xyz: Tuple[float, float, float]) -> bool:
-    return (
-        min_xyz[0] <= x <= max_xyz[0]
-        and min_xyz[1] <= y <= max_xyz[1]
-        and min_xyz[2] <= z <= max_xyz[2]
-    )
-
-
-def _residue_key(chain: gemmi.Chain, residue: gemmi.Residue) -> str:
-    try:
-        num = residue.seqid.num
-    except Exception:
-        num = "?"
-    icode = ""
-    try:
-        icode = residue.seqid.icode.strip()
-    except Exception:
-        icode = ""
-    return f"{chain.name}:{residue.name}{num}{icode}"
-
-
 def analyze_pocket_features(protein_file_rel: str, pocket: Dict[str, Any]) -> Dict[str, Any]:
-    center = _as_tuple3(pocket.get("center"))
-    size = _as_tuple3(pocket.get("size"))
-    if center is None or size is None:
-        return {}
-
-    volume = float(size[0]) * float(size[1]) * float(size[2])
-    min_xyz, max_xyz = _bbox_from_center_size(center, size)
-
-    protein_abs = os.path.abspath(protein_file_rel)
-    structure = gemmi.read_structure(protein_abs)
-
-    residue_counts: Dict[str, int] = {}
-    residue_ids: list[str] = []
-
-    hydrophobic = 0
-    aromatic = 0
-    positive = 0
-    negative = 0
-    hbd = 0
-    hba = 0
-
-    for model in structure:
-        for chain in model:
-            for residue in chain:
-                if residue.het_flag == "H":
-                    continue
-                name = residue.name.strip().upper()
-                if name not in _STANDARD_AA:
-                    continue
-
-                inside = False
-                for atom in residue:
-                    pos = atom.pos
-                    if _in_bbox(pos.x, pos.y, pos.z, min_xyz, max_xyz):
-                        inside = True
-                        break
-                if not inside:
-                    continue
-
-                residue_counts[name] = residue_counts.get(name, 0) + 1
-                residue_ids.append(_residue_key(chain, residue))
-
-                if name in _HYDROPHOBIC:
-                    hydrophobic += 1
-                if name in _AROMATIC:
-                    aromatic += 1
-                if name in _POSITIVE:
-                    positive += 1
-                if name in _NEGATIVE:
-                    negative += 1
-                if name in _HBOND_DONOR:
-                    hbd += 1
-                if name in _HBOND_ACCEPTOR:
-                    hba += 1
-
-    total = sum(residue_counts.values())
-    hydrophobic_fraction = (hydrophobic / total) if total else 0.0
-
-    out: Dict[str, Any] = {
-        "pocket_volume": volume,
-        "center": center,
-        "size": size,
-        "residues_total": total,
-        "residue_counts": residue_counts,
-        "hydrophobic_residues": hydrophobic,
-        "hydrophobic_fraction": hydrophobic_fraction,
-        "aromatic_residues": aromatic,
-        "positive_residues": positive,
-        "negative_residues": negative,
-        "net_charge": positive - negative,
-        "hbond_donor_residues": hbd,
-        "hbond_acceptor_residues": hba,
-    }
-
-    if residue_ids:
-        out["residues"] = residue_ids[:50]
+    return analyze_pocket_features_many(protein_file_rel, [pocket])[0]
+
+
+def analyze_pocket_features_many(protein_file_rel: str, pockets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Feature dicts for every pocket (in order; {} for a pocket without center/size)
+    from one cached structure read. Residues touching each box come from the
+    structure's spatial index, and residue counts are grouped reductions over them.
+    """
+    out: List[Dict[str, Any]] = [{} for _ in pockets]
+    valid = []
+    for i, pocket in enumerate(pockets):
+        center = _as_tuple3(pocket.get("center"))
+        size = _as_tuple3(pocket.get("size"))
+        if center is not None and size is not None:
+            valid.append((i, center, size))
+    if not valid:
+        return out
+
+    structure = load_structure(protein_file_rel)
+    names = np.char.upper(np.char.strip(structure.residue_names()))
+    # (pocket, residue): the residue has at least one atom inside the pocket box
+    hit = np.zeros((len(valid), structure.n_residues), dtype=bool)
+    for row, (_, center, size) in enumerate(valid):
+        hit[row, structure.residues_in_box(center, size)] = True
+    # Only standard amino-acid residues (not HETATM) count
+    hit &= ~structure.residue_het & np.isin(names, list(_STANDARD_AA))
+
+    flags = np.stack([np.isin(names, list(group)) for _, group in _CATEGORIES], axis=1).astype(np.int64)
+    category_counts = hit.astype(np.int64) @ flags
+    totals = hit.sum(axis=1)
+
+    for row, (i, center, size) in enumerate(valid):
+        idx = np.flatnonzero(hit[row])
+        uniq, first, counts = np.unique(names[idx], return_index=True, return_counts=True)
+        # Keep residue names in order of first appearance
+        residue_counts = {str(uniq[j]): int(counts[j]) for j in np.argsort(first)}
+        total = int(totals[row])
+        cat = {key: int(category_counts[row, k]) for k, (key, _) in enumerate(_CATEGORIES)}
+
+        features: Dict[str, Any] = {
+            "pocket_volume": float(size[0]) * float(size[1]) * float(size[2]),
+            "center": center,
+            "size": size,
+            "residues_total": total,
+            "residue_counts": residue_counts,
+            "hydrophobic_residues": cat["hydrophobic_residues"],
+            "hydrophobic_fraction": (cat["hydrophobic_residues"] / total) if total else 0.0,
+            "aromatic_residues": cat["aromatic_residues"],
+            "positive_residues": cat["positive_residues"],
+            "negative_residues": cat["negative_residues"],
+            "net_charge": cat["positive_residues"] - cat["negative_residues"],
+            "hbond_donor_residues": cat["hbond_donor_residues"],
+            "hbond_acceptor_residues": cat["hbond_acceptor_residues"],
+        }
+        if len(idx):
+            features["residues"] = [structure.residue_key(int(r)) for r in idx[:_MAX_LISTED_RESIDUES]]
+        out[i] = features
 
     return out
@@ -1,5 +1,6 @@
 from __future__ import annotations
-from typing import Optional
+import threading
+from typing import Callable, Optional
 from sqlalchemy.orm import Session
 
 from app.db.session import SessionLocal
@@ -11,7 +12,28 @@ from app.services.vina import dock_smiles_against_protein
 from app.services.admet_service import predict_admet_for_smiles
 
 
-def task_run_docking(dock_job_id: int) -> None:
+def _rq_progress() -> Optional[Callable[[float], None]]:
+    # When running under an RQ worker, expose Vina progress in the job's meta
+    try:
+        from rq import get_current_job
+    except Exception:
+        return None
+    rq_job = get_current_job()
+    if rq_job is None:
+        return None
+
+    def _report(frac: float) -> None:
+        rq_job.meta["progress"] = round(frac, 3)
+        rq_job.save_meta()
+
+    return _report
+
+
+def task_run_docking(
+    dock_job_id: int,
+    on_progress: Optional[Callable[[float], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> None:
     db: Session = SessionLocal()
     try:
         job = db.query(DockJob).filter(DockJob.id == dock_job_id).first()
@@ -26,7 +48,9 @@ def task_run_docking(dock_job_id: int) -> None:
             job.status = "failed"
             db.commit()
             return
-        pose_path, score = dock_smiles_against_protein(mol.smiles, prot.path)
+        pose_path, score = dock_smiles_against_protein(
+            mol.smiles, prot.path, on_progress=on_progress or _rq_progress(), cancel_event=cancel_event
+        )
         job.pose_path = pose_path
         job.score = score
         job.status = "completed"
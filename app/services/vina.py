@@ -1,18 +1,29 @@
 from __future__ import annotations
-import hashlib
 import os
 import re
 import shutil
-import subprocess
-from typing import Optional, Tuple
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
 
 from rdkit import Chem
 from rdkit.Chem import AllChem
 
 from app.core.config import settings
+from app.services import dock_memo, governor
+from app.services.ligand_cache import default_seed, get_or_prepare_ligand
+from app.services.cache_utils import atomic_write_text
+from app.services.map_store import get_or_compute_maps
+from app.services.pose_index import read_pose_model, record_poses
+from app.services.pose_parser import PoseModel, best_affinity, parse_pose_file
+from app.services.pose_store import POSES_DIR, finalize_pose, read_pose, store_log
+from app.services.procrunner import VinaProgress, run_process_sync
+from app.services.receptor_cache import get_or_prepare_receptor
 from app.services.settings_provider import settings_provider
+from app.services.vina_engine import bindings_version, dock_with_engine, python_backend_selected
 
-POSES_DIR = os.path.join(settings.STORAGE_DIR, "poses")
 
 
 def _ensure_dirs() -> None:
@@ -110,15 +121,18 @@ def _parse_vina_affinity(text: str) -> Optional[float]:
     return None
 
 
-def prepare_ligand_pdbqt_from_smiles(smiles: str, out_path: str) -> None:
+def prepare_ligand_pdbqt_from_smiles(smiles: str, out_path: str, seed: Optional[int] = None) -> None:
     from meeko import MoleculePreparation, PDBQTWriterLegacy
 
     mol = Chem.MolFromSmiles(smiles)
     if mol is None:
         raise ValueError("Invalid SMILES for ligand")
     mol = Chem.AddHs(mol)
-    # Embed and optimize 3D
-    if AllChem.EmbedMolecule(mol, AllChem.ETKDG()) != 0:
+    # Embed and optimize 3D; a fixed seed makes the conformer reproducible
+    params = AllChem.ETKDG()
+    if seed is not None:
+        params.randomSeed = int(seed)
+    if AllChem.EmbedMolecule(mol, params) != 0:
         raise RuntimeError("Failed to embed ligand conformer")
     AllChem.UFFOptimizeMolecule(mol, 200)
 
@@ -142,7 +156,24 @@ def prepare_ligand_pdbqt_from_smiles(smiles: str, out_path: str) -> None:
         f.write(pdbqt_str)
 
 
-def prepare_receptor_pdbqt_from_protein(in_path: str, out_path: str) -> None:
+_WATER_RESIDUES = {"HOH", "WAT", "DOD", "H2O"}
+
+
+def _strip_waters_pdb(in_path: str, out_path: str) -> None:
+    with open(in_path, "r", encoding="utf-8", errors="ignore") as src, open(out_path, "w", encoding="utf-8") as dst:
+        for line in src:
+            if line.startswith(("ATOM", "HETATM", "ANISOU")) and line[17:20].strip().upper() in _WATER_RESIDUES:
+                continue
+            dst.write(line)
+
+
+def prepare_receptor_pdbqt_from_protein(
+    in_path: str,
+    out_path: str,
+    remove_waters: bool = True,
+    add_hydrogens: bool = True,
+    ph: Optional[float] = None,
+) -> None:
     # If already PDBQT, just copy
     if in_path.lower().endswith(".pdbqt"):
         shutil.copyfile(in_path, out_path)
@@ -151,103 +182,611 @@ def prepare_receptor_pdbqt_from_protein(in_path: str, out_path: str) -> None:
     obabel = _obabel_path()
     if obabel is None:
         raise RuntimeError("OpenBabel (obabel) not found in PATH; cannot prepare receptor PDBQT")
-    # -xr: remove waters; -xh: add hydrogens (older flag); use -p for pH if desired
-    cmd = [obabel, in_path, "-O", out_path, "-xr", "-xh"]
-    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-
-def run_vina(
-    receptor_pdbqt: str,
-    ligand_pdbqt: str,
-    out_pdbqt: str,
-    log_path: str,
-    center: Optional[Tuple[float, float, float]] = None,
-    size: Optional[Tuple[float, float, float]] = None,
-    exhaustiveness: Optional[str] = None,
-) -> float:
+    src_path = in_path
+    stripped: Optional[str] = None
+    # Water removal is done on the PDB text; mmCIF input is passed through unchanged
+    if remove_waters and in_path.lower().endswith(".pdb"):
+        stripped = out_path + ".nowat.pdb"
+        _strip_waters_pdb(in_path, stripped)
+        src_path = stripped
+    # -xr: rigid receptor output; -xh: keep hydrogens in the PDBQT
+    cmd = [obabel, src_path, "-O", out_path, "-xr", "-xh"]
+    if add_hydrogens:
+        # -p <pH> protonates for the given pH; -h adds all hydrogens
+        cmd.extend(["-p", str(ph)] if ph is not None else ["-h"])
+    try:
+        proc = run_process_sync(cmd, timeout=obabel_timeout())
+        if proc.returncode != 0:
+            raise RuntimeError(f"OpenBabel receptor preparation failed: {proc.stderr.strip() or proc.stdout.strip()}")
+    finally:
+        if stripped and os.path.exists(stripped):
+            os.remove(stripped)
+
+
+def _resolve_box(
+    center: Optional[Tuple[float, float, float]],
+    size: Optional[Tuple[float, float, float]],
+) -> Tuple[Tuple[float, float, float], Tuple[float, float, float]]:
     if center is None:
-        cx, cy, cz = _parse_center(settings_provider.get("VINA_CENTER"))
-    else:
-        cx, cy, cz = center
+        center = _parse_center(settings_provider.get("VINA_CENTER"))
     if size is None:
-        sx, sy, sz = _parse_size(settings_provider.get("VINA_SIZE"))
-    else:
-        sx, sy, sz = size
-    exhaust = exhaustiveness or settings_provider.get("VINA_EXHAUSTIVENESS") or "8"
+        size = _parse_size(settings_provider.get("VINA_SIZE"))
+    cx, cy, cz = center
+    sx, sy, sz = size
+    return (float(cx), float(cy), float(cz)), (float(sx), float(sy), float(sz))
 
-    vina = _vina_path()
-    cmd = [
-        vina,
-        "--receptor", receptor_pdbqt,
-        "--ligand", ligand_pdbqt,
+
+def _scoring() -> str:
+    return (settings_provider.resolve("VINA_SCORING", "vina") or "vina").strip().lower()
+
+
+def _exhaustiveness(exhaustiveness: Optional[str]) -> int:
+    val = exhaustiveness or settings_provider.get("VINA_EXHAUSTIVENESS") or "8"
+    try:
+        return int(val)
+    except Exception:
+        return 8
+
+
+def _search_args(
+    center: Optional[Tuple[float, float, float]],
+    size: Optional[Tuple[float, float, float]],
+    exhaustiveness: Optional[str],
+) -> list[str]:
+    (cx, cy, cz), (sx, sy, sz) = _resolve_box(center, size)
+    args = [
         "--center_x", str(cx),
         "--center_y", str(cy),
         "--center_z", str(cz),
         "--size_x", str(sx),
         "--size_y", str(sy),
         "--size_z", str(sz),
-        "--exhaustiveness", str(exhaust),
-        "--out", out_pdbqt,
+        "--exhaustiveness", str(_exhaustiveness(exhaustiveness)),
+        "--seed", str(dock_memo.vina_seed()),
     ]
-    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    scoring = _scoring()
+    # Only pass --scoring when non-default so Vina 1.1.x keeps working
+    if scoring != "vina":
+        args.extend(["--scoring", scoring])
+    return args
+
+
+def _receptor_args(receptor_pdbqt: str, maps: Optional[str]) -> list[str]:
+    # Precomputed grid maps replace the receptor for rigid docking
+    return ["--maps", maps] if maps else ["--receptor", receptor_pdbqt]
+
+
+def _write_log(log_path: str, stdout: Optional[str], stderr: Optional[str]) -> None:
     # Persist Vina console output to our log file for later inspection
     try:
         with open(log_path, "w", encoding="utf-8") as lf:
-            if proc.stdout:
-                lf.write(proc.stdout)
-            if proc.stderr:
-                if proc.stdout:
+            if stdout:
+                lf.write(stdout)
+            if stderr:
+                if stdout:
                     lf.write("\n")
-                lf.write(proc.stderr)
+                lf.write(stderr)
     except Exception:
         pass
+
+
+def run_vina(
+    receptor_pdbqt: str,
+    ligand_pdbqt: str,
+    out_pdbqt: str,
+    log_path: str,
+    center: Optional[Tuple[float, float, float]] = None,
+    size: Optional[Tuple[float, float, float]] = None,
+    exhaustiveness: Optional[str] = None,
+    maps: Optional[str] = None,
+    cpu: Optional[int] = None,
+    timeout: Optional[float] = None,
+    on_progress: Optional[Callable[[float], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> Optional[float]:
+    """
+    Run Vina for one ligand. Returns the best affinity from Vina's output table, or
+    None if it could not be read; callers take the score from the parsed pose file.
+    """
+    vina = _vina_path()
+    cmd = [
+        vina,
+        *_receptor_args(receptor_pdbqt, maps),
+        "--ligand", ligand_pdbqt,
+        *_search_args(center, size, exhaustiveness),
+        "--out", out_pdbqt,
+    ]
+    progress = VinaProgress(on_progress).feed if on_progress is not None else None
+    # Queue for node-wide CPU slots instead of oversubscribing; the timeout covers only the run
+    with governor.lease(cpu, cancel_event=cancel_event) as granted:
+        proc = run_process_sync(
+            [*cmd, "--cpu", str(granted)],
+            timeout=timeout if timeout is not None else vina_timeout(),
+            on_output=progress,
+            cancel_event=cancel_event,
+        )
+    _write_log(log_path, proc.stdout, proc.stderr)
     if proc.returncode != 0:
         raise RuntimeError(f"Vina failed: {proc.stderr.strip() or proc.stdout.strip()}")
 
-    best: Optional[float] = None
+    # The log holds the same text, so there is no need to read it back
+    return _parse_vina_affinity((proc.stdout or "") + "\n" + (proc.stderr or ""))
+
+
+def vina_timeout() -> Optional[float]:
+    """Per-ligand wall-clock limit for Vina (DOCK_TIMEOUT_S, default 1800; <= 0 disables)."""
+    return _timeout_setting("DOCK_TIMEOUT_S", 1800.0)
+
+
+def obabel_timeout() -> Optional[float]:
+    return _timeout_setting("OBABEL_TIMEOUT_S", 600.0)
+
+
+def _timeout_setting(key: str, default: float) -> Optional[float]:
     try:
-        if os.path.exists(out_pdbqt):
-            with open(out_pdbqt, "r", encoding="utf-8", errors="ignore") as f:
-                best = _parse_vina_affinity(f.read())
+        val = float(settings_provider.resolve(key, str(default)))  # type: ignore[arg-type]
     except Exception:
-        best = None
+        val = default
+    return val if val > 0 else None
 
-    if best is None and os.path.exists(log_path):
-        try:
-            with open(log_path, "r", encoding="utf-8", errors="ignore") as f:
-                best = _parse_vina_affinity(f.read())
-        except Exception:
-            pass
 
-    if best is None:
-        best = _parse_vina_affinity((proc.stdout or "") + "\n" + (proc.stderr or ""))
+def vina_batch_size() -> int:
+    """Ligands per `vina --batch` process (VINA_BATCH_SIZE, default 100)."""
+    try:
+        return max(1, int(settings_provider.resolve("VINA_BATCH_SIZE", "100")))  # type: ignore[arg-type]
+    except Exception:
+        return 100
 
-    if best is None:
-        raise RuntimeError(f"Vina ran but affinity could not be parsed. See log: {log_path}")
 
-    return best
+def _batch_cpus() -> int:
+    # A batch holds its lease for a whole chunk of ligands, so without an explicit
+    # VINA_CPU it takes half the node rather than every slot
+    try:
+        return max(1, int(settings_provider.resolve("VINA_CPU", None)))  # type: ignore[arg-type]
+    except Exception:
+        return max(1, governor.total_slots() // 2)
 
 
-def dock_smiles_against_protein(
+def dock_batch(
+    receptor_pdbqt: str,
+    ligands: Dict[str, str],
+    center: Optional[Tuple[float, float, float]] = None,
+    size: Optional[Tuple[float, float, float]] = None,
+    exhaustiveness: Optional[str] = None,
+    out_dir: Optional[str] = None,
+    on_chunk: Optional[Callable[[int, int], None]] = None,
+    maps: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None,
+    cpu: Optional[int] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Dock many prepared ligands against one receptor using Vina 1.2's --batch/--dir mode,
+    so each process computes the grid for the box once for a whole chunk of ligands.
+
+    ``ligands`` maps a caller key (e.g. molecule id) to a ligand PDBQT path. Returns a
+    mapping of the same keys to {"score", "pose_path", "models"} or {"error"}, where
+    "models" is the parsed pose index of the output file.
+    """
+    _ensure_dirs()
+    out_dir = out_dir or os.path.join(POSES_DIR, f"batch_{uuid.uuid4().hex}")
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Vina names outputs after the ligand file stem; several keys may share one file
+    by_path: Dict[str, list[str]] = {}
+    for key, path in ligands.items():
+        by_path.setdefault(os.path.abspath(path), []).append(key)
+    paths = list(by_path.keys())
+
+    results: Dict[str, Dict[str, Any]] = {}
+    vina = _vina_path()
+    chunk_size = vina_batch_size()
+    done = 0
+    for start in range(0, len(paths), chunk_size):
+        chunk = paths[start:start + chunk_size]
+        cmd = [
+            vina,
+            *_receptor_args(receptor_pdbqt, maps),
+            "--batch", *chunk,
+            "--dir", out_dir,
+            *_search_args(center, size, exhaustiveness),
+        ]
+        # The wall-clock budget scales with the number of ligands in the chunk
+        timeout = vina_timeout()
+        with governor.lease(cpu or _batch_cpus(), cancel_event=cancel_event, label="vina-batch") as granted:
+            proc = run_process_sync(
+                [*cmd, "--cpu", str(granted)],
+                timeout=timeout * len(chunk) if timeout else None,
+                cancel_event=cancel_event,
+            )
+        _write_log(os.path.join(out_dir, f"vina_batch_{start // chunk_size}.log"), proc.stdout, proc.stderr)
+        for lig_path in chunk:
+            stem = os.path.splitext(os.path.basename(lig_path))[0]
+            pose_path = os.path.join(out_dir, f"{stem}_out.pdbqt")
+            entry: Dict[str, Any]
+            score: Optional[float] = None
+            models: List[PoseModel] = []
+            if os.path.exists(pose_path):
+                models = parse_pose_file(pose_path)
+                score = best_affinity(models)
+            if score is not None:
+                entry = {"score": score, "pose_path": pose_path, "models": models}
+            elif proc.returncode != 0:
+                entry = {"error": f"Vina failed: {proc.stderr.strip() or proc.stdout.strip()}"}
+            else:
+                entry = {"error": "Vina produced no parsable pose for ligand"}
+            for key in by_path[lig_path]:
+                results[key] = entry
+        done += len(chunk)
+        if on_chunk is not None:
+            on_chunk(done, len(paths))
+    return results
+
+
+def _run_fields(
+    version: str,
+    receptor_pdbqt: str,
     smiles: str,
+    center: Tuple[float, float, float],
+    size: Tuple[float, float, float],
+    exhaustiveness: Optional[str],
+    variant: str = "",
+) -> Dict[str, object]:
+    return dock_memo.result_key(
+        receptor_pdbqt,
+        smiles,
+        center,
+        size,
+        _exhaustiveness(exhaustiveness),
+        _scoring(),
+        dock_memo.vina_seed(),
+        version,
+        default_seed(),
+        variant=variant,
+    )
+
+
+def docking_context(
     protein_file_rel: str,
     center: Optional[Tuple[float, float, float]] = None,
     size: Optional[Tuple[float, float, float]] = None,
-) -> tuple[str, float]:
+) -> Dict[str, Any]:
+    """Resolve everything shared by all ligands docked into one receptor box."""
     _ensure_dirs()
-    # Build absolute paths
     protein_abs = os.path.abspath(protein_file_rel)
-    base = os.path.splitext(os.path.basename(protein_abs))[0]
-    tag = hashlib.sha1(smiles.encode("utf-8")).hexdigest()[:10]
-    ligand_out = os.path.join(POSES_DIR, f"lig_{base}_{tag}.pdbqt")
-    receptor_out = os.path.join(POSES_DIR, f"rec_{base}.pdbqt")
-    pose_out = os.path.join(POSES_DIR, f"pose_{base}_{tag}.pdbqt")
-    log_out = os.path.join(POSES_DIR, f"vina_{base}_{tag}.log")
-
-    prepare_ligand_pdbqt_from_smiles(smiles, ligand_out)
-    prepare_receptor_pdbqt_from_protein(protein_abs, receptor_out)
-    score = run_vina(receptor_out, ligand_out, pose_out, log_out, center=center, size=size)
-
-    # Return pose path relative to CWD for consistency with other stored paths
-    rel_pose = os.path.relpath(pose_out, start=os.getcwd())
-    return rel_pose, score
+    receptor_out = get_or_prepare_receptor(protein_abs)
+    center, size = _resolve_box(center, size)
+    ctx: Dict[str, Any] = {
+        "base": os.path.splitext(os.path.basename(protein_abs))[0],
+        "receptor": receptor_out,
+        "center": center,
+        "size": size,
+    }
+    if python_backend_selected():
+        # In-process engines keep the receptor and maps in memory themselves
+        ctx.update(backend="python", vina=None, vina_version=bindings_version(), maps=None)
+    else:
+        vina = _vina_path()
+        ctx.update(
+            backend="exe",
+            vina=vina,
+            vina_version=dock_memo.vina_version(vina),
+            maps=get_or_compute_maps(vina, receptor_out, center, size, _scoring()),
+        )
+    return ctx
+
+
+def docking_run_fields(
+    ctx: Dict[str, Any], smiles: str, exhaustiveness: Optional[str] = None, variant: str = ""
+) -> Dict[str, object]:
+    return _run_fields(ctx["vina_version"], ctx["receptor"], smiles, ctx["center"], ctx["size"], exhaustiveness, variant)
+
+
+def extract_first_model(pose_ref: str, out_path: str) -> None:
+    """Write the first MODEL of a multi-model Vina output (any stored pose reference) as a standalone ligand PDBQT."""
+    data = read_pose(pose_ref)
+    if data is None:
+        raise RuntimeError(f"Pose not found: {pose_ref}")
+    text = data.decode("utf-8", errors="ignore").splitlines(keepends=True)
+    lines: List[str] = []
+    in_model = False
+    for line in text:
+        if line.startswith("MODEL"):
+            in_model = True
+            continue
+        if line.startswith("ENDMDL"):
+            break
+        if in_model:
+            lines.append(line)
+    if not in_model:
+        # Single-model file without MODEL records
+        lines = text
+    if not lines:
+        raise RuntimeError(f"No ligand model found in {pose_ref}")
+    atomic_write_text(out_path, "".join(lines))
+
+
+RESCORING_FUNCTIONS = ("vina", "vinardo")
+# Fixed reference (mean, sd) of each function's energies for docked drug-like
+# ligands, kcal/mol. Scores are z-scored against these (not against the batch),
+# so a pose's consensus does not depend on which other poses are rescored with it.
+_SCORE_REFERENCE = {"vina": (-7.5, 1.5), "vinardo": (-7.0, 1.7)}
+_FREE_ENERGY_RE = re.compile(r"Estimated Free Energy of Binding\s*:\s*([-+]?\d+(?:\.\d+)?)")
+
+
+def _ligand_block(pdbqt: bytes) -> str:
+    # Vina's ligand reader rejects MODEL/ENDMDL records
+    lines = pdbqt.decode("utf-8", errors="ignore").splitlines(keepends=True)
+    return "".join(line for line in lines if not line.startswith(("MODEL", "ENDMDL")))
+
+
+def rescore_ligand(
+    receptor_pdbqt: str,
+    ligand_pdbqt: str,
+    scoring: str = "vina",
+    mode: str = "score_only",
+    cancel_event: Optional[threading.Event] = None,
+) -> float:
+    """Score a posed ligand in place (``score_only``) or after local optimisation (``local_only``)."""
+    if mode not in ("score_only", "local_only"):
+        raise ValueError("mode must be score_only or local_only")
+    if scoring not in RESCORING_FUNCTIONS:
+        raise ValueError(f"Unsupported scoring function: {scoring}")
+    cmd = [_vina_path(), "--receptor", receptor_pdbqt, "--ligand", ligand_pdbqt, f"--{mode}", "--autobox"]
+    if scoring != "vina":
+        cmd.extend(["--scoring", scoring])
+    cmd.extend(["--cpu", "1"])
+    with tempfile.TemporaryDirectory() as td:
+        if mode == "local_only":
+            cmd.extend(["--out", os.path.join(td, "local.pdbqt")])
+        with governor.lease(1, cancel_event=cancel_event, label="vina-rescore"):
+            proc = run_process_sync(cmd, timeout=vina_timeout(), cancel_event=cancel_event)
+    text = (proc.stdout or "") + "\n" + (proc.stderr or "")
+    if proc.returncode != 0:
+        raise RuntimeError(f"Vina {mode} failed: {proc.stderr.strip() or proc.stdout.strip()}")
+    m = _FREE_ENERGY_RE.search(text)
+    value = float(m.group(1)) if m else _parse_vina_affinity(text)
+    if value is None:
+        raise RuntimeError(f"Vina {mode} ran but no energy could be parsed")
+    return value
+
+
+def rescore(
+    receptor_pdbqt: str,
+    poses: Dict[Hashable, str],
+    scorings: Sequence[str] = ("vina", "vinardo"),
+    mode: str = "score_only",
+    model: int = 1,
+    cancel_event: Optional[threading.Event] = None,
+) -> Dict[Hashable, Dict[str, Any]]:
+    """
+    Rescore stored poses (pose references from any store) against a receptor without
+    re-docking. Every (pose, scoring function) pair is a short Vina run leasing one CPU
+    slot, so a batch spreads across the node.
+
+    Each result holds per-function "scores" and "errors", "consensus" (mean of the
+    per-function z-scores against _SCORE_REFERENCE, so functions on different
+    energy scales weigh equally and the value is stable per pose) and
+    "consensus_rank" (mean rank across functions within this batch). Lower is
+    better for both.
+    """
+    results: Dict[Hashable, Dict[str, Any]] = {k: {"scores": {}, "errors": {}} for k in poses}
+    with tempfile.TemporaryDirectory() as td:
+        ligands: Dict[Hashable, str] = {}
+        for i, (key, ref) in enumerate(poses.items()):
+            block = read_pose_model(ref, model)
+            if block is None:
+                results[key]["errors"]["pose"] = f"Model {model} not found"
+                continue
+            path = os.path.join(td, f"ligand_{i}.pdbqt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(_ligand_block(block))
+            ligands[key] = path
+
+        runs = [(key, sf) for key in ligands for sf in scorings]
+        with ThreadPoolExecutor(max_workers=max(1, min(len(runs), governor.total_slots()))) as pool:
+            futures = {
+                pool.submit(rescore_ligand, receptor_pdbqt, ligands[key], sf, mode, cancel_event): (key, sf)
+                for key, sf in runs
+            }
+            for fut in as_completed(futures):
+                key, sf = futures[fut]
+                try:
+                    results[key]["scores"][sf] = fut.result()
+                except Exception as e:
+                    results[key]["errors"][sf] = str(e)
+
+    ranks: Dict[Hashable, List[int]] = {}
+    for sf in scorings:
+        scored = sorted((k for k, r in results.items() if sf in r["scores"]), key=lambda k: results[k]["scores"][sf])
+        for rank, key in enumerate(scored, start=1):
+            ranks.setdefault(key, []).append(rank)
+    for key, r in results.items():
+        z = [(v - _SCORE_REFERENCE[sf][0]) / _SCORE_REFERENCE[sf][1] for sf, v in r["scores"].items()]
+        r["consensus"] = round(sum(z) / len(z), 3) if z else None
+        r["consensus_rank"] = sum(ranks[key]) / len(ranks[key]) if key in ranks else None
+    return results
+
+
+def dock_prepared_ligand(
+    ctx: Dict[str, Any],
+    ligand_pdbqt: str,
+    fields: Dict[str, object],
+    exhaustiveness: Optional[str] = None,
+    cpu: Optional[int] = None,
+    timeout: Optional[float] = None,
+    on_progress: Optional[Callable[[float], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> tuple[str, float]:
+    tag = str(fields["cache_key"])[:16]
+    pose_out = os.path.join(POSES_DIR, f"pose_{ctx['base']}_{tag}.pdbqt")
+    log_out = os.path.join(POSES_DIR, f"vina_{ctx['base']}_{tag}.log")
+    if ctx["backend"] == "python":
+        with open(ligand_pdbqt, "r", encoding="utf-8") as f:
+            ligand_text = f.read()
+        score, poses = dock_with_engine(
+            ctx["receptor"],
+            ligand_text,
+            ctx["center"],
+            ctx["size"],
+            _scoring(),
+            _exhaustiveness(exhaustiveness),
+            dock_memo.vina_seed(),
+            cpu=cpu,
+        )
+        atomic_write_text(pose_out, poses)
+        return _store_pose(fields, score, pose_out)
+    score = run_vina(
+        ctx["receptor"],
+        ligand_pdbqt,
+        pose_out,
+        log_out,
+        center=ctx["center"],
+        size=ctx["size"],
+        exhaustiveness=exhaustiveness,
+        maps=ctx["maps"],
+        cpu=cpu,
+        timeout=timeout,
+        on_progress=on_progress,
+        cancel_event=cancel_event,
+    )
+    return _store_pose(fields, score, pose_out, log_out)
+
+
+def _store_pose(
+    fields: Dict[str, object],
+    score: Optional[float],
+    pose_out: str,
+    log_out: Optional[str] = None,
+    models: Optional[List[PoseModel]] = None,
+) -> tuple[str, float]:
+    """
+    Index and store a docked pose file. The file is parsed once here (unless the
+    caller already parsed it); its best model's affinity is the score, with
+    ``score`` as the fallback for files without REMARK VINA RESULT lines.
+    """
+    if models is None:
+        models = parse_pose_file(pose_out)
+    best = best_affinity(models)
+    if best is None:
+        best = score
+    if best is None:
+        raise RuntimeError(f"Vina ran but affinity could not be parsed. See log: {log_out or pose_out}")
+    # Files store: pose path relative to CWD, for consistency with other stored paths
+    ref = finalize_pose(pose_out, log_out)
+    record_poses(ref, models)
+    if dock_memo.memo_enabled():
+        dock_memo.store(fields, best, ref)
+    return ref, best
+
+
+def dock_smiles_against_protein(
+    smiles: str,
+    protein_file_rel: str,
+    center: Optional[Tuple[float, float, float]] = None,
+    size: Optional[Tuple[float, float, float]] = None,
+    exhaustiveness: Optional[str] = None,
+    on_progress: Optional[Callable[[float], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> tuple[str, float]:
+    ctx = docking_context(protein_file_rel, center, size)
+    # Seeded runs are deterministic, so an identical earlier run can be reused as-is
+    fields = docking_run_fields(ctx, smiles, exhaustiveness)
+    if dock_memo.memo_enabled():
+        hit = dock_memo.lookup(str(fields["cache_key"]))
+        if hit is not None:
+            return hit
+    ligand_out = get_or_prepare_ligand(smiles)
+    return dock_prepared_ligand(
+        ctx, ligand_out, fields, exhaustiveness=exhaustiveness, on_progress=on_progress, cancel_event=cancel_event
+    )
+
+
+def dock_smiles_batch_against_protein(
+    smiles_list: List[str],
+    protein_file_rel: str,
+    center: Optional[Tuple[float, float, float]] = None,
+    size: Optional[Tuple[float, float, float]] = None,
+    on_chunk: Optional[Callable[[int, int], None]] = None,
+    exhaustiveness: Optional[str] = None,
+    cpu: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Batch counterpart of dock_smiles_against_protein. Returns one dict per input SMILES,
+    in order, holding either {"pose_path", "score"} or {"error"}. Memoised results are
+    returned without docking (flagged with "cached": True).
+    """
+    ctx = docking_context(protein_file_rel, center, size)
+    use_memo = dock_memo.memo_enabled()
+
+    out: List[Dict[str, Any]] = [{} for _ in smiles_list]
+    # cache_key -> run fields; several inputs may describe the same run
+    runs: Dict[str, Dict[str, object]] = {}
+    members: Dict[str, List[int]] = {}
+    ligands: Dict[str, str] = {}
+    hits: Dict[str, Tuple[str, float]] = {}
+    for i, smi in enumerate(smiles_list):
+        try:
+            fields = docking_run_fields(ctx, smi, exhaustiveness)
+            key = str(fields["cache_key"])
+            members.setdefault(key, []).append(i)
+            if key in runs:
+                continue
+            runs[key] = fields
+            hit = dock_memo.lookup(key) if use_memo else None
+            if hit is not None:
+                hits[key] = hit
+                continue
+            ligands[key] = get_or_prepare_ligand(smi)
+        except Exception as e:
+            out[i] = {"error": str(e)}
+    for key, (pose_path, score) in hits.items():
+        for i in members[key]:
+            out[i] = {"pose_path": pose_path, "score": score, "cached": True}
+    if not ligands:
+        return out
+
+    if ctx["backend"] == "python":
+        # The pooled engine already shares receptor and maps across ligands
+        for n, (key, lig_path) in enumerate(ligands.items(), start=1):
+            try:
+                pose_path, score = dock_prepared_ligand(ctx, lig_path, runs[key], exhaustiveness=exhaustiveness)
+                entry: Dict[str, Any] = {"pose_path": pose_path, "score": score}
+            except Exception as e:
+                entry = {"error": str(e)}
+            for i in members[key]:
+                out[i] = entry
+            if on_chunk is not None:
+                on_chunk(n, len(ligands))
+        return out
+
+    batch_dir = os.path.join(POSES_DIR, f"batch_{uuid.uuid4().hex}")
+    try:
+        docked = dock_batch(
+            ctx["receptor"],
+            ligands,
+            center=ctx["center"],
+            size=ctx["size"],
+            exhaustiveness=exhaustiveness,
+            out_dir=batch_dir,
+            on_chunk=on_chunk,
+            maps=ctx["maps"],
+            cpu=cpu,
+        )
+        for key, res in docked.items():
+            if "error" in res:
+                entry = res
+            else:
+                dst = os.path.join(POSES_DIR, f"pose_{ctx['base']}_{key[:16]}.pdbqt")
+                shutil.copyfile(res["pose_path"], dst)
+                ref, score = _store_pose(runs[key], res["score"], dst, models=res["models"])
+                entry = {"pose_path": ref, "score": score}
+            for i in members[key]:
+                out[i] = entry
+        for name in os.listdir(batch_dir):
+            if name.endswith(".log"):
+                log_path = os.path.join(POSES_DIR, f"vina_{ctx['base']}_{os.path.basename(batch_dir)}{name[len('vina_batch'):]}")
+                os.replace(os.path.join(batch_dir, name), log_path)
+                store_log(log_path)
+    finally:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+    return out
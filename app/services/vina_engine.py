@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import logging
+from collections import OrderedDict
+from threading import Lock
+from typing import List, Optional, Tuple
+
+try:
+    from vina import Vina
+except Exception:  # pragma: no cover - optional dependency
+    Vina = None  # type: ignore
+
+from app.services import governor
+from app.services.cache_utils import file_sha256
+from app.services.settings_provider import settings_provider
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_MAX_ENGINES = 4
+
+_pool_lock = Lock()
+# engine key -> engines sharing that receptor/box (one per concurrent caller),
+# least recently used key first
+_engines: "OrderedDict[tuple, List[VinaEngine]]" = OrderedDict()
+# Engines being built, counted against the bound before they join the pool
+_building = 0
+_warned = False
+
+
+def python_backend_available() -> bool:
+    return Vina is not None
+
+
+def python_backend_selected() -> bool:
+    """True when VINA_BACKEND=python and the `vina` bindings import; otherwise use the executable."""
+    global _warned
+    backend = (settings_provider.resolve("VINA_BACKEND", "exe") or "exe").strip().lower()
+    if backend != "python":
+        return False
+    if Vina is None:
+        if not _warned:
+            logger.warning("VINA_BACKEND=python but the vina bindings are not installed; using the executable")
+            _warned = True
+        return False
+    return True
+
+
+def bindings_version() -> str:
+    try:
+        import vina as _vina_mod
+
+        return f"python-vina {getattr(_vina_mod, '__version__', 'unknown')}"
+    except Exception:
+        return "python-vina unknown"
+
+
+class VinaEngine:
+    """
+    Long-lived in-process Vina with the receptor loaded and grid maps computed once.
+    Ligands are passed as PDBQT text and poses come back as text, so no temp files
+    or log files are involved. Not thread-safe; callers hold ``lock`` while docking.
+    """
+
+    def __init__(
+        self,
+        receptor_pdbqt: str,
+        center: Tuple[float, float, float],
+        size: Tuple[float, float, float],
+        scoring: str = "vina",
+        cpu: int = 0,
+        seed: int = 0,
+    ) -> None:
+        if Vina is None:
+            raise RuntimeError("vina Python bindings are not installed")
+        self.lock = Lock()
+        # The bindings fix the thread count at construction; callers lease this many slots
+        self.cpu = cpu
+        self._vina = Vina(sf_name=scoring, cpu=cpu, seed=seed, verbosity=0)
+        self._vina.set_receptor(rigid_pdbqt_filename=receptor_pdbqt)
+        self._vina.compute_vina_maps(center=list(center), box_size=list(size))
+
+    def dock(self, ligand_pdbqt: str, exhaustiveness: int = 8, n_poses: int = 9) -> Tuple[float, str]:
+        self._vina.set_ligand_from_string(ligand_pdbqt)
+        self._vina.dock(exhaustiveness=exhaustiveness, n_poses=n_poses)
+        energies = self._vina.energies(n_poses=1)
+        poses = self._vina.poses(n_poses=n_poses)
+        return float(energies[0][0]), poses
+
+
+def _max_engines() -> int:
+    try:
+        return max(1, int(settings_provider.resolve("VINA_ENGINE_POOL", str(_DEFAULT_MAX_ENGINES))))  # type: ignore[arg-type]
+    except Exception:
+        return _DEFAULT_MAX_ENGINES
+
+
+def dock_with_engine(
+    receptor_pdbqt: str,
+    ligand_pdbqt: str,
+    center: Tuple[float, float, float],
+    size: Tuple[float, float, float],
+    scoring: str,
+    exhaustiveness: int,
+    seed: int,
+    cpu: Optional[int] = None,
+) -> Tuple[float, str]:
+    """Dock ligand PDBQT text with a pooled engine for this receptor/box; returns (best affinity, poses PDBQT)."""
+    want = min(governor.total_slots(), max(1, int(cpu or governor.default_cpus())))
+    key = (file_sha256(receptor_pdbqt), tuple(center), tuple(size), scoring, seed)
+    engine, pooled = _checkout(key)
+    if engine is None:
+        try:
+            with governor.lease(1, label="vina-maps"):
+                engine = VinaEngine(receptor_pdbqt, center, size, scoring=scoring, cpu=want, seed=seed)
+        except Exception:
+            _checkin_new(key, None, pooled)
+            raise
+        engine.lock.acquire()
+        _checkin_new(key, engine, pooled)
+    try:
+        # A reused engine runs with the thread count it was built with, so lease that
+        with governor.lease(engine.cpu, label="vina-engine"):
+            return engine.dock(ligand_pdbqt, exhaustiveness=exhaustiveness)
+    finally:
+        engine.lock.release()
+
+
+def _total_locked() -> int:
+    return _building + sum(len(pool) for pool in _engines.values())
+
+
+def _evict_idle_locked() -> bool:
+    """Drop one idle engine, least recently used receptor/box first; False if all are busy."""
+    for key in list(_engines):
+        pool = _engines[key]
+        for engine in pool:
+            if engine.lock.acquire(blocking=False):
+                pool.remove(engine)
+                engine.lock.release()
+                if not pool:
+                    del _engines[key]
+                return True
+    return False
+
+
+def _checkout(key: tuple) -> Tuple[Optional[VinaEngine], bool]:
+    """
+    An idle pooled engine for ``key`` (locked), or (None, pooled) when the caller must
+    build one; ``pooled`` says whether the new engine may join the pool. With every
+    engine busy and the pool full, waits on an engine for ``key`` if there is one.
+    """
+    global _building
+    busy: Optional[VinaEngine] = None
+    with _pool_lock:
+        pool = _engines.get(key, [])
+        if pool:
+            _engines.move_to_end(key)
+        for candidate in pool:
+            if candidate.lock.acquire(blocking=False):
+                return candidate, True
+        if _total_locked() < _max_engines() or _evict_idle_locked():
+            _building += 1
+            return None, True
+        if not pool:
+            # Pool is full of busy engines for other boxes: build a one-off engine
+            return None, False
+        busy = pool[0]
+    busy.lock.acquire()
+    return busy, True
+
+
+def _checkin_new(key: tuple, engine: Optional[VinaEngine], pooled: bool) -> None:
+    """Add a freshly built engine to the pool (None when building it failed)."""
+    global _building
+    if not pooled:
+        return
+    with _pool_lock:
+        _building -= 1
+        if engine is not None:
+            _engines.setdefault(key, []).append(engine)
+            _engines.move_to_end(key)
+
+
+def clear_engines() -> None:
+    with _pool_lock:
+        _engines.clear()
@@ -7,6 +7,7 @@ from app.db.session import engine
 from app.db.base import Base
 import os
 from app.services.settings_provider import settings_provider
+from app.services.checkpoints import recover_orphaned_jobs
 from app.api.v1.endpoints import admin as admin_endpoints
 
 
@@ -31,6 +32,8 @@ def create_app() -> FastAPI:
     def on_startup():
         # Create DB tables
         Base.metadata.create_all(bind=engine)
+        # Jobs left running by a dead process become resumable
+        recover_orphaned_jobs()
         # Ensure storage directories
         os.makedirs(settings.STORAGE_DIR, exist_ok=True)
         os.makedirs(settings.PROTEINS_DIR, exist_ok=True)
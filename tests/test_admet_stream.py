@@ -0,0 +1,77 @@
+import threading
+
+from app.services.admet_stream import TopKAdmetStream
+
+
+def _entry(mid: int, score: float):
+    return {"molecule_id": mid, "smiles": f"C{mid}", "score": score}
+
+
+class _GatedPredict:
+    """Blocks inside the first prediction until released, so later offers queue up behind it."""
+
+    def __init__(self) -> None:
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = []
+
+    def __call__(self, smiles: str):
+        self.calls.append(smiles)
+        self.started.set()
+        assert self.release.wait(5)
+        return {"smiles": smiles}
+
+
+def test_evicted_while_queued_is_skipped():
+    predict = _GatedPredict()
+    stream = TopKAdmetStream(2, predict=predict)
+
+    assert stream.offer(_entry(1, -9.0))
+    assert predict.started.wait(5)
+    # 2 is queued behind the busy worker, then pushed out of the top-2 by 3
+    assert stream.offer(_entry(2, -5.0))
+    assert stream.offer(_entry(3, -6.0))
+    predict.release.set()
+    results = stream.finish()
+
+    assert set(results) == {1, 3}
+    assert results[3] == {"admet": {"smiles": "C3"}}
+    assert predict.calls == ["C1", "C3"]
+    assert (stream.predicted, stream.skipped) == (2, 1)
+
+
+def test_rejects_scores_outside_top_k():
+    predict = _GatedPredict()
+    predict.release.set()
+    stream = TopKAdmetStream(1, predict=predict)
+
+    assert stream.offer(_entry(1, -8.0))
+    assert not stream.offer(_entry(2, -7.0))
+    assert set(stream.finish()) == {1}
+    assert predict.calls == ["C1"]
+
+
+def test_seeded_results_are_not_predicted_again():
+    predict = _GatedPredict()
+    predict.release.set()
+    stream = TopKAdmetStream(2, predict=predict, done={1: {"known": True}})
+
+    stream.offer(_entry(1, -8.0))
+    stream.offer(_entry(2, -7.0))
+    results = stream.finish()
+
+    assert results == {1: {"admet": {"known": True}}, 2: {"admet": {"smiles": "C2"}}}
+    assert predict.calls == ["C2"]
+    # Only fresh predictions are drained for persisting
+    assert stream.drain() == {2: {"admet": {"smiles": "C2"}}}
+    assert stream.drain() == {}
+
+
+def test_prediction_errors_are_recorded():
+    def _fail(_smiles):
+        raise RuntimeError("model unavailable")
+
+    stream = TopKAdmetStream(1, predict=_fail)
+    stream.offer(_entry(1, -8.0))
+
+    assert stream.finish() == {1: {"admet_error": "model unavailable"}}
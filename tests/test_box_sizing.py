@@ -0,0 +1,66 @@
+import logging
+
+import numpy as np
+import pytest
+
+from app.services import box_sizing
+
+CENTER = (10.0, -5.0, 3.0)
+
+
+def _span(boxes, axis: int):
+    lo = min(b["center"][axis] - b["size"][axis] / 2.0 for b in boxes)
+    hi = max(b["center"][axis] + b["size"][axis] / 2.0 for b in boxes)
+    return lo, hi
+
+
+def test_small_region_is_one_box_grown_to_ligand_edge():
+    boxes = box_sizing.fit_boxes(CENTER, (8.0, 20.0, 8.0), ligand_rg=5.0, max_volume=27000.0, max_boxes=27)
+
+    edge = box_sizing.RG_EDGE_FACTOR * 5.0
+    assert len(boxes) == 1
+    assert boxes[0]["center"] == CENTER
+    assert boxes[0]["size"] == pytest.approx((edge, 20.0, edge))
+
+
+def test_oversized_region_is_tiled_with_overlap():
+    boxes = box_sizing.fit_boxes(CENTER, (60.0, 30.0, 30.0), max_volume=27000.0, max_boxes=27)
+
+    # 12 A minimum edge -> 6 A overlap; 60 A in 30 A tiles needs three 24 A tiles
+    assert len(boxes) == 3
+    for b in boxes:
+        assert b["size"] == pytest.approx((24.0, 30.0, 30.0))
+        assert b["volume"] <= 27000.0
+    xs = sorted(b["center"][0] for b in boxes)
+    assert np.diff(xs) == pytest.approx([18.0, 18.0])
+    # Tiles cover exactly the requested region
+    assert _span(boxes, 0) == pytest.approx((CENTER[0] - 30.0, CENTER[0] + 30.0))
+    assert _span(boxes, 1) == pytest.approx((CENTER[1] - 15.0, CENTER[1] + 15.0))
+
+
+def test_tile_count_on_every_axis():
+    boxes = box_sizing.fit_boxes(CENTER, (50.0, 50.0, 50.0), max_volume=27000.0, max_boxes=27)
+
+    assert len(boxes) == 8
+    assert len({b["center"] for b in boxes}) == 8
+
+
+def test_cap_grows_tiles_and_warns(caplog):
+    with caplog.at_level(logging.WARNING, logger=box_sizing.__name__):
+        boxes = box_sizing.fit_boxes(CENTER, (60.0, 30.0, 30.0), max_volume=27000.0, max_boxes=2)
+
+    assert len(boxes) == 2
+    assert all(b["volume"] > 27000.0 for b in boxes)
+    assert _span(boxes, 0) == pytest.approx((CENTER[0] - 30.0, CENTER[0] + 30.0))
+    assert "VINA_MAX_SUBBOXES" in caplog.text
+
+
+@pytest.mark.parametrize("cap", [0, -3])
+def test_non_positive_cap_setting_yields_one_box(monkeypatch, cap):
+    settings = {"VINA_MAX_SUBBOXES": cap, "VINA_MAX_BOX_VOLUME": 27000.0}
+    monkeypatch.setattr(box_sizing, "_float_setting", lambda key, default: settings.get(key, default))
+
+    boxes = box_sizing.fit_boxes(CENTER, (60.0, 45.0, 30.0))
+
+    assert len(boxes) == 1
+    assert boxes[0]["size"] == pytest.approx((60.0, 45.0, 30.0))
@@ -0,0 +1,69 @@
+import pytest
+
+from app.services import fpocket
+
+INFO = """Pocket 1 :
+	Score : 	0.512
+	Druggability Score : 	0.873
+	Number of Alpha Spheres : 	42
+	Total SASA : 	120.5
+	Volume : 	612.3
+
+Pocket 2 :
+	Score : 	0.101
+	Druggability Score : 	0.004
+	Number of Alpha Spheres : 	17
+	Volume : 	1.2e2
+"""
+
+
+def _pqr_line(serial: int, x: float, y: float, z: float, radius: float) -> str:
+    return f"{f'ATOM  {serial:5d}    C STP     1':<30}{x:8.3f}{y:8.3f}{z:8.3f}    0.00     {radius:.2f}\n"
+
+
+def _write_pocket(pockets_dir, number: int, spheres) -> None:
+    lines = ["HEADER\n"] + [_pqr_line(i + 1, *s) for i, s in enumerate(spheres)] + ["TER\n", "END\n"]
+    (pockets_dir / f"pocket{number}_vert.pqr").write_text("".join(lines))
+
+
+def test_parse_info_descriptors():
+    info = fpocket.parse_info(INFO)
+
+    assert set(info) == {1, 2}
+    assert info[1]["druggability_score"] == pytest.approx(0.873)
+    assert info[1]["number_of_alpha_spheres"] == 42
+    assert info[1]["total_sasa"] == pytest.approx(120.5)
+    assert info[2]["volume"] == pytest.approx(120.0)
+
+
+def test_parse_vert_reads_centres_and_radii(tmp_path):
+    _write_pocket(tmp_path, 1, [(1.0, 2.0, 3.0, 3.5), (-4.25, 0.0, 10.5, 4.0)])
+
+    assert fpocket.parse_vert(str(tmp_path / "pocket1_vert.pqr")) == [(1.0, 2.0, 3.0, 3.5), (-4.25, 0.0, 10.5, 4.0)]
+
+
+def test_parse_output_boxes_span_spheres(tmp_path):
+    (tmp_path / "protein_info.txt").write_text(INFO)
+    pockets_dir = tmp_path / "pockets"
+    pockets_dir.mkdir()
+    _write_pocket(pockets_dir, 1, [(0.0, 0.0, 0.0, 3.0), (10.0, 4.0, 2.0, 3.0)])
+    _write_pocket(pockets_dir, 2, [(20.0, 20.0, 20.0, 3.5)])
+    # A pocket missing from the info file still yields a box, without descriptors
+    _write_pocket(pockets_dir, 3, [(5.0, 5.0, 5.0, 4.0)])
+
+    pockets = fpocket.parse_output(str(tmp_path), "protein")
+
+    assert [p["rank"] for p in pockets] == [1, 2, 3]
+    first = pockets[0]
+    assert first["method"] == "fpocket"
+    assert first["center"] == (5.0, 2.0, 1.0)
+    assert first["size"] == (16.0, 10.0, 8.0)
+    assert first["druggability"] == pytest.approx(0.873)
+    assert first["alpha_spheres"] == 42 and isinstance(first["alpha_spheres"], int)
+    assert first["volume"] == pytest.approx(612.3)
+    assert pockets[1]["size"] == (7.0, 7.0, 7.0)
+    assert pockets[2]["descriptors"] == {} and "score" not in pockets[2]
+
+
+def test_parse_output_without_pockets(tmp_path):
+    assert fpocket.parse_output(str(tmp_path), "protein") == []
@@ -0,0 +1,67 @@
+import numpy as np
+
+from app.services import grid_pockets
+from app.services.structure_cache import Structure
+
+# Synthetic protein: a 30 A cube of atoms on a 1.5 A lattice with a spherical
+# cavity of radius 7 A carved out around CAVITY_CENTER
+CAVITY_CENTER = np.array([15.0, 15.0, 15.0])
+CAVITY_RADIUS = 7.0
+
+
+def _lattice(edge: float) -> np.ndarray:
+    ax = np.arange(0.0, edge + 1e-6, 1.5)
+    return np.stack(np.meshgrid(ax, ax, ax, indexing="ij"), axis=-1).reshape(-1, 3)
+
+
+def _structure(coords: np.ndarray) -> Structure:
+    """One carbon "residue" per atom, all standard (non-HETATM)."""
+    n = len(coords)
+    return Structure({
+        "coords": coords.astype(np.float32),
+        "atom_residue": np.arange(n, dtype=np.int32),
+        "atom_names": np.full(n, "CA", dtype="<U4"),
+        "elements": np.full(n, "C", dtype="<U2"),
+        "residue_name": np.zeros(n, dtype=np.int32),
+        "residue_chain": np.zeros(n, dtype=np.int32),
+        "residue_seq": np.arange(1, n + 1, dtype=np.int32),
+        "residue_icode": np.full(n, "", dtype="<U1"),
+        "residue_het": np.zeros(n, dtype=bool),
+        "names": np.asarray(["ALA"]),
+        "chains": np.asarray(["A"]),
+    })
+
+
+def _block_with_cavity() -> Structure:
+    coords = _lattice(30.0)
+    return _structure(coords[np.linalg.norm(coords - CAVITY_CENTER, axis=1) > CAVITY_RADIUS])
+
+
+def test_detects_buried_cavity(monkeypatch):
+    structure = _block_with_cavity()
+    monkeypatch.setattr(grid_pockets, "load_structure", lambda _path: structure)
+
+    pockets = grid_pockets.detect_grid_pockets("synthetic.pdb")
+
+    assert len(pockets) == 1
+    pocket = pockets[0]
+    assert pocket["method"] == "grid"
+    assert pocket["rank"] == 1
+    assert np.allclose(pocket["center"], CAVITY_CENTER, atol=0.5)
+    # Voxels further than the protein radius from every atom: a ~4 A sphere
+    assert 40.0 <= pocket["volume"] <= 4.0 / 3.0 * np.pi * CAVITY_RADIUS ** 3
+    assert grid_pockets._MIN_BURIEDNESS <= pocket["buriedness"] <= len(grid_pockets._SCAN_LINES)
+
+
+def test_is_deterministic(monkeypatch):
+    structure = _block_with_cavity()
+    monkeypatch.setattr(grid_pockets, "load_structure", lambda _path: structure)
+
+    assert grid_pockets.detect_grid_pockets("synthetic.pdb") == grid_pockets.detect_grid_pockets("synthetic.pdb")
+
+
+def test_solid_block_has_no_pockets(monkeypatch):
+    solid = _structure(_lattice(15.0))
+    monkeypatch.setattr(grid_pockets, "load_structure", lambda _path: solid)
+
+    assert grid_pockets.detect_grid_pockets("synthetic.pdb") == []
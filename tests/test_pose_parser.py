@@ -0,0 +1,53 @@
+import io
+
+from app.services.pose_parser import best_affinity, iter_pose_models, parse_pose_file
+
+# Two-model Vina output; the second model scores better so "best" is not "first"
+MODEL_1 = (
+    b"MODEL 1\n"
+    b"REMARK VINA RESULT:    -7.1      0.000      0.000\n"
+    b"ATOM      1  C   UNL     1       1.000   2.000   3.000  0.00  0.00    +0.000 C \n"
+    b"ENDMDL\n"
+)
+MODEL_2 = (
+    b"MODEL 2\n"
+    b"REMARK VINA RESULT:    -8.4      1.250      2.500\n"
+    b"ATOM      1  C   UNL     1       4.000   5.000   6.000  0.00  0.00    +0.000 C \n"
+    b"ENDMDL\n"
+)
+
+
+def test_multi_model_byte_spans():
+    data = MODEL_1 + MODEL_2
+    models = list(iter_pose_models(io.BytesIO(data)))
+
+    assert [m.model for m in models] == [1, 2]
+    assert [m.affinity for m in models] == [-7.1, -8.4]
+    assert (models[1].rmsd_lb, models[1].rmsd_ub) == (1.25, 2.5)
+    # Each span covers exactly MODEL..ENDMDL, so it can be sliced out of a pack
+    assert data[models[0].offset:models[0].offset + models[0].length] == MODEL_1
+    assert data[models[1].offset:models[1].offset + models[1].length] == MODEL_2
+    assert best_affinity(models) == -8.4
+
+
+def test_file_without_models_is_one_model(tmp_path):
+    body = b"REMARK VINA RESULT:    -6.0      0.000      0.000\nATOM      1  C   UNL     1  0.0 0.0 0.0\n"
+    path = tmp_path / "single.pdbqt"
+    path.write_bytes(body)
+
+    models = parse_pose_file(str(path))
+
+    assert len(models) == 1
+    assert models[0].affinity == -6.0
+    assert (models[0].offset, models[0].length) == (0, len(body))
+
+
+def test_unterminated_model_is_dropped():
+    models = list(iter_pose_models(io.BytesIO(MODEL_1 + MODEL_2[:-len(b"ENDMDL\n")])))
+
+    assert [m.model for m in models] == [1]
+
+
+def test_best_affinity_without_scores():
+    assert best_affinity(list(iter_pose_models(io.BytesIO(b"MODEL 1\nENDMDL\n")))) is None
+    assert best_affinity([]) is None
@@ -0,0 +1,131 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base import Base
+from app.models.dock_job import DockJob
+from app.models.dock_pose import DockPose
+from app.models.dock_result import DockResult
+from app.models.pose_blob import PoseBlob
+from app.services import pose_store
+
+POSE_A = b"MODEL 1\nREMARK VINA RESULT:    -7.0      0.000      0.000\nENDMDL\n" * 20
+POSE_B = b"MODEL 1\nREMARK VINA RESULT:    -8.0      0.000      0.000\nENDMDL\n" * 20
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Pack-mode store in a temporary directory, indexed in an in-memory database."""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    poses_dir = tmp_path / "poses"
+    poses_dir.mkdir()
+    monkeypatch.setattr(pose_store, "SessionLocal", session)
+    monkeypatch.setattr(pose_store, "POSES_DIR", str(poses_dir))
+    monkeypatch.setattr(pose_store, "PACKS_DIR", str(poses_dir / "packs"))
+    monkeypatch.setattr(pose_store, "store_mode", lambda: "pack")
+    monkeypatch.setattr(pose_store, "_pack_max_bytes", lambda: 1 << 20)
+    monkeypatch.setattr(pose_store, "_COMPACT_QUIET_S", 0)
+    return session, poses_dir
+
+
+def _write(directory, name: str, data: bytes) -> str:
+    path = directory / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def _memo(db, key: str, ref: str) -> None:
+    db.add(DockResult(
+        cache_key=key, receptor_hash="r", ligand="C", center="0,0,0", size="20,20,20",
+        exhaustiveness=8, scoring="vina", seed=42, vina_version="1.2", score=-7.0, pose_path=ref,
+    ))
+
+
+def test_pack_append_and_read(store):
+    _session, poses_dir = store
+    log = _write(poses_dir, "vina_a.log", b"log text")
+
+    ref = pose_store.finalize_pose(_write(poses_dir, "pose_a.pdbqt", POSE_A), log)
+
+    assert ref == "pack://pose_a.pdbqt"
+    # Loose files are handed over to the pack
+    assert not os.path.exists(poses_dir / "pose_a.pdbqt") and not os.path.exists(log)
+    assert pose_store.pose_exists(ref)
+    assert pose_store.read_pose(ref) == POSE_A
+    assert pose_store.read_pose_range(ref, 8, 19) == POSE_A[8:27]
+
+    pose_store.write_derived(ref, "sdf", b"sdf text")
+    assert pose_store.read_derived(ref, "sdf") == b"sdf text"
+    assert pose_store.read_pose("pack://pose_missing.pdbqt") is None
+
+
+def test_reput_supersedes_record(store):
+    session, _poses_dir = store
+
+    pose_store.put_bytes("pose_a.pdbqt", POSE_A)
+    pose_store.put_bytes("pose_a.pdbqt", POSE_B)
+
+    assert pose_store.read_pose("pack://pose_a.pdbqt") == POSE_B
+    db = session()
+    try:
+        assert db.query(PoseBlob).count() == 1
+    finally:
+        db.close()
+
+
+def test_gc_drops_unreferenced_poses_and_compacts(store):
+    session, poses_dir = store
+    kept = pose_store.finalize_pose(_write(poses_dir, "pose_kept.pdbqt", POSE_A))
+    dropped = pose_store.finalize_pose(_write(poses_dir, "pose_dropped.pdbqt", POSE_B))
+    pose_store.write_derived(dropped, "sdf", b"sdf text")
+    _write(poses_dir, "seed_pose_dropped.pdbqt", POSE_B)
+    db = session()
+    try:
+        db.add(DockJob(protein_id=1, molecule_id=1, user_id=1, score=-7.0, pose_path=kept))
+        db.add(DockPose(pose_path=dropped, model=1, affinity=-8.0, offset=0, length=len(POSE_B)))
+        # The docking memo alone does not keep a pose alive
+        _memo(db, "memo-dropped", dropped)
+        _memo(db, "memo-kept", kept)
+        db.commit()
+    finally:
+        db.close()
+    packs_dir = poses_dir / "packs"
+    size_before = sum(os.path.getsize(packs_dir / n) for n in os.listdir(packs_dir) if n.endswith(".pack"))
+
+    preview = pose_store.gc(min_age_s=-60, dry_run=True)
+    assert (preview["poses_removed"], preview["memo_removed"]) == (1, 1)
+    assert pose_store.read_pose(dropped) == POSE_B
+
+    result = pose_store.gc(min_age_s=-60)
+
+    assert result["poses_removed"] == 1
+    assert result["memo_removed"] == 1
+    assert result["files_removed"] == 1
+    assert result["bytes_reclaimed"] > 0
+    assert pose_store.read_pose(dropped) is None
+    assert pose_store.read_derived(dropped, "sdf") is None
+    assert pose_store.read_pose(kept) == POSE_A
+    assert not os.path.exists(poses_dir / "seed_pose_dropped.pdbqt")
+    size_after = sum(os.path.getsize(packs_dir / n) for n in os.listdir(packs_dir) if n.endswith(".pack"))
+    assert size_after < size_before
+    db = session()
+    try:
+        assert [r.cache_key for r in db.query(DockResult)] == ["memo-kept"]
+        assert db.query(DockPose).count() == 0
+    finally:
+        db.close()
+
+
+def test_gc_keeps_young_poses(store):
+    _session, poses_dir = store
+    ref = pose_store.finalize_pose(_write(poses_dir, "pose_fresh.pdbqt", POSE_A))
+
+    result = pose_store.gc(min_age_s=3600)
+
+    assert result["poses_removed"] == 0
+    assert pose_store.read_pose(ref) == POSE_A
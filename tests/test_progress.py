@@ -0,0 +1,112 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.services import progress
+
+
+class _Session:
+    def __init__(self) -> None:
+        self.commits = 0
+
+    def commit(self) -> None:
+        self.commits += 1
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _job(job_id: int = 1):
+    return SimpleNamespace(
+        id=job_id, user_id=1, protein_id=1, status="running", current_step="docking", strategy="dock",
+        progress=0.0, message=None, results=None, created_at=None,
+    )
+
+
+def _reporter(monkeypatch, job):
+    clock = _Clock()
+    monkeypatch.setattr(progress.time, "monotonic", clock)
+    db = _Session()
+    reporter = progress.ProgressReporter(db, job, min_interval_s=1.0)
+    # The first tick always flushes; start the window from it
+    reporter.update(progress=0.01)
+    assert db.commits == 1
+    return reporter, db, clock
+
+
+def test_progress_ticks_are_throttled(monkeypatch):
+    job = _job()
+    reporter, db, clock = _reporter(monkeypatch, job)
+
+    for i in range(2, 10):
+        clock.now += 0.1
+        reporter.update(progress=i / 100)
+    assert db.commits == 1
+    assert job.progress == 0.01
+    assert reporter.state["progress"] == 0.09
+
+    clock.now += 0.5
+    reporter.update(progress=0.1, message="halfway")
+    assert db.commits == 2
+    assert (job.progress, job.message) == (0.1, "halfway")
+
+
+def test_status_and_step_changes_flush_at_once(monkeypatch):
+    job = _job()
+    reporter, db, clock = _reporter(monkeypatch, job)
+
+    clock.now += 0.1
+    reporter.update(progress=0.2)
+    reporter.update(current_step="admet")
+    assert db.commits == 2
+    # Pending throttled fields go out with the immediate write
+    assert (job.current_step, job.progress) == ("admet", 0.2)
+
+    # Re-sending an unchanged status is not a change
+    reporter.update(status="running", progress=0.3)
+    assert db.commits == 2
+
+    reporter.update(status="completed")
+    assert db.commits == 3
+    assert job.status == "completed"
+
+
+def test_flush_writes_pending_ticks(monkeypatch):
+    job = _job()
+    reporter, db, clock = _reporter(monkeypatch, job)
+
+    clock.now += 0.1
+    reporter.update(progress=0.5)
+    reporter.flush()
+    assert db.commits == 2
+    assert job.progress == 0.5
+    # Nothing pending: no empty commit
+    reporter.flush()
+    assert db.commits == 2
+
+
+def test_subscribers_get_every_tick(monkeypatch):
+    job = _job(job_id=42)
+
+    async def _run():
+        snapshot, queue = progress.subscribe(42)
+        assert snapshot is None
+        try:
+            reporter, db, clock = _reporter(monkeypatch, job)
+            clock.now += 0.1
+            reporter.update(progress=0.5)
+            ticks = [await asyncio.wait_for(queue.get(), 1) for _ in range(2)]
+            assert [t["progress"] for t in ticks] == [0.01, 0.5]
+            # Throttled tick reached the subscriber without a write
+            assert db.commits == 1
+            latest, second = progress.subscribe(42)
+            assert latest["progress"] == 0.5
+            progress.unsubscribe(42, second)
+        finally:
+            progress.unsubscribe(42, queue)
+
+    asyncio.run(_run())